@@ -28,4 +28,13 @@ def check_config() -> None:
         raise ValueError("`ENV` must be either 'DEVELOPMENT', 'TESTING' or 'PRODUCTION'")
         
     if config['ENV'] != 'DEVELOPMENT' and 'FRONTEND_URL' not in config:
-        raise ValueError("FRONTEND_URL is required")
\ No newline at end of file
+        raise ValueError("FRONTEND_URL is required")
+
+    if (config.get('CERTIFICATE_STORAGE') or 'local').lower() not in ['local', 's3']:
+        raise ValueError("`CERTIFICATE_STORAGE` must be either 'local' or 's3'")
+
+    if (config.get('CERTIFICATE_STORAGE') or 'local').lower() == 's3' and not config.get('S3_BUCKET'):
+        raise ValueError("S3_BUCKET is required when CERTIFICATE_STORAGE is 's3'")
+
+    if (config.get('CERTIFICATE_DOWNLOAD_OFFLOAD') or 'none').lower() not in ['none', 'x-accel-redirect', 'x-sendfile']:
+        raise ValueError("`CERTIFICATE_DOWNLOAD_OFFLOAD` must be either 'none', 'x-accel-redirect' or 'x-sendfile'")
\ No newline at end of file
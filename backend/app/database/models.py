@@ -5,7 +5,7 @@ from datetime import datetime
 from typing import List, Optional
 
 from cuid import cuid
-from sqlalchemy import Column, String, Enum, ForeignKey, Integer, Text, Boolean, DateTime, PrimaryKeyConstraint, UniqueConstraint
+from sqlalchemy import Column, String, Enum, ForeignKey, Integer, Float, Text, Boolean, DateTime, PrimaryKeyConstraint, UniqueConstraint, Index
 from sqlalchemy.orm import relationship, Mapped
 from sqlalchemy.sql.expression import text
 
@@ -121,6 +121,7 @@ class Request(Base):
     student_subject_enrollment: Mapped["StudentSubjectEnrollment"] = relationship("StudentSubjectEnrollment", back_populates="request")
 
     certificate: Mapped[Optional["Certificate"]] = relationship("Certificate", uselist=False, back_populates="request", cascade="all, delete")
+    verification_jobs: Mapped[List["VerificationJob"]] = relationship("VerificationJob", back_populates="request", cascade="all, delete")
 
 
 class Certificate(Base):
@@ -130,6 +131,8 @@ class Certificate(Base):
     request_id = Column(String, ForeignKey("requests.id"), nullable=False, unique=True)
     student_id = Column(String, ForeignKey("users.id"), nullable=False)                             # Deprecated
     file_url = Column(Text, nullable=False)
+    # SHA-256 of the uploaded file, identical uploads reuse earlier extractions
+    file_hash = Column(String(64), nullable=True, index=True)
     verification_file_url = Column(Text, nullable=True)
     verified_total_marks = Column(Integer, nullable=True)
     uploaded_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'))
@@ -139,6 +142,127 @@ class Certificate(Base):
 
     request: Mapped["Request"] = relationship("Request", back_populates="certificate")
     student: Mapped["User"] = relationship("User", back_populates="certificates")                   # Deprecated
+    extraction: Mapped[Optional["CertificateExtraction"]] = relationship(
+        "CertificateExtraction", uselist=False, back_populates="certificate", cascade="all, delete"
+    )
+
+
+class CertificateExtraction(Base):
+    """Fields parsed from the uploaded and the official (NPTEL) certificate during verification."""
+    __tablename__ = "certificate_extractions"
+
+    id = Column(String, primary_key=True, default=cuid)
+    certificate_id = Column(String, ForeignKey("certificates.id"), nullable=False, unique=True)
+    extractor_version = Column(Integer, nullable=False)
+    is_subject_name_long = Column(Boolean, nullable=False)
+    qr_url = Column(Text, nullable=True)
+    verification_file_url = Column(Text, nullable=True)
+
+    uploaded_course_name = Column(String, nullable=True)
+    uploaded_student_name = Column(String, nullable=True)
+    uploaded_total_marks = Column(String, nullable=True)
+    uploaded_roll_no = Column(String, nullable=True)
+    uploaded_course_period = Column(String, nullable=True)
+
+    verification_course_name = Column(String, nullable=True)
+    verification_student_name = Column(String, nullable=True)
+    verification_total_marks = Column(String, nullable=True)
+    verification_roll_no = Column(String, nullable=True)
+    verification_course_period = Column(String, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'))
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'), onupdate=datetime.utcnow)
+
+    certificate: Mapped["Certificate"] = relationship("Certificate", back_populates="extraction")
+
+class VerificationJobStatus(enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    dead = "dead"
+
+
+class VerificationJob(Base):
+    __tablename__ = "verification_jobs"
+
+    id = Column(String, primary_key=True, default=cuid)
+    request_id = Column(String, ForeignKey("requests.id"), nullable=False, index=True)
+    batch_id = Column(String, ForeignKey("verification_batches.id"), nullable=True, index=True)
+    status = Column(Enum(VerificationJobStatus), nullable=False, default=VerificationJobStatus.queued)
+    # higher runs first, bulk re-verification stays behind fresh uploads
+    priority = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow, server_default=text('now()'))
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'))
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'), onupdate=datetime.utcnow)
+
+    request: Mapped["Request"] = relationship("Request", back_populates="verification_jobs")
+    batch: Mapped[Optional["VerificationBatch"]] = relationship("VerificationBatch", back_populates="jobs")
+
+    __table_args__ = (
+        Index('ix_verification_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+
+class VerificationBatch(Base):
+    """A bulk re-verification of the requests of a subject allotment or of a whole semester."""
+    __tablename__ = "verification_batches"
+
+    id = Column(String, primary_key=True, default=cuid)
+    requested_by = Column(String, ForeignKey("users.id"), nullable=True)
+    teacher_subject_allotment_id = Column(String, ForeignKey("teacher_subject_allotments.id"), nullable=True)
+    year = Column(Integer, nullable=False)
+    is_sem_odd = Column(Boolean, nullable=False)
+    # comma separated request statuses that were selected for re-verification
+    statuses = Column(String, nullable=False)
+    total = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'))
+
+    jobs: Mapped[List["VerificationJob"]] = relationship("VerificationJob", back_populates="batch")
+
+
+class RateLimitBucket(Base):
+    """Token bucket shared by every process that calls an external service."""
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class CircuitBreakerState(Base):
+    """Consecutive failures of an external service, the breaker is open until `open_until`."""
+    __tablename__ = "circuit_breakers"
+
+    name = Column(String, primary_key=True)
+    failures = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    open_until = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class RefreshToken(Base):
+    """
+    A refresh token, stored as the SHA-256 of the token. Each use replaces it with a
+    new one of the same family (one family per login), reusing a replaced token
+    after a short grace window revokes the whole family.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(String, primary_key=True, default=cuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    family_id = Column(String, nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=text('now()'))
+
+    user: Mapped["User"] = relationship("User")
+
 
 class Module(Base):
     __tablename__ = "modules"
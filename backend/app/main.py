@@ -9,30 +9,54 @@ from typing import AsyncGenerator
 
 from app.config import check_config, config
 from app.database.core import AsyncSessionLocal
+from app.middleware.auth import AccessTokenMiddleware
+from app.middleware.body_limit import BodyLimitMiddleware
 from app.nptel.api import router
 from app.services.cleanup import CleanupService
+from app.services.executor import hashing_executor, verification_executor
+from app.services.password_executor import password_executor
+from app.services.utils.http_client import nptel_http_client
+from app.services.utils.storage_io import storage_io
+from app.services.utils.limiter import MAX_FILE_SIZE
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# the cleanup was disabled before the lifespan was wired in for the worker pools, it stays opt-in
+PERIODIC_CLEANUP = (config.get('PERIODIC_CLEANUP') or 'false').lower() == 'true'
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     logger.info("Starting up FastAPI application")
 
     cleanup_service = CleanupService(AsyncSessionLocal)
-    cleanup_service.start_periodic_cleanup()
+    if PERIODIC_CLEANUP:
+        cleanup_service.start_periodic_cleanup()
+
+    verification_executor.start()
+    hashing_executor.start()
+    storage_io.start()
+    password_executor.start()
+    nptel_http_client.start()
 
     yield
 
     logger.info("Shutting down FastAPI application")
-    cleanup_service.stop_periodic_cleanup()
-    await cleanup_service.execute_cleanup()
+    await nptel_http_client.aclose()
+    verification_executor.shutdown()
+    hashing_executor.shutdown()
+    storage_io.shutdown()
+    password_executor.shutdown()
+
+    if PERIODIC_CLEANUP:
+        cleanup_service.stop_periodic_cleanup()
+        await cleanup_service.execute_cleanup()
 
 app = FastAPI(
     title="NPTEL Automation API",
     version="1.0.0",
-    # lifespan=lifespan
+    lifespan=lifespan
 )
 
 check_config()
@@ -44,6 +68,20 @@ origins = (
     if config['ENV'] == 'DEVELOPMENT' else [config['FRONTEND_URL']]
 )
 
+# room for the multipart boundaries and part headers around the PDF
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+MAX_UPLOAD_BODY_SIZE = int(config.get('MAX_UPLOAD_BODY_SIZE') or MAX_FILE_SIZE + MULTIPART_OVERHEAD_BYTES)
+
+app.add_middleware(AccessTokenMiddleware)
+
+app.add_middleware(
+    BodyLimitMiddleware,
+    limits={
+        '/api/nptel/student/certificate/upload': MAX_UPLOAD_BODY_SIZE,
+        '/api/nptel/teacher/verify/certificate/manual': MAX_UPLOAD_BODY_SIZE,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
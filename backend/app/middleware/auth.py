@@ -0,0 +1,34 @@
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.oauth2 import authenticate_access_token
+
+
+class AccessTokenMiddleware:
+    """
+    Verify the `access_token` cookie once per request.
+
+    The claims (or the error a protected route answers with) are put on
+    `request.state.token_data` / `request.state.auth_error`, the auth dependencies
+    (`get_current_teacher`, `role_based_access`, ...) only look them up there, so a
+    route with several of them doesn't decode the token again for each. Verified
+    tokens are cached, see `app.oauth2.access_token_cache`.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            token = None
+            for name, value in scope["headers"]:
+                if name == b"cookie":
+                    token = cookie_parser(value.decode("latin-1")).get("access_token")
+                    break
+
+            token_data, error = authenticate_access_token(token)
+            state = scope.setdefault("state", {})
+            state["token_data"] = token_data
+            state["auth_error"] = error
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,89 @@
+from typing import Dict
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class RequestBodyTooLarge(HTTPException):
+    def __init__(self, limit: int):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Request body too large. Maximum size is {limit / 1024 / 1024:.2f} MB.",
+        )
+
+
+class BodyLimitMiddleware:
+    """
+    Enforce a request body budget on selected routes before the body is parsed.
+
+    Requests whose `Content-Length` is over the budget are refused without reading
+    the body. Otherwise the body is counted as it is received, and the request is
+    refused as soon as the budget is exceeded, so an oversized multipart upload is
+    never spooled to disk. `limits` maps request paths to their budget in bytes.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits.get(scope["path"].rstrip("/"))
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if not value.isdigit() or int(value) > limit:
+                    await self.reject(scope, receive, send, limit)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # raised from inside body parsing, FastAPI turns it into the 413 response
+                    raise RequestBodyTooLarge(limit)
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestBodyTooLarge:
+            # the body was read outside of FastAPI's request handling
+            if response_started:
+                raise
+            await self.reject(scope, receive, send, limit)
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send, limit: int) -> None:
+        metrics.increment("http.body_limit.rejected")
+        logger.warning(f"Refused a request body over {limit} bytes on {scope['path']}")
+
+        error = RequestBodyTooLarge(limit)
+        response = JSONResponse(
+            {"detail": error.detail},
+            status_code=error.status_code,
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,173 @@
+"""
+Move certificates from the flat `{request_id}.pdf` layout into the blob store.
+
+    python -m app.migrate_storage --dry-run
+    python -m app.migrate_storage
+    python -m app.migrate_storage --prune --min-age-hours 24
+
+Each certificate's file is hashed, the hash is recorded on `Certificate.file_hash`
+and the file is then moved to its blob (or removed, when an identical blob is
+already stored). The API keeps serving unmigrated files from the old location,
+so this can run while the application is up and can be interrupted and resumed.
+
+`--prune` removes blobs no certificate refers to any more (left behind when a
+certificate is re-uploaded) and staging files abandoned by crashed processes.
+
+This works on `CERTIFICATES_FOLDER_PATH`. To switch to `CERTIFICATE_STORAGE=s3`
+afterwards, copy the `blobs` folder to the bucket prefix as is, e.g. with
+`aws s3 sync`.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import List, Optional, Set, Tuple
+
+from app.config import check_config
+from app.database.core import SessionLocal
+from app.database.models import Certificate
+from app.services.utils.file_storage import (
+    BLOBS_FOLDER_PATH,
+    CERTIFICATES_FOLDER_PATH,
+    STAGING_FILE_PREFIX,
+    blob_path,
+    commit_blob,
+    hash_file,
+    legacy_file_path,
+)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.migrate_storage", description="Move certificates into the content-addressed blob store"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="certificates hashed per database commit")
+    parser.add_argument("--dry-run", action="store_true", help="only count the files that would be moved")
+    parser.add_argument("--prune", action="store_true", help="remove unreferenced blobs and abandoned staging files")
+    parser.add_argument(
+        "--min-age-hours",
+        type=float,
+        default=24,
+        help="only prune files older than this, uploads in flight are not referenced yet (default: 24)",
+    )
+    return parser.parse_args(argv)
+
+
+def migrate_batch(rows: List[Tuple[str, str, Optional[str]]], dry_run: bool) -> Tuple[int, int, int]:
+    """Returns the number of (moved, deduplicated, missing) files in the batch."""
+    moves: List[Tuple[str, str]] = []
+    hashes = {}
+    missing = 0
+
+    for certificate_id, file_url, file_hash in rows:
+        path = legacy_file_path(file_url)
+        if not os.path.exists(path):
+            if not file_hash or not os.path.exists(blob_path(file_hash)):
+                print(f"Missing file for certificate {certificate_id} ({file_url})", file=sys.stderr)
+                missing += 1
+            continue
+
+        digest = hash_file(path)
+        moves.append((path, digest))
+        if digest != file_hash:
+            hashes[certificate_id] = digest
+
+    if dry_run:
+        return len(moves), 0, missing
+
+    # record the hashes first, until the file is moved the old location is still served
+    if hashes:
+        with SessionLocal() as db:
+            for certificate_id, digest in hashes.items():
+                db.query(Certificate).filter(Certificate.id == certificate_id).update(
+                    {Certificate.file_hash: digest}, synchronize_session=False
+                )
+            db.commit()
+
+    moved = deduplicated = 0
+    for path, digest in moves:
+        if commit_blob(path, digest):
+            moved += 1
+        else:
+            deduplicated += 1
+
+    return moved, deduplicated, missing
+
+
+def migrate(batch_size: int, dry_run: bool) -> None:
+    total_moved = total_deduplicated = total_missing = 0
+    last_id = ""
+
+    while True:
+        with SessionLocal() as db:
+            rows = [
+                (row.id, row.file_url, row.file_hash)
+                for row in db.query(Certificate.id, Certificate.file_url, Certificate.file_hash)
+                .filter(Certificate.id > last_id)
+                .order_by(Certificate.id)
+                .limit(batch_size)
+            ]
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        moved, deduplicated, missing = migrate_batch(rows, dry_run)
+        total_moved += moved
+        total_deduplicated += deduplicated
+        total_missing += missing
+        print(f"{last_id}: moved={total_moved} deduplicated={total_deduplicated} missing={total_missing}", flush=True)
+
+    if dry_run:
+        print(f"{total_moved} files would be moved into the blob store, {total_missing} are missing")
+    else:
+        print(
+            f"Moved {total_moved} files into the blob store, {total_deduplicated} were duplicates, "
+            f"{total_missing} are missing"
+        )
+
+
+def prune(min_age_hours: float, dry_run: bool) -> None:
+    with SessionLocal() as db:
+        referenced: Set[str] = {
+            file_hash for (file_hash,) in db.query(Certificate.file_hash).filter(Certificate.file_hash.isnot(None))
+        }
+
+    cutoff = time.time() - min_age_hours * 3600
+    candidates = []
+
+    for directory, _, names in os.walk(BLOBS_FOLDER_PATH):
+        for name in names:
+            if name.removesuffix(".pdf") not in referenced:
+                candidates.append(os.path.join(directory, name))
+
+    for name in os.listdir(CERTIFICATES_FOLDER_PATH):
+        if name.startswith(STAGING_FILE_PREFIX):
+            candidates.append(os.path.join(CERTIFICATES_FOLDER_PATH, name))
+
+    removed = 0
+    for path in candidates:
+        try:
+            if os.stat(path).st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    print(f"{'Would remove' if dry_run else 'Removed'} {removed} unreferenced files")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    check_config()
+
+    migrate(args.batch_size, args.dry_run)
+    if args.prune:
+        prune(args.min_age_hours, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
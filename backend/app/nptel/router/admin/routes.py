@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from app.database.core import get_db
+from app.database.core import SessionLocal, get_db
 from app.database.models import Role, UserRole, User, Subject, StudentSubjectEnrollment, TeacherSubjectAllotment, UserRoleMapping
 from app.oauth2 import get_current_admin
 from .schemas import (
@@ -22,15 +24,18 @@ from .schemas import (
 
 )
 from app.schemas import TokenData, GenericResponse
+from app.services.bulk_hashing import hash_passwords, iter_password_hashes
+from app.services.database.user import invalidate_service_roles
 from app.services.utils.hashing import generate_password_hash
 from app.services.log_service import setup_logger
+from app.services.metrics import metrics
 
-import multiprocessing
+import json
 
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
-from typing import List
+from typing import AsyncIterator, Dict, List, cast
 
 logger = setup_logger(__name__)
 
@@ -181,22 +186,13 @@ def get_subjects_of_a_student(
         ]
     }
 
-@router.post('/create/students', response_model=CreateUserResponse)
-def create_students(
-    students: List[StudentCreate], 
-    current_admin: TokenData = Depends(get_current_admin), 
-    db: Session = Depends(get_db)
-):
+def create_student_users(db: Session, students: List[StudentCreate], password_hashes: List[str]) -> List[Dict]:
     results = []
     db_students = []
-    
-    # TODO: Find a faster approach
-    # Generate password hashes in parallel
-    with multiprocessing.Pool() as pool:
-        student_password_hashes = pool.map(generate_password_hash, [student.password for student in students]) 
+
     try:
         for i, student in enumerate(students):
-            student_password_hash = student_password_hashes[i]
+            student_password_hash = password_hashes[i]
             db_students.append(
                 User(
                     name=student.name,
@@ -211,12 +207,10 @@ def create_students(
         db.commit()
         
         # All succeeded
-        return {
-            'results': [
-                {"email": student.email, "success": True, "message": "Student created"} 
-                for student in students
-            ]
-        }
+        return [
+            {"email": student.email, "success": True, "message": "Student created"} 
+            for student in students
+        ]
                 
     except Exception as batch_error:
         db.rollback()
@@ -225,7 +219,7 @@ def create_students(
         # If batch fails, try individual processing to identify problematic records
         for i, student in enumerate(students):
             try:
-                student_password_hash = student_password_hashes[i]
+                student_password_hash = password_hashes[i]
                 db_student = User(
                     name=student.name,
                     email=student.email,
@@ -251,21 +245,59 @@ def create_students(
                     "message": "Server error",
                 })
         
-        return {
-            'results': results
-        }
+        return results
 
-@router.post('/create/teachers', response_model=CreateTeacherResponse)
-def create_coordinator(
-    teacher_data_list: List[TeacherCreate],  
+
+def create_student_users_in_session(students: List[StudentCreate], password_hashes: List[str]) -> List[Dict]:
+    with SessionLocal() as db:
+        return create_student_users(db, students, password_hashes)
+
+
+@router.post('/create/students', response_model=CreateUserResponse)
+async def create_students(
+    students: List[StudentCreate], 
     current_admin: TokenData = Depends(get_current_admin), 
     db: Session = Depends(get_db)
 ):
+    # Generate password hashes in parallel on the hashing process pool
+    student_password_hashes = await hash_passwords([student.password for student in students])
+
+    results = await run_in_threadpool(create_student_users, db, students, student_password_hashes)
+    return {
+        'results': results
+    }
+
+
+@router.post('/create/students/stream')
+async def create_students_with_progress(
+    students: List[StudentCreate], 
+    current_admin: TokenData = Depends(get_current_admin),
+):
+    """
+    Same as `/create/students`, for large batches. The response is newline delimited
+    JSON: `{"hashed": n, "total": N}` as the passwords are hashed, then `{"results": [...]}`.
+    """
+    async def progress() -> AsyncIterator[bytes]:
+        password_hashes: List[str] = [""] * len(students)
+        hashed = 0
+
+        async for offset, chunk_hashes in iter_password_hashes([student.password for student in students]):
+            password_hashes[offset:offset + len(chunk_hashes)] = chunk_hashes
+            hashed += len(chunk_hashes)
+            yield (json.dumps({'hashed': hashed, 'total': len(students)}) + "\n").encode()
+
+        # the request's session is closed once the response has started, the insert gets its own
+        results = await run_in_threadpool(create_student_users_in_session, students, password_hashes)
+        yield (json.dumps({'results': results}) + "\n").encode()
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
+def create_teacher_users(db: Session, teacher_data_list: List[TeacherCreate], password_hashes: List[str]) -> List[Dict]:
     results = []
     
-    for teacher_data in teacher_data_list:
+    for teacher_data, teacher_password_hash in zip(teacher_data_list, password_hashes):
         try:
-            teacher_password_hash = generate_password_hash(teacher_data.password)
             db_teacher = User(
                 name=teacher_data.name,
                 email=teacher_data.email,
@@ -292,6 +324,18 @@ def create_coordinator(
                 "message": "Failed to create teacher"
             })
     
+    return results
+
+
+@router.post('/create/teachers', response_model=CreateTeacherResponse)
+async def create_coordinator(
+    teacher_data_list: List[TeacherCreate],  
+    current_admin: TokenData = Depends(get_current_admin), 
+    db: Session = Depends(get_db)
+):
+    teacher_password_hashes = await hash_passwords([teacher_data.password for teacher_data in teacher_data_list])
+
+    results = await run_in_threadpool(create_teacher_users, db, teacher_data_list, teacher_password_hashes)
     return {
         'results': results
     }
@@ -738,6 +782,7 @@ def modify_user_role(
         user.role = UserRole(requested_role_value)
         db.add(user)
         db.commit()
+        invalidate_service_roles(cast(str, user.id))
         return {
             "email": user.email,
             "old_role": old_role,
@@ -806,6 +851,7 @@ def modify_coordinator(
             mapping = UserRoleMapping(user_id=user.id, role_id=role.id)
             db.add(mapping)
             db.commit()
+            invalidate_service_roles(cast(str, user.id))
             return {
                 "email": user.email,
                 "module_name": role.module_name,
@@ -828,6 +874,7 @@ def modify_coordinator(
 
         db.delete(existing_mapping)
         db.commit()
+        invalidate_service_roles(cast(str, user.id))
         return {
             "email": user.email,
             "module_name": role.module_name,
@@ -840,4 +887,14 @@ def modify_coordinator(
     except Exception as e:
         logger.error(f"Error modifying coordinator role for {payload.email}: {e}")
         db.rollback()
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to modify coordinator role")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to modify coordinator role")
+
+
+@router.get('/metrics')
+def get_metrics(
+    current_admin: TokenData = Depends(get_current_admin),
+):
+    """
+    In-process metrics of the API worker that served this request.
+    """
+    return metrics.snapshot()
@@ -1,19 +1,31 @@
-from fastapi import APIRouter, Depends, Body, UploadFile, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Body, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import and_
-from typing import List, cast
-import os
+from typing import Dict, List, cast
 
-from app.config import config
 from app.database.core import get_db
-from app.database.models import RequestStatus, StudentSubjectEnrollment, Request, Certificate, TeacherSubjectAllotment
+from app.database.models import RequestStatus, StudentSubjectEnrollment, Request, Certificate, TeacherSubjectAllotment, VerificationJob, VerificationJobStatus
 from app.schemas import TokenData, GenericResponse
 from app.services.verifier import Verifier
+from app.services.job_queue import (
+    VERIFICATION_JOB_LEASE_SECONDS,
+    complete_verification_job,
+    enqueue_verification_job,
+    release_verification_job,
+)
 from app.services.utils.limiter import process_upload
-from app.services.utils.file_storage import save_file_to_local_storage
+from app.services.certificate_storage import certificate_storage
+from app.services.utils.file_storage import StagedUpload, certificate_file_name
 from app.services.log_service import setup_logger
 
-from .schemas import CertificateRequestResponse, StudentSubjectsResponse, CertificateResponse
+from .schemas import (
+    CertificateRequestResponse, 
+    StudentSubjectsResponse, 
+    CertificateResponse, 
+    CertificateUploadResponse, 
+    VerificationJobResponse
+)
 
 from app.oauth2 import get_current_student
 
@@ -21,8 +33,6 @@ logger = setup_logger(__name__)
 
 router = APIRouter(prefix="/student")
 
-CERTIFICATES_FOLDER_PATH = config['CERTIFICATES_FOLDER_PATH']
-
 @router.post('/requests', response_model=CertificateRequestResponse)
 def get_certificate_requests(
     request_types: List[RequestStatus] = Body(embed=True),
@@ -147,18 +157,12 @@ def get_certificate(
         'updated_at': db_certificate.updated_at,
     }
 
-@router.post('/certificate/upload', response_model=GenericResponse)
-async def upload_certificate(
-    request_id: str,
-    file: UploadFile = Depends(process_upload),
-    db: Session = Depends(get_db),
-    current_student: TokenData = Depends(get_current_student),
-):
+def check_request_accepts_upload(db: Session, request_id: str, student_id: str) -> None:
     # check if the request_id belongs to the current student
     db_request = db.query(Request).filter(
         Request.id == request_id,
         Request.student_subject_enrollment.has(
-            StudentSubjectEnrollment.student_id == current_student.user_id
+            StudentSubjectEnrollment.student_id == student_id
         )
     ).first()
 
@@ -180,28 +184,94 @@ async def upload_certificate(
             detail="Request already in processing"
         )
 
-    os.makedirs(CERTIFICATES_FOLDER_PATH, exist_ok=True)
 
-    relative_file_path = f"{request_id}.pdf"
-    file_path = f"{CERTIFICATES_FOLDER_PATH}/{relative_file_path}"
+def queue_verification(db: Session, verifier: Verifier) -> Dict[str, str]:
+    """Record the upload and queue its verification, or decide it right away from an identical earlier upload."""
+    # the verification itself runs in a worker process (`python -m app.worker`), the job is
+    # held back until we know that there is no identical earlier upload to decide from
+    job = enqueue_verification_job(db, verifier.request_id, delay_seconds=VERIFICATION_JOB_LEASE_SECONDS)
 
-    await save_file_to_local_storage(
-        file,
-        file_path
-    )
+    # set the request status to processing, this commits the queued job as well
+    db_request, db_certificate = verifier.prepare_verification()
+
+    try:
+        memoized = verifier.run_memoized_verification(db_request, db_certificate)
+    except HTTPException as e:
+        # rejected or under review, the decision is recorded on the request
+        complete_verification_job(db, job)
+        outcome = 'sent for review' if db_request.status == RequestStatus.under_review else 'rejected'
+        return {'message': f'Certificate uploaded and {outcome}: {e.detail}', 'job_id': cast(str, job.id)}
+    except Exception:
+        # leave it to the worker right away rather than after the job's delay
+        db.rollback()
+        release_verification_job(db, job)
+        raise
+
+    if memoized:
+        complete_verification_job(db, job)
+        return {'message': 'Certificate uploaded successfully, verified against an identical earlier upload', 'job_id': cast(str, job.id)}
+
+    release_verification_job(db, job)
+
+    return {'message': 'Certificate uploaded successfully, verification queued', 'job_id': cast(str, job.id)}
+
+
+@router.post('/certificate/upload', response_model=CertificateUploadResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_certificate(
+    request_id: str,
+    file: StagedUpload = Depends(process_upload),
+    db: Session = Depends(get_db),
+    current_student: TokenData = Depends(get_current_student),
+):
+    # async for the streamed upload and the storage I/O, the database work runs in the threadpool
+    await run_in_threadpool(check_request_accepts_upload, db, request_id, current_student.user_id)
+
+    key = await certificate_storage.store(file)
 
-    # set the request status to processing
     verifier = Verifier(
-        uploaded_file_path_relative=relative_file_path,
-        uploaded_file_path=file_path,
+        uploaded_file_path_relative=certificate_file_name(request_id),
+        # not read here, the verification worker fetches the file from the storage
+        uploaded_file_path=key,
         request_id=request_id,
         student_id=current_student.user_id,
-        db=db
+        db=db,
+        file_hash=file.sha256,
     )
 
-    await verifier.start_verification()
+    return await run_in_threadpool(queue_verification, db, verifier)
 
-    return {'message': 'Certificate uploaded successfully'}
+@router.get('/certificate/upload/{job_id}', response_model=VerificationJobResponse)
+def get_verification_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_student: TokenData = Depends(get_current_student),
+):
+    db_job = db.query(VerificationJob).filter(
+        VerificationJob.id == job_id,
+        VerificationJob.request.has(
+            Request.student_subject_enrollment.has(
+                StudentSubjectEnrollment.student_id == current_student.user_id
+            )
+        )
+    ).first()
+
+    if not db_job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Verification job not found or does not belong to the current student"
+        )
+
+    return {
+        'job_id': db_job.id,
+        'request_id': db_job.request_id,
+        'status': cast(VerificationJobStatus, db_job.status).value,
+        'attempts': db_job.attempts,
+        'max_attempts': db_job.max_attempts,
+        'request_status': cast(RequestStatus, db_job.request.status).value,
+        'remark': db_job.request.certificate.remark if db_job.request.certificate else None,
+        'created_at': db_job.created_at,
+        'updated_at': db_job.updated_at,
+    }
 
 @router.put('/update/request-status/no-certificate', response_model=GenericResponse)
 def upload_reqeust_status_to_no_certificate(
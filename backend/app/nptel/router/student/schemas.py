@@ -49,4 +49,19 @@ class CertificateResponse(BaseModel):
     updated_at: datetime
 
 class StudentSubjectsResponse(BaseModel):
-    subjects: List[Subject]
\ No newline at end of file
+    subjects: List[Subject]
+
+class CertificateUploadResponse(BaseModel):
+    message: str
+    job_id: str
+
+class VerificationJobResponse(BaseModel):
+    job_id: str
+    request_id: str
+    status: str
+    attempts: int
+    max_attempts: int
+    request_status: str
+    remark: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi.responses import StreamingResponse
 
 from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from typing import List, cast
+from typing import List, Optional, cast
 
 from app.config import config
 from app.database.core import get_db, get_async_db
@@ -21,18 +22,30 @@ from .schemas import (
     MakeCertificateRequestResponse, 
     CertificateResponse,
     UnsafeManualVerificationRequest,
-    UpdateDueDateRequest
+    UpdateDueDateRequest,
+    ReverifyRequest,
+    ReverifyResponse,
+    ReverificationProgressResponse,
 )
-from app.database.models import User, StudentSubjectEnrollment, Request, RequestStatus, Certificate, TeacherSubjectAllotment
+from app.database.models import User, StudentSubjectEnrollment, Request, RequestStatus, Certificate, Subject, TeacherSubjectAllotment, VerificationBatch
 from app.services.log_service import setup_logger
 
 from app.services.utils.limiter import process_upload
-from app.services.utils.file_storage import save_file_to_local_storage
-from app.services.utils.extractor import extract_student_info_from_pdf
-from app.services.utils.qr_extraction import extract_link
-from app.services.verifier import Verifier, COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT
-
-from .service import get_teacher_alloted_subjects, get_student_requests_for_subject, get_students_of_a_subject_allotment
+from app.services.certificate_export import stream_certificates_zip
+from app.services.certificate_storage import certificate_storage
+from app.services.utils.file_storage import StagedUpload, certificate_file_name
+from app.services.utils.scanner import scan_certificate, read_verification_link
+from app.services.executor import verification_executor
+from app.services.reverification import create_reverification_batch, get_batch_progress
+from app.services.verifier import Verifier, COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT, build_certificate_data
+from app.services.utils.extractor import EXTRACTOR_VERSION
+
+from .service import (
+    get_teacher_alloted_subjects,
+    get_student_requests_for_subject,
+    get_students_of_a_subject_allotment,
+    get_certificate_export_rows,
+)
 from ...oauth2 import role_based_access
 
 logger = setup_logger(__name__)
@@ -43,9 +56,9 @@ CERTIFICATES_FOLDER_PATH = config['CERTIFICATES_FOLDER_PATH']
 logger.info(f"Certificates folder path: {CERTIFICATES_FOLDER_PATH}")
 
 
-def check_coordinator(current_teacher: TokenData = Depends(get_current_teacher)):
+async def check_coordinator(current_teacher: TokenData = Depends(get_current_teacher)) -> bool:
     service_role_dict = current_teacher.service_role_dict
-    return 'nptel' in service_role_dict and 'coordinator' 
+    return 'coordinator' in service_role_dict.get('nptel', [])
     
 @router.get('/subjects', response_model=SubjectResponse)
 def get_alloted_subjects(
@@ -176,6 +189,35 @@ def get_all_requests_by_status(
         raise e
     
 
+@router.get('/subject/{subject_id}/certificates.zip')
+def export_subject_certificates(
+    subject_id: str,
+    year: int = Query(),
+    sem: int = Query(),
+    db: Session = Depends(get_db),
+    current_teacher: TokenData = Depends(get_current_teacher),
+    is_coordinator: bool = Depends(check_coordinator)
+):
+    """Stream a ZIP of the uploaded certificates of a subject, with a CSV manifest of marks and statuses."""
+    is_sem_odd = bool(sem & 1)
+
+    rows = get_certificate_export_rows(
+        db, current_teacher.user_id, subject_id, year, is_sem_odd, is_coordinator
+    )
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No requests found for this subject")
+
+    subject = db.query(Subject).filter(Subject.id == subject_id).first()
+    subject_code = subject.subject_code if subject else subject_id
+    file_name = f"{subject_code}_{year}_{'odd' if is_sem_odd else 'even'}_certificates.zip"
+
+    return StreamingResponse(
+        stream_certificates_zip(rows),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+
 @router.get('/students/{subject_id}', response_model=EnrolledStudentResponse)
 def get_students_enrolled_in_a_subject(
     subject_id: str,
@@ -256,26 +298,39 @@ async def get_verified_certificate_details(
     if db_request is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Request not found")
 
-    db_certificate = db.query(Certificate).filter(
+    db_certificate = db.query(Certificate).options(
+        joinedload(Certificate.extraction)
+    ).filter(
         Certificate.request_id == request_id,
     ).first()
 
     if db_certificate is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Verified certificate not found")
 
-    uploaded_file_path = f"{CERTIFICATES_FOLDER_PATH}/{db_certificate.file_url}"
-    
-    verifier = Verifier(
-        cast(str, db_certificate.file_url), 
-        uploaded_file_path, 
-        request_id, 
-        cast(str,db_request.student_subject_enrollment.student_id), 
-        db,
-    )
+    extraction = db_certificate.extraction
 
-    certificate_data = await verifier.manual_verification(
-        cast(str, db_request.student_subject_enrollment.teacher_subject_allotment.subject.name)
-    )
+    if extraction is not None and extraction.extractor_version == EXTRACTOR_VERSION and extraction.qr_url:
+        certificate_data = build_certificate_data(extraction, cast(str, db_certificate.file_url))
+    else:
+        # certificates verified before extractions were stored, or by an older extractor
+        stored = await certificate_storage.resolve(
+            cast(str, db_certificate.file_url), cast(Optional[str], db_certificate.file_hash)
+        )
+        if stored is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Uploaded certificate file not found")
+
+        async with certificate_storage.local_copy(stored.key) as uploaded_file_path:
+            verifier = Verifier(
+                cast(str, db_certificate.file_url), 
+                uploaded_file_path, 
+                request_id, 
+                cast(str,db_request.student_subject_enrollment.student_id), 
+                db,
+            )
+
+            certificate_data = await verifier.manual_verification(
+                cast(str, db_request.student_subject_enrollment.teacher_subject_allotment.subject.name)
+            )
 
     response =  {
         "message": "Certificate details fetched successfully",
@@ -545,6 +600,63 @@ def update_due_date_for_subject_requests(
     return {"message": f"Due date updated for {count} requests for this subject"}
        
 
+@router.post('/reverify', response_model=ReverifyResponse, status_code=status.HTTP_202_ACCEPTED)
+def reverify_certificates(
+    req: ReverifyRequest = Body(...),
+    year: int = Query(...),
+    sem: int = Query(...),
+    db: Session = Depends(get_db),
+    current_coordinator: TokenData = Depends(role_based_access(['coordinator'])),
+):
+    """Queue the certificates of a subject, or of the whole semester, for verification again."""
+    is_sem_odd = bool(sem & 1)
+    allotment_id = None
+
+    if req.subject_id:
+        allotment = db.query(TeacherSubjectAllotment).filter(
+            TeacherSubjectAllotment.subject_id == req.subject_id,
+            TeacherSubjectAllotment.year == year,
+            TeacherSubjectAllotment.is_sem_odd == is_sem_odd,
+        ).first()
+        if not allotment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail="Allotment not found for this subject"
+            )
+        allotment_id = cast(str, allotment.id)
+
+    if not req.statuses:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No request statuses selected")
+
+    batch = create_reverification_batch(
+        db,
+        requested_by=current_coordinator.user_id,
+        year=year,
+        is_sem_odd=is_sem_odd,
+        statuses=req.statuses,
+        teacher_subject_allotment_id=allotment_id,
+    )
+
+    return {
+        "message": f"{batch.total} requests queued for re-verification",
+        "batch_id": batch.id,
+        "total": batch.total,
+    }
+
+
+@router.get('/reverify/{batch_id}', response_model=ReverificationProgressResponse)
+def get_reverification_progress(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    current_coordinator: TokenData = Depends(role_based_access(['coordinator'])),
+):
+    batch = db.query(VerificationBatch).filter(VerificationBatch.id == batch_id).first()
+    if not batch:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Re-verification batch not found")
+
+    return get_batch_progress(db, batch)
+
+
 @router.post('/stray/requests')
 async def get_stray_certificates(
     current_teacher: TokenData = Depends(get_current_teacher),
@@ -563,7 +675,7 @@ async def verify_certificate_manual(
     request_id: str = Query(),
     subject_id: str = Query(),
     student_id: str = Query(),
-    file: UploadFile = Depends(process_upload),
+    file: StagedUpload = Depends(process_upload),
     db: Session = Depends(get_db),
     current_coordinator: TokenData = Depends(role_based_access(['coordinator'])),
 ):
@@ -581,22 +693,18 @@ async def verify_certificate_manual(
        Certificate.request_id == request_id, 
     ).first()
 
-    relative_file_path = f"{request_id}.pdf"
-    file_path = f"{CERTIFICATES_FOLDER_PATH}/{relative_file_path}"
-
-    await save_file_to_local_storage(
-        file, file_path
-    )
+    relative_file_path = certificate_file_name(request_id)
 
-    # extract details from certificate file
-    (
+    # extract details from certificate file, it is only stored once they are found
+    verification_link, (
         course_name, 
         student_name, 
         total_marks, 
         roll_no, 
         course_period 
-    ) = extract_student_info_from_pdf(
-        file_path, 
+    ) = await verification_executor.run(
+        scan_certificate,
+        file.temp_path, 
         is_subject_name_long=isinstance(db_request.student_subject_enrollment.teacher_subject_allotment.subject.name, str) and (
             len(db_request.student_subject_enrollment.teacher_subject_allotment.subject.name.strip()) > COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT
         )
@@ -606,10 +714,11 @@ async def verify_certificate_manual(
     if not course_name or not student_name or not total_marks or not roll_no or not course_period:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid certificate file")
 
-    verification_link = extract_link(file_path, 0)
-
     # TODO: can add pdf file verification
 
+    await certificate_storage.store(file)
+    file_hash = file.sha256
+
     if not db_certificate:
         db_certificate = Certificate(
             request_id=request_id,
@@ -621,7 +730,11 @@ async def verify_certificate_manual(
         db.commit()
         db.refresh(db_certificate)
     
+    if db_certificate.extraction is not None and db_certificate.file_hash != file_hash:
+        db.delete(db_certificate.extraction)
+
     db_certificate.file_url = relative_file_path
+    db_certificate.file_hash = file_hash
     db_certificate.verification_file_url = verification_link
     db_certificate.verified_total_marks = int(total_marks)
     db_certificate.verified = True
@@ -701,7 +814,7 @@ def reject_certificate_under_review(
 
 
 @router.post('/verify/certificate/manual/unsafe', response_model=GenericResponse)
-def verify_certificate_manual_unsafe(
+async def verify_certificate_manual_unsafe(
     verification_data: UnsafeManualVerificationRequest,
     db: Session = Depends(get_db),
     current_coordinator: TokenData = Depends(role_based_access(['coordinator'])),
@@ -724,9 +837,12 @@ def verify_certificate_manual_unsafe(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The student's certificate was not found")
 
     relative_file_path = db_certificate.file_url
-    file_path = f"{CERTIFICATES_FOLDER_PATH}/{relative_file_path}"
+    stored = await certificate_storage.resolve(cast(str, relative_file_path), cast(Optional[str], db_certificate.file_hash))
+    if stored is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The student's certificate file was not found")
 
-    verification_link = extract_link(file_path, 0)
+    async with certificate_storage.local_copy(stored.key) as file_path:
+        verification_link = await verification_executor.run(read_verification_link, file_path)
 
     db_certificate.file_url = relative_file_path
     db_certificate.verification_file_url = verification_link
@@ -1,7 +1,9 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
+from app.database.models import RequestStatus
+
 # -----------------------------------------------------------------------
 # Request Schemas
 # -----------------------------------------------------------------------
@@ -25,6 +27,11 @@ class UpdateDueDateRequest(BaseModel):
     subject_id: str
     due_date: datetime
 
+class ReverifyRequest(BaseModel):
+    # all subjects of the semester when not set
+    subject_id: Optional[str] = None
+    statuses: List[RequestStatus] = [RequestStatus.error, RequestStatus.under_review]
+
 # -----------------------------------------------------------------------
 # Response Schemas
 # -----------------------------------------------------------------------
@@ -114,3 +121,19 @@ class OptionalCertificateResponseData(BaseModel):
 class OptionalCertificateResponse(BaseModel):
     message: Optional[str] = None
     data: Optional[OptionalCertificateResponseData] = None
+
+
+class ReverifyResponse(BaseModel):
+    message: str
+    batch_id: str
+    total: int
+
+
+class ReverificationProgressResponse(BaseModel):
+    batch_id: str
+    total: int
+    finished: int
+    done: bool
+    jobs: Dict[str, int]
+    requests: Dict[str, int]
+    created_at: Optional[datetime] = None
@@ -1,9 +1,9 @@
-from sqlalchemy import and_
+from sqlalchemy import Row, and_
 from sqlalchemy.orm import Session
 
 from typing import List, cast
 
-from app.database.models import TeacherSubjectAllotment, Subject, Request, StudentSubjectEnrollment
+from app.database.models import TeacherSubjectAllotment, Subject, Request, StudentSubjectEnrollment, Certificate, User
 
 
 def get_teacher_alloted_subjects(
@@ -74,3 +74,50 @@ def get_students_of_a_subject_allotment(
         return None
     
     return allotment.enrolled_students
+
+
+def get_certificate_export_rows(
+    db: Session,
+    teacher_id: str,
+    subject_id: str,
+    year: int,
+    is_sem_odd: bool,
+    is_coordinator: bool = False
+) -> List[Row]:
+    """One row per request of the subject allotment, with the student and the uploaded certificate (if any)."""
+    filter_conditions = [
+        TeacherSubjectAllotment.year == year,
+        TeacherSubjectAllotment.is_sem_odd == is_sem_odd,
+        TeacherSubjectAllotment.subject_id == subject_id
+    ]
+
+    if not is_coordinator:
+        filter_conditions.append(TeacherSubjectAllotment.teacher_id == teacher_id)
+
+    rows = db.query(
+        Request.id.label('request_id'),
+        Request.status,
+        User.name,
+        User.email,
+        User.roll_number,
+        Certificate.file_url,
+        Certificate.file_hash,
+        Certificate.verified,
+        Certificate.verified_total_marks,
+        Certificate.remark,
+        Certificate.uploaded_at,
+    ).join(
+        StudentSubjectEnrollment, Request.student_subject_enrollment_id == StudentSubjectEnrollment.id
+    ).join(
+        TeacherSubjectAllotment, StudentSubjectEnrollment.teacher_subject_allotment_id == TeacherSubjectAllotment.id
+    ).join(
+        User, StudentSubjectEnrollment.student_id == User.id
+    ).outerjoin(
+        Certificate, Certificate.request_id == Request.id
+    ).filter(
+        *filter_conditions
+    ).order_by(
+        User.roll_number, User.name
+    ).all()
+
+    return list(rows)
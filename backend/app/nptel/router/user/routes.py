@@ -1,67 +1,72 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Query
-from fastapi.responses import FileResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.config import config
 from app.database.core import get_db
-from app.database.models import User, UserRole
+from app.database.models import (
+    Certificate,
+    Request as CertificateRequest,
+    StudentSubjectEnrollment,
+    TeacherSubjectAllotment,
+    User,
+    UserRole,
+)
 from .schemas import LoginRequest, LoginResponse, UserInfoResponse
 from app.oauth2 import create_access_token, get_current_user_role_agnostic
 from app.schemas import TokenData
-from app.services.utils.hashing import verify_password_hash
+from app.services.database.user import get_service_role_dict, get_user_with_roles, update_password_hash
+from app.services.login_throttle import login_throttle
+from app.services.password_executor import PasswordExecutorOverloaded, password_executor
+from app.services.refresh_tokens import (
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    revoke_refresh_token,
+    rotate_refresh_token,
+    start_session,
+)
+from app.services.certificate_preview import get_certificate_preview, preview_key
+from app.services.certificate_storage import S3_PRESIGNED_DOWNLOADS, certificate_storage
+from app.services.utils.byte_range import parse_range_header
+from app.services.utils.file_storage import certificate_file_name
+from app.services.utils.http_cache import http_date, is_not_modified, is_range_fresh
 
+import math
 import os
-from typing import cast, Optional, List, Dict
+from typing import cast, Dict, List, Optional
 
 
 ENV=config['ENV']
-CERTIFICATES_FOLDER_PATH = config['CERTIFICATES_FOLDER_PATH']
 
 DEVELOPMENT = ENV == 'DEVELOPMENT'
 TESTING = ENV == 'TESTING'
 
+# certificates change only when re-uploaded, which changes their ETag
+CERTIFICATE_CACHE_CONTROL = config.get('CERTIFICATE_CACHE_CONTROL') or 'private, max-age=300'
+# none, x-accel-redirect (nginx) or x-sendfile (apache, lighttpd), only used with local storage
+CERTIFICATE_DOWNLOAD_OFFLOAD = (config.get('CERTIFICATE_DOWNLOAD_OFFLOAD') or 'none').lower()
+# internal nginx location serving CERTIFICATES_FOLDER_PATH
+CERTIFICATE_X_ACCEL_PREFIX = config.get('CERTIFICATE_X_ACCEL_PREFIX') or '/internal/certificates'
+# where the API serves this router, the refresh token cookie is not sent anywhere else
+REFRESH_TOKEN_COOKIE_PATH = config.get('REFRESH_TOKEN_COOKIE_PATH') or '/api/nptel/user'
 
-router = APIRouter(prefix='/user')
-
-@router.post("/login", response_model=LoginResponse)
-def login(
-    role: UserRole, credentials: LoginRequest, response: Response, db: Session = Depends(get_db),
-):
-    user = db.query(User).filter(User.email == credentials.email).first()
-    if (
-        not user 
-        or not verify_password_hash(credentials.password, cast(str, user.password_hash)) 
-        or user.role != role
-    ):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    
-    user_role_mappings = user.user_role_mappings
-    service_role_dict: Dict[str, List[str]] = {}
 
-    if user_role_mappings:
-        for mapping in user_role_mappings:
-            role_name = mapping.role_assigned.name
-            module_name = mapping.role_assigned.module_name
-
-            assert role_name is not None
-            assert module_name is not None
+router = APIRouter(prefix='/user')
 
-            if module_name not in service_role_dict:
-                service_role_dict[module_name] = []
-            
-            service_role_dict[module_name].append(role_name)
 
-    
-    access_token = create_access_token(
+def create_user_access_token(user: User, service_role_dict: Dict[str, List[str]]) -> str:
+    return create_access_token(
         data={
             'email': user.email,
-            'role': user.role.value,
+            'role': cast(UserRole, user.role).value,
             'user_id': user.id,
             'name': user.name,
             'service_role_dict': service_role_dict,
         }
     )
 
+
+def set_session_cookies(response: Response, access_token: str, refresh_token: str) -> None:
     response.set_cookie(
         key="access_token",
         value=access_token,
@@ -70,40 +75,87 @@ def login(
         samesite='none' if DEVELOPMENT else 'strict',
         path="/",
     )
+    response.set_cookie(
+        key="refresh_token",
+        value=refresh_token,
+        max_age=int(REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60),
+        httponly=True,
+        secure=False if TESTING else True,
+        samesite='none' if DEVELOPMENT else 'strict',
+        path=REFRESH_TOKEN_COOKIE_PATH,         # only sent to /refresh and /logout
+    )
 
-    return {
+@router.post("/login", response_model=LoginResponse)
+async def login(
+    role: UserRole, credentials: LoginRequest, request: Request, response: Response, db: Session = Depends(get_db),
+):
+    # async so that a login never holds a threadpool thread while bcrypt runs on its own pool
+    client_ip = request.client.host if request.client else None
+
+    retry_after = login_throttle.retry_after(client_ip, credentials.email)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    user, service_role_dict = await run_in_threadpool(get_user_with_roles, db, credentials.email)
+
+    new_password_hash = None
+    try:
+        if user is not None and user.role == role:
+            valid, new_password_hash = await password_executor.verify_and_update(
+                credentials.password, cast(str, user.password_hash)
+            )
+        else:
+            # as slow as a wrong password, so an unknown email or a wrong role can't be told apart by timing
+            valid = await password_executor.verify_without_hash(credentials.password)
+    except PasswordExecutorOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins at the moment, try again shortly",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+    if not valid:
+        login_throttle.record_failure(client_ip, credentials.email)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    assert user is not None
+
+    login_throttle.record_success(credentials.email)
+
+    # read before the session is committed, which expires the loaded user
+    user_id = cast(str, user.id)
+    access_token = create_user_access_token(user, service_role_dict)
+    body = {
         'message': "Login successful", 
         'email': user.email,
-        'role': user.role.value,
+        'role': role.value,
         'user_id': user.id,
         'name': user.name,
         'service_role_dict': service_role_dict,
     }
+
+    if new_password_hash:
+        # set at a lower cost by bulk provisioning, from now on at the login cost
+        await run_in_threadpool(update_password_hash, db, user_id, new_password_hash)
+
+    refresh_token = await run_in_threadpool(start_session, db, user_id)
+    set_session_cookies(response, access_token, refresh_token)
+
+    return body
     
 @router.get('/me', response_model=UserInfoResponse)
 def get_user_info(
     db: Session = Depends(get_db),
     current_user: TokenData = Depends(get_current_user_role_agnostic),
 ):
-    db_user = db.query(User).filter(User.id == current_user.user_id).first()
+    db_user = db.get(User, current_user.user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    user_role_mappings = db_user.user_role_mappings
-    service_role_dict: Dict[str, List[str]] = {}
-
-    if user_role_mappings:
-        for mapping in user_role_mappings:
-            role_name = mapping.role_assigned.name
-            module_name = mapping.role_assigned.module_name
-
-            assert role_name is not None
-            assert module_name is not None
-
-            if module_name not in service_role_dict:
-                service_role_dict[module_name] = []
-            
-            service_role_dict[module_name].append(role_name)
+    service_role_dict = get_service_role_dict(db, current_user.user_id)
 
     return {
         'user_id': db_user.id,
@@ -113,9 +165,32 @@ def get_user_info(
         'service_role_dict': service_role_dict
     }
 
+@router.post("/refresh", response_model=LoginResponse)
+def refresh_session(request: Request, response: Response, db: Session = Depends(get_db)):
+    user, refresh_token = rotate_refresh_token(db, request.cookies.get("refresh_token"))
+    service_role_dict = get_service_role_dict(db, cast(str, user.id))
+
+    access_token = create_user_access_token(user, service_role_dict)
+    set_session_cookies(response, access_token, refresh_token)
+
+    return {
+        'message': "Token refreshed",
+        'email': user.email,
+        'role': cast(UserRole, user.role).value,
+        'user_id': user.id,
+        'name': user.name,
+        'service_role_dict': service_role_dict,
+    }
+
 @router.post("/logout")
-def logout(request: Request, response: Response):
-    if request.cookies.get("access_token"):
+def logout(request: Request, response: Response, db: Session = Depends(get_db)):
+    access_token = request.cookies.get("access_token")
+    refresh_token = request.cookies.get("refresh_token")
+
+    if access_token or refresh_token:
+        if refresh_token:
+            revoke_refresh_token(db, refresh_token)
+
         response.delete_cookie(
             "access_token",
             path='/',
@@ -123,33 +198,154 @@ def logout(request: Request, response: Response):
             secure=False if TESTING else True,
             samesite='none' if DEVELOPMENT else 'strict',
         )
+        response.delete_cookie(
+            "refresh_token",
+            path=REFRESH_TOKEN_COOKIE_PATH,
+            httponly=True,
+            secure=False if TESTING else True,
+            samesite='none' if DEVELOPMENT else 'strict',
+        )
         return {"message": "Logout successful"}
     else:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No active session found")
 
 
+def get_certificate_file_hash(db: Session, request_id: str) -> Optional[str]:
+    return db.query(Certificate.file_hash).filter(Certificate.request_id == request_id).scalar()
+
+
 @router.get('/certificate/file/{request_id}.pdf')
-def get_certificate_file_static(
+async def get_certificate_file_static(
     request_id: str,
+    request: Request,
     download: Optional[bool] = Query(False),
     db: Session = Depends(get_db),
 ):
-    file_path = f"{CERTIFICATES_FOLDER_PATH}/{request_id}.pdf"
+    file_url = certificate_file_name(request_id)
+    file_hash = await run_in_threadpool(get_certificate_file_hash, db, request_id)
 
-    # check if file exists
-    if not os.path.exists(file_path):
+    stored = await certificate_storage.resolve(file_url, file_hash)
+    if stored is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
 
-    content_disposition = "attachment" if download else "inline"
-    
-    return FileResponse(
-        path=file_path,
+    content_disposition = f"{'attachment' if download else 'inline'}; filename={request_id}.pdf"
+
+    if stored.content_hash:
+        etag = f'"{stored.content_hash}"'
+    else:
+        # not moved into the blob store yet, there is no content hash to derive a strong tag from
+        etag = f'W/"{stored.size:x}-{int(stored.last_modified.timestamp()):x}"'
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stored.last_modified),
+        "Cache-Control": CERTIFICATE_CACHE_CONTROL,
+    }
+
+    if is_not_modified(request.headers, etag, stored.last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    headers["Content-Disposition"] = content_disposition
+
+    if S3_PRESIGNED_DOWNLOADS and certificate_storage.supports_presigned_urls:
+        presigned_url = await certificate_storage.presigned_url(stored.key, content_disposition)
+        if presigned_url:
+            return RedirectResponse(presigned_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    local_path = certificate_storage.local_path(stored.key)
+    if CERTIFICATE_DOWNLOAD_OFFLOAD != 'none' and local_path is not None:
+        # the proxy sends the file (and handles Range), the worker is free right away
+        if CERTIFICATE_DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+            headers["X-Accel-Redirect"] = f"{CERTIFICATE_X_ACCEL_PREFIX.rstrip('/')}/{stored.key}"
+        else:
+            headers["X-Sendfile"] = os.path.abspath(local_path)
+        return Response(media_type="application/pdf", headers=headers)
+
+    headers["Accept-Ranges"] = "bytes"
+
+    byte_range = None
+    if is_range_fresh(request.headers, etag, stored.last_modified):
+        byte_range = parse_range_header(request.headers.get("range"), stored.size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(stored.size)
+        return StreamingResponse(
+            certificate_storage.stream(stored.key),
+            media_type="application/pdf",
+            headers=headers,
+        )
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+    return StreamingResponse(
+        certificate_storage.stream(stored.key, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
         media_type="application/pdf",
-        filename=f"{request_id}.pdf",
-        headers={
-            "Content-Disposition": f"{content_disposition}; filename={request_id}.pdf"
-        }
-    )
\ No newline at end of file
+        headers=headers,
+    )
+
+
+def get_viewable_certificate_file_hash(db: Session, request_id: str, current_user: TokenData) -> Optional[str]:
+    """The content hash of a request's certificate, once the user is known to be allowed to see it."""
+    row = db.query(
+        Certificate.file_hash, StudentSubjectEnrollment.student_id, TeacherSubjectAllotment.teacher_id
+    ).select_from(CertificateRequest).join(
+        StudentSubjectEnrollment, CertificateRequest.student_subject_enrollment_id == StudentSubjectEnrollment.id
+    ).join(
+        TeacherSubjectAllotment, StudentSubjectEnrollment.teacher_subject_allotment_id == TeacherSubjectAllotment.id
+    ).outerjoin(
+        Certificate, Certificate.request_id == CertificateRequest.id
+    ).filter(
+        CertificateRequest.id == request_id
+    ).first()
+
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Request not found")
+    file_hash, student_id, teacher_id = row
+
+    if current_user.role == UserRole.student.value:
+        allowed = student_id == current_user.user_id
+    elif current_user.role == UserRole.teacher.value:
+        allowed = teacher_id == current_user.user_id or 'coordinator' in current_user.service_role_dict.get('nptel', [])
+    else:
+        allowed = False
+
+    if not allowed:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to view this certificate")
+    return file_hash
+
+
+@router.get('/certificate/preview/{request_id}.png')
+async def get_certificate_preview_image(
+    request_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user_role_agnostic),
+):
+    file_url = certificate_file_name(request_id)
+    file_hash = await run_in_threadpool(get_viewable_certificate_file_hash, db, request_id, current_user)
+
+    stored = await certificate_storage.resolve(file_url, file_hash)
+    if stored is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+
+    # the key covers the content and the preview width
+    etag = f'"{preview_key(stored)}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stored.last_modified),
+        "Cache-Control": CERTIFICATE_CACHE_CONTROL,
+    }
+
+    if is_not_modified(request.headers, etag, stored.last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    png = await get_certificate_preview(stored)
+    return Response(content=png, media_type="image/png", headers=headers)
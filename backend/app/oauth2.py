@@ -1,5 +1,7 @@
+import hashlib
+import time
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Callable
+from typing import Awaitable, Dict, List, Callable, Optional, Tuple
 
 import jwt
 from fastapi import HTTPException, status, Request
@@ -7,11 +9,22 @@ from fastapi import HTTPException, status, Request
 from app.config import config
 from app.schemas import TokenData
 from app.database.models import UserRole
+from app.services.metrics import metrics
+from app.services.utils.ttl_cache import TTLCache
 
 JWT_SECRET_KEY = config['JWT_SECRET_KEY']
 ALGORITHM = config['ALGORITHM']
 ACCESS_TOKEN_EXPIRE_MINUTES = config['ACCESS_TOKEN_EXPIRE_MINUTES']
 
+ACCESS_TOKEN_CACHE_MAX_ENTRIES = int(config.get('ACCESS_TOKEN_CACHE_MAX_ENTRIES') or 10000)
+ACCESS_TOKEN_CACHE_TTL_SECONDS = float(config.get('ACCESS_TOKEN_CACHE_TTL_SECONDS') or 300)
+
+# verified claims keyed by the SHA-256 of the token, an entry never outlives the token's `exp`
+access_token_cache: TTLCache[str, TokenData] = TTLCache(
+    max_entries=ACCESS_TOKEN_CACHE_MAX_ENTRIES,
+    ttl_seconds=ACCESS_TOKEN_CACHE_TTL_SECONDS,
+)
+
 def create_access_token(data: Dict, expire_minutes: timedelta = timedelta(int(ACCESS_TOKEN_EXPIRE_MINUTES))) -> str:
     to_encode = data.copy()
     expire_time = datetime.now(timezone.utc) + expire_minutes
@@ -22,16 +35,33 @@ def create_access_token(data: Dict, expire_minutes: timedelta = timedelta(int(AC
     return jwt_token
 
 
-def verify_access_token(token: str, credentials_exception: Exception) -> TokenData:
+def verify_access_token(token: Optional[str], credentials_exception: Exception) -> TokenData:
     if not token:
         raise credentials_exception
+
+    cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cached = access_token_cache.get(cache_key)
+    if cached is not None:
+        metrics.increment("auth.token_cache.hits")
+        return cached
+
+    metrics.increment("auth.token_cache.misses")
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, [ALGORITHM])
         user_id = payload['user_id']
         role = payload['role']
         service_role_dict = payload['service_role_dict']
 
-        return TokenData(user_id=user_id, role=role, service_role_dict=service_role_dict)
+        token_data = TokenData(user_id=user_id, role=role, service_role_dict=service_role_dict)
+
+        # `exp` is required by create_access_token, a token without one is only cached for the default TTL
+        ttl_seconds = ACCESS_TOKEN_CACHE_TTL_SECONDS
+        if 'exp' in payload:
+            ttl_seconds = min(ttl_seconds, float(payload['exp']) - time.time())
+        if ttl_seconds > 0:
+            access_token_cache.set(cache_key, token_data, ttl_seconds)
+
+        return token_data
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -44,14 +74,40 @@ def verify_access_token(token: str, credentials_exception: Exception) -> TokenDa
         raise credentials_exception
 
 
-def get_current_user(request: Request, role: UserRole) -> TokenData:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Couldn't not validate credentials",
     )
 
-    jwt_token = request.cookies.get('access_token')
-    token_data = verify_access_token(jwt_token, credentials_exception)
+
+def authenticate_access_token(token: Optional[str]) -> Tuple[Optional[TokenData], Optional[HTTPException]]:
+    """The verified claims of a token, or the error to answer a protected route with."""
+    try:
+        return verify_access_token(token, credentials_exception()), None
+    except HTTPException as e:
+        return None, e
+
+
+def get_token_data(request: Request) -> TokenData:
+    """
+    The claims of the request's `access_token` cookie. `AccessTokenMiddleware` has
+    verified them already, so this is a lookup on `request.state`.
+    """
+    if hasattr(request.state, 'token_data'):
+        token_data, error = request.state.token_data, request.state.auth_error
+    else:
+        # the middleware is not installed (e.g. an app mounting the routers on its own)
+        token_data, error = authenticate_access_token(request.cookies.get('access_token'))
+
+    if error is not None:
+        raise error
+    assert token_data is not None
+    return token_data
+
+
+def get_current_user(request: Request, role: UserRole) -> TokenData:
+    token_data = get_token_data(request)
 
     if not token_data.role == role.value:
         raise HTTPException(
@@ -61,38 +117,27 @@ def get_current_user(request: Request, role: UserRole) -> TokenData:
 
     return token_data
 
-def get_current_student(request: Request) -> TokenData:
+# The dependencies below are `async` so that FastAPI calls them on the event loop instead
+# of sending each one to the threadpool, they don't block.
+
+async def get_current_student(request: Request) -> TokenData:
     return get_current_user(request, UserRole.student)
 
-def get_current_teacher(request: Request) -> TokenData:
+async def get_current_teacher(request: Request) -> TokenData:
     return get_current_user(request, UserRole.teacher)
 
-def get_current_admin(request: Request) -> TokenData:
+async def get_current_admin(request: Request) -> TokenData:
     return get_current_user(request, UserRole.admin)
 
-def get_current_user_role_agnostic(request: Request) -> TokenData:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Couldn't not validate credentials",
-    )
+async def get_current_user_role_agnostic(request: Request) -> TokenData:
+    return get_token_data(request)
 
-    jwt_token = request.cookies.get('access_token')
-    token_data = verify_access_token(jwt_token, credentials_exception)
-
-    return token_data
-
-def role_based_access_generic(service_name: str) -> Callable[[List[str]], Callable[[Request], TokenData]]:
+def role_based_access_generic(service_name: str) -> Callable[[List[str]], Callable[[Request], Awaitable[TokenData]]]:
     
-    def role_based_access(role_names: List[str]) -> Callable[[Request], TokenData]:
+    def role_based_access(role_names: List[str]) -> Callable[[Request], Awaitable[TokenData]]:
         
-        def get_current_access(request: Request) -> TokenData:
-            credentials_exception = HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Couldn't not validate credentials",
-            )
-
-            jwt_token = request.cookies.get('access_token')
-            token_data = verify_access_token(jwt_token, credentials_exception)
+        async def get_current_access(request: Request) -> TokenData:
+            token_data = get_token_data(request)
 
             service_role_dict = token_data.service_role_dict
 
@@ -104,7 +149,7 @@ def role_based_access_generic(service_name: str) -> Callable[[List[str]], Callab
                 
             current_service_roles = service_role_dict[service_name]
 
-            if set(role_names) and set(current_service_roles):
+            if set(role_names) & set(current_service_roles):
                 return token_data
             
             raise HTTPException(
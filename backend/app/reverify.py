@@ -0,0 +1,150 @@
+"""
+Bulk re-verification.
+
+Queue every certificate of a subject (or of a whole semester) for verification
+again, e.g. after an NPTEL outage left requests in `error`:
+
+    python -m app.reverify --year 2025 --sem 1 --subject-code CS101 --status error --watch
+
+The jobs are picked up by the verification workers. Pass `--concurrency N` to
+also work through the batch from this process, or `--batch-id` to follow the
+progress of a batch started earlier (e.g. from the coordinator endpoint).
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import List, Optional, cast
+
+from app.config import check_config
+from app.database.core import SessionLocal
+from app.database.models import RequestStatus, Subject, TeacherSubjectAllotment, VerificationBatch
+from app.services.executor import verification_executor
+from app.services.reverification import (
+    DEFAULT_REVERIFICATION_STATUSES,
+    create_reverification_batch,
+    find_requests_to_reverify,
+    get_batch_progress,
+)
+from app.services.utils.http_client import nptel_http_client
+from app.worker import VERIFICATION_WORKER_POLL_SECONDS, VerificationWorker
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.reverify", description="Re-verify certificates in bulk")
+    parser.add_argument("--year", type=int, help="allotment year")
+    parser.add_argument("--sem", type=int, help="semester, only its parity matters")
+    parser.add_argument("--subject-code", help="limit to one subject, all subjects of the semester otherwise")
+    parser.add_argument(
+        "--status",
+        action="append",
+        choices=[request_status.value for request_status in RequestStatus],
+        help="request status to re-verify, repeatable (default: error and under_review)",
+    )
+    parser.add_argument("--batch-id", help="follow an existing batch instead of creating one")
+    parser.add_argument("--concurrency", type=int, default=0, help="verify the batch from this process too")
+    parser.add_argument("--watch", action="store_true", help="print progress until the batch is done")
+    parser.add_argument("--dry-run", action="store_true", help="only count the matching requests")
+    return parser.parse_args(argv)
+
+
+def create_batch(args: argparse.Namespace) -> Optional[str]:
+    if args.year is None or args.sem is None:
+        print("--year and --sem are required to start a batch", file=sys.stderr)
+        sys.exit(2)
+
+    is_sem_odd = bool(args.sem & 1)
+    statuses = [RequestStatus(value) for value in args.status] if args.status else DEFAULT_REVERIFICATION_STATUSES
+
+    with SessionLocal() as db:
+        allotment_id = None
+        if args.subject_code:
+            allotment = db.query(TeacherSubjectAllotment).join(Subject).filter(
+                Subject.subject_code == args.subject_code,
+                TeacherSubjectAllotment.year == args.year,
+                TeacherSubjectAllotment.is_sem_odd == is_sem_odd,
+            ).first()
+            if allotment is None:
+                print(f"No allotment found for {args.subject_code} in {args.year} (sem {args.sem})", file=sys.stderr)
+                sys.exit(1)
+            allotment_id = cast(str, allotment.id)
+
+        if args.dry_run:
+            requests = find_requests_to_reverify(db, args.year, is_sem_odd, statuses, allotment_id)
+            print(f"{len(requests)} requests would be re-verified")
+            return None
+
+        batch = create_reverification_batch(
+            db,
+            requested_by=None,
+            year=args.year,
+            is_sem_odd=is_sem_odd,
+            statuses=statuses,
+            teacher_subject_allotment_id=allotment_id,
+        )
+        print(f"Batch {batch.id} queued {batch.total} requests")
+        return cast(str, batch.id)
+
+
+def print_progress(batch_id: str) -> bool:
+    with SessionLocal() as db:
+        batch = db.query(VerificationBatch).filter(VerificationBatch.id == batch_id).first()
+        if batch is None:
+            print(f"Batch {batch_id} not found", file=sys.stderr)
+            sys.exit(1)
+        progress = get_batch_progress(db, batch)
+
+    jobs = " ".join(f"{name}={count}" for name, count in progress["jobs"].items())
+    requests = " ".join(f"{name}={count}" for name, count in sorted(progress["requests"].items()))
+    print(f"[{progress['finished']}/{progress['total']}] jobs: {jobs} | requests: {requests}", flush=True)
+    return progress["done"]
+
+
+async def watch(batch_id: str) -> None:
+    while not print_progress(batch_id):
+        await asyncio.sleep(max(VERIFICATION_WORKER_POLL_SECONDS, 5))
+
+
+async def run(batch_id: str, concurrency: int, follow: bool) -> None:
+    tasks = []
+    if follow:
+        tasks.append(watch(batch_id))
+
+    if concurrency > 0:
+        worker = VerificationWorker(
+            SessionLocal,
+            concurrency=concurrency,
+            poll_interval=VERIFICATION_WORKER_POLL_SECONDS,
+            batch_id=batch_id,
+        )
+        verification_executor.start()
+        nptel_http_client.start()
+        tasks.append(worker.run())
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if concurrency > 0:
+            await nptel_http_client.aclose()
+            verification_executor.shutdown()
+
+    print_progress(batch_id)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    check_config()
+
+    batch_id = args.batch_id or create_batch(args)
+    if batch_id is None:
+        return
+
+    if args.watch or args.concurrency > 0:
+        asyncio.run(run(batch_id, args.concurrency, args.watch))
+    else:
+        print_progress(batch_id)
+
+
+if __name__ == "__main__":
+    main()
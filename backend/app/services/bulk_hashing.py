@@ -0,0 +1,46 @@
+"""
+Password hashing for bulk user provisioning.
+
+The passwords are split into chunks that are hashed in parallel on the hashing
+process pool (one chunk per task keeps the pickling overhead per password low),
+so provisioning a batch uses every core without forking a pool per request.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, List, Sequence, Tuple
+
+from app.config import config
+from app.services.executor import hashing_executor
+from app.services.utils.hashing import generate_password_hashes
+
+# bcrypt cost of passwords set by an admin (students, teachers), each round doubles the hashing time.
+# 4x cheaper than a login hash, the first login of each user re-hashes the password at the full cost.
+BULK_BCRYPT_ROUNDS = int(config.get('BULK_BCRYPT_ROUNDS') or 10)
+BULK_HASH_CHUNK_SIZE = int(config.get('BULK_HASH_CHUNK_SIZE') or 25)
+
+
+async def iter_password_hashes(
+    passwords: Sequence[str], rounds: int = BULK_BCRYPT_ROUNDS
+) -> AsyncIterator[Tuple[int, List[str]]]:
+    """Yield `(offset, hashes)` of each chunk of `passwords` as soon as it is hashed, in no particular order."""
+    chunks: Dict["asyncio.Future[List[str]]", int] = {}
+    for offset in range(0, len(passwords), BULK_HASH_CHUNK_SIZE):
+        chunk = list(passwords[offset:offset + BULK_HASH_CHUNK_SIZE])
+        chunks[asyncio.ensure_future(hashing_executor.run(generate_password_hashes, chunk, rounds))] = offset
+
+    pending = set(chunks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield chunks[future], future.result()
+    finally:
+        # e.g. the client went away, don't hash the rest
+        for future in pending:
+            future.cancel()
+
+
+async def hash_passwords(passwords: Sequence[str], rounds: int = BULK_BCRYPT_ROUNDS) -> List[str]:
+    hashes: List[str] = [""] * len(passwords)
+    async for offset, chunk_hashes in iter_password_hashes(passwords, rounds):
+        hashes[offset:offset + len(chunk_hashes)] = chunk_hashes
+    return hashes
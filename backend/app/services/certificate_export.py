@@ -0,0 +1,148 @@
+"""
+ZIP export of the certificates of a subject allotment.
+
+The archive is streamed while it is built: every certificate is copied from the
+storage into the archive chunk by chunk, and whatever the archive has written
+so far is handed to the response. Neither the archive nor a whole certificate is
+ever held in memory or in a temporary file, so memory use does not depend on
+the size of the class.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Sequence, Set
+
+from sqlalchemy import Row
+
+from app.services.certificate_storage import StoredObject, certificate_storage
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+
+logger = setup_logger(__name__)
+
+MANIFEST_FILE_NAME = "manifest.csv"
+MANIFEST_COLUMNS = [
+    "roll_number",
+    "name",
+    "email",
+    "request_id",
+    "status",
+    "verified",
+    "verified_total_marks",
+    "remark",
+    "uploaded_at",
+    "file",
+]
+
+_UNSAFE_FILE_NAME_CHARACTERS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class _ArchiveBuffer:
+    """
+    Write-only, unseekable file for `zipfile`, it collects the archive's output
+    until the next `drain`. Being unseekable makes `zipfile` write sizes and CRCs
+    after each member (data descriptors) instead of seeking back to its header.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def write(self, data: bytes, /) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _safe_name(value: Optional[str]) -> str:
+    return _UNSAFE_FILE_NAME_CHARACTERS.sub("_", value or "").strip("_")
+
+
+def _member_name(row: Row, taken: Set[str]) -> str:
+    name = "_".join(part for part in (_safe_name(row.roll_number), _safe_name(row.name)) if part)
+    name = f"{name or row.request_id}.pdf"
+    if name in taken:
+        name = f"{name.removesuffix('.pdf')}_{row.request_id}.pdf"
+    taken.add(name)
+    return name
+
+
+def _zip_date_time(value: Optional[datetime]) -> tuple[int, int, int, int, int, int]:
+    value = value or datetime.now(timezone.utc)
+    return (value.year, value.month, value.day, value.hour, value.minute, value.second)
+
+
+async def stream_certificates_zip(rows: Sequence[Row]) -> AsyncIterator[bytes]:
+    """
+    Yield a ZIP archive with the uploaded certificate of every row and a CSV manifest
+    of all rows (students without a stored certificate have an empty `file`).
+    """
+    # look every file up first, the manifest comes first in the archive and lists them
+    stored_objects: List[Optional[StoredObject]] = []
+    for row in rows:
+        stored = None
+        if row.file_url:
+            stored = await certificate_storage.resolve(row.file_url, row.file_hash)
+        stored_objects.append(stored)
+
+    taken: Set[str] = set()
+    member_names = [_member_name(row, taken) if stored else None for row, stored in zip(rows, stored_objects)]
+
+    sink = _ArchiveBuffer()
+    exported = 0
+
+    # PDFs are compressed already, deflating them again costs CPU for a few percent
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        with archive.open(zipfile.ZipInfo(MANIFEST_FILE_NAME, _zip_date_time(None)), mode="w") as manifest:
+            text = io.StringIO()
+            writer = csv.writer(text)
+            writer.writerow(MANIFEST_COLUMNS)
+            for row, member_name in zip(rows, member_names):
+                writer.writerow([
+                    row.roll_number,
+                    row.name,
+                    row.email,
+                    row.request_id,
+                    row.status.value if row.status else "",
+                    "" if row.verified is None else row.verified,
+                    "" if row.verified_total_marks is None else row.verified_total_marks,
+                    row.remark or "",
+                    row.uploaded_at.isoformat() if row.uploaded_at else "",
+                    member_name or "",
+                ])
+                manifest.write(text.getvalue().encode("utf-8"))
+                text.seek(0)
+                text.truncate()
+        if data := sink.drain():
+            yield data
+
+        for row, stored, member_name in zip(rows, stored_objects, member_names):
+            if stored is None or member_name is None:
+                continue
+
+            info = zipfile.ZipInfo(member_name, _zip_date_time(row.uploaded_at))
+            info.compress_type = zipfile.ZIP_STORED
+            with archive.open(info, mode="w") as member:
+                async for chunk in certificate_storage.stream(stored.key):
+                    member.write(chunk)
+                    if data := sink.drain():
+                        yield data
+            exported += 1
+
+    # the last data descriptor and the central directory
+    yield sink.drain()
+
+    metrics.increment("certificate_export.archives")
+    metrics.increment("certificate_export.files", exported)
+    logger.info(f"Exported {exported} certificates of {len(rows)} requests")
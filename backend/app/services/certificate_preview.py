@@ -0,0 +1,132 @@
+"""
+PNG previews of the first page of uploaded certificates, for the review UI.
+
+A preview is rendered once in the verification process pool and kept in a disk
+cache keyed by the certificate's content hash, so reviewing a class does not
+send every full PDF through the API. The verification worker renders the
+preview of every certificate it leaves under review (while it has the file at
+hand), any other preview is rendered on its first request.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from app.config import config
+from app.services.certificate_storage import StoredObject, certificate_storage
+from app.services.executor import verification_executor
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.utils.disk_cache import DiskCache
+from app.services.utils.document import CertificateDocument
+from app.services.utils.file_storage import CERTIFICATES_FOLDER_PATH
+from app.services.utils.storage_io import storage_io
+
+logger = setup_logger(__name__)
+
+PREVIEWS_FOLDER_NAME = "previews"
+
+# next to the certificates by default, the API and the verification worker (which pre-renders
+# previews) may be separate containers that only share the certificates volume
+CERTIFICATE_PREVIEW_CACHE_PATH = (
+    config.get('CERTIFICATE_PREVIEW_CACHE_PATH')
+    or os.path.join(CERTIFICATES_FOLDER_PATH, PREVIEWS_FOLDER_NAME)
+)
+CERTIFICATE_PREVIEW_CACHE_MAX_BYTES = int(config.get('CERTIFICATE_PREVIEW_CACHE_MAX_BYTES') or 128 * 1024 * 1024)
+CERTIFICATE_PREVIEW_CACHE_TTL_SECONDS = int(config.get('CERTIFICATE_PREVIEW_CACHE_TTL_SECONDS') or 30 * 24 * 60 * 60)
+CERTIFICATE_PREVIEW_WIDTH = int(config.get('CERTIFICATE_PREVIEW_WIDTH') or 640)
+
+certificate_preview_cache = DiskCache(
+    CERTIFICATE_PREVIEW_CACHE_PATH,
+    max_bytes=CERTIFICATE_PREVIEW_CACHE_MAX_BYTES,
+    ttl_seconds=CERTIFICATE_PREVIEW_CACHE_TTL_SECONDS,
+    suffix=".png",
+)
+
+# renders in progress in this process, concurrent requests for a preview share one
+_renders: Dict[str, "asyncio.Future[bytes]"] = {}
+
+
+def render_preview(pdf_path: str, width: int) -> bytes:
+    """Runs in the verification process pool."""
+    with CertificateDocument.open(pdf_path) as document:
+        if document.page_count == 0:
+            raise ValueError(f"{pdf_path} has no pages")
+        return document.render_page_png(0, width)
+
+
+def preview_key(stored: StoredObject) -> str:
+    if stored.content_hash:
+        content_key = stored.content_hash
+    else:
+        # not moved into the blob store yet, the file is identified by its size and mtime instead
+        content_key = DiskCache.key_for(f"{stored.key}:{stored.size}:{stored.last_modified.timestamp()}")
+    return f"{content_key}_{CERTIFICATE_PREVIEW_WIDTH}"
+
+
+def _read_cached(key: str) -> Optional[bytes]:
+    entry = certificate_preview_cache.get(key)
+    if entry is None:
+        return None
+    try:
+        with open(entry.path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        # evicted by another process in the meantime
+        return None
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def _render(stored: StoredObject, key: str, pdf_path: Optional[str]) -> bytes:
+    if pdf_path is None:
+        async with certificate_storage.local_copy(stored.key) as local_path:
+            return await _render(stored, key, local_path)
+
+    started_at = time.perf_counter()
+    png = await verification_executor.run(render_preview, pdf_path, CERTIFICATE_PREVIEW_WIDTH)
+    metrics.observe("certificate_preview.render", time.perf_counter() - started_at)
+
+    temp_path = await storage_io.run("preview_cache_reserve", certificate_preview_cache.reserve)
+    try:
+        await storage_io.run("preview_cache_write", _write_file, temp_path, png)
+        await storage_io.run("preview_cache_commit", certificate_preview_cache.commit, key, temp_path)
+    except BaseException:
+        await storage_io.run("preview_cache_discard", certificate_preview_cache.discard, temp_path)
+        raise
+
+    logger.info(f"Rendered preview {key} of {stored.key} ({len(png)} bytes)")
+    return png
+
+
+def _forget_render(key: str, render: "asyncio.Future[bytes]") -> None:
+    _renders.pop(key, None)
+    # the requests waiting for it may all have gone away, don't warn about an unretrieved error
+    if not render.cancelled():
+        render.exception()
+
+
+async def get_certificate_preview(stored: StoredObject, pdf_path: Optional[str] = None) -> bytes:
+    """
+    The PNG preview of a stored certificate, rendered (from `pdf_path` if the file
+    is at hand already) when it is not cached yet.
+    """
+    key = preview_key(stored)
+
+    png = await storage_io.run("preview_cache_get", _read_cached, key)
+    if png is not None:
+        metrics.increment("certificate_preview.cache_hits")
+        return png
+
+    render = _renders.get(key)
+    if render is None:
+        metrics.increment("certificate_preview.cache_misses")
+        render = asyncio.ensure_future(_render(stored, key, pdf_path))
+        _renders[key] = render
+        render.add_done_callback(lambda _: _forget_render(key, render))
+
+    # a client that disconnects must not cancel the render the others are waiting for
+    return await asyncio.shield(render)
@@ -0,0 +1,280 @@
+"""
+Where uploaded certificates are kept.
+
+`CERTIFICATE_STORAGE=local` (the default) keeps them in `CERTIFICATES_FOLDER_PATH`,
+which every API and verification worker has to mount. `CERTIFICATE_STORAGE=s3`
+keeps them in an S3 compatible bucket (AWS, MinIO, ...) so that any node can
+accept uploads and serve downloads, `CERTIFICATES_FOLDER_PATH` is then only used
+to stage uploads.
+
+Both use the layout of `app.services.utils.file_storage`, objects are addressed
+by their key relative to the root of the store.
+"""
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Optional, cast
+
+from app.config import config
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.utils.file_storage import (
+    CERTIFICATES_FOLDER_PATH,
+    StagedUpload,
+    blob_key,
+    commit_blob,
+)
+from app.services.utils.storage_io import storage_io
+
+logger = setup_logger(__name__)
+
+CERTIFICATE_STORAGE = (config.get('CERTIFICATE_STORAGE') or 'local').lower()
+
+S3_BUCKET = config.get('S3_BUCKET')
+S3_PREFIX = (config.get('S3_PREFIX') or '').strip('/')
+S3_ENDPOINT_URL = config.get('S3_ENDPOINT_URL') or None  # e.g. http://minio:9000
+S3_REGION = config.get('S3_REGION') or None
+S3_ACCESS_KEY_ID = config.get('S3_ACCESS_KEY_ID') or None
+S3_SECRET_ACCESS_KEY = config.get('S3_SECRET_ACCESS_KEY') or None
+S3_PRESIGNED_DOWNLOADS = (config.get('S3_PRESIGNED_DOWNLOADS') or 'false').lower() == 'true'
+S3_PRESIGNED_URL_EXPIRY_SECONDS = int(config.get('S3_PRESIGNED_URL_EXPIRY_SECONDS') or 300)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class StoredObject:
+    key: str
+    size: int
+    last_modified: datetime
+    # SHA-256 of the content, known for blobs
+    content_hash: Optional[str] = None
+
+
+class CertificateStorage(ABC):
+    # whether downloads can be handed off to the storage with `presigned_url`
+    supports_presigned_urls = False
+
+    @abstractmethod
+    async def store(self, upload: StagedUpload) -> str:
+        """Store a staged upload under its content hash and return its key."""
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        pass
+
+    async def resolve(self, file_url: str, file_hash: Optional[str]) -> Optional[StoredObject]:
+        """The stored file of a certificate, its blob or (before migration) `{file_url}` at the root."""
+        if file_hash:
+            stored = await self.stat(blob_key(file_hash))
+            if stored is not None:
+                stored.content_hash = file_hash
+                return stored
+
+        return await self.stat(file_url)
+
+    @abstractmethod
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes `start` to `end` (inclusive, to the end of the object when None)."""
+
+    @abstractmethod
+    def local_copy(self, key: str) -> AbstractAsyncContextManager[str]:
+        """Async context manager giving a local path of the object, e.g. to scan it in the process pool."""
+
+    async def presigned_url(self, key: str, content_disposition: str) -> Optional[str]:
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Where the object is on this host's filesystem, if it is on it."""
+        return None
+
+
+class LocalCertificateStorage(CertificateStorage):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path_for(key)
+
+    async def store(self, upload: StagedUpload) -> str:
+        stored = await storage_io.run("commit_blob", commit_blob, upload.temp_path, upload.sha256)
+        upload.committed = True
+
+        if stored:
+            logger.info(f"Stored upload {upload.filename} ({upload.size} bytes) as blob {upload.sha256}")
+        else:
+            metrics.increment("storage.deduplicated")
+            logger.info(f"Upload {upload.filename} is identical to stored blob {upload.sha256}")
+
+        return blob_key(upload.sha256)
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            result = await storage_io.run("stat", os.stat, self.path_for(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(
+            key=key,
+            size=result.st_size,
+            last_modified=datetime.fromtimestamp(result.st_mtime, timezone.utc),
+        )
+
+    async def stream(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        file = await storage_io.open(self.path_for(key), 'rb')
+        try:
+            if start:
+                await file.seek(start)
+
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = STREAM_CHUNK_SIZE if remaining is None else min(STREAM_CHUNK_SIZE, remaining)
+                chunk = await file.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await file.close(durable=False)
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[str]:
+        yield self.path_for(key)
+
+
+class S3CertificateStorage(CertificateStorage):
+    """
+    Certificates in an S3 compatible bucket, e.g. MinIO for local development:
+
+        docker run -p 9000:9000 minio/minio server /data
+        CERTIFICATE_STORAGE=s3 S3_ENDPOINT_URL=http://localhost:9000 S3_BUCKET=certificates ...
+
+    boto3 is only needed (and imported) when this backend is used. Its calls block,
+    they run on the storage I/O threads.
+    """
+
+    supports_presigned_urls = True
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self._client: Any = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("CERTIFICATE_STORAGE=s3 requires boto3, install it with `uv add boto3`") from e
+
+            # boto3 clients are thread safe, one is shared by all storage I/O threads
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key_id,
+                aws_secret_access_key=self.secret_access_key,
+            )
+        return self._client
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _head(self, key: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StoredObject(key=key, size=response["ContentLength"], last_modified=response["LastModified"])
+
+    def _upload(self, path: str, key: str) -> None:
+        self.client.upload_file(path, self.bucket, self.object_key(key), ExtraArgs={"ContentType": "application/pdf"})
+
+    async def store(self, upload: StagedUpload) -> str:
+        key = blob_key(upload.sha256)
+
+        if await storage_io.run("s3_head", self._head, key) is not None:
+            metrics.increment("storage.deduplicated")
+            logger.info(f"Upload {upload.filename} is identical to stored blob {upload.sha256}")
+            return key
+
+        await storage_io.run("s3_put", self._upload, upload.temp_path, key)
+        # the staged file is left for `process_upload` to remove
+        logger.info(f"Stored upload {upload.filename} ({upload.size} bytes) as s3://{self.bucket}/{self.object_key(key)}")
+        return key
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        return await storage_io.run("s3_head", self._head, key)
+
+    def _get(self, key: str, start: int, end: Optional[int]) -> Any:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key), Range=byte_range)["Body"]
+
+    async def stream(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        body = await storage_io.run("s3_get", self._get, key, start, end)
+        try:
+            while chunk := await storage_io.run("s3_read", body.read, STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[str]:
+        fd, path = tempfile.mkstemp(prefix="certificate_", suffix=".pdf")
+        os.close(fd)
+        try:
+            await storage_io.run("s3_download", self.client.download_file, self.bucket, self.object_key(key), path)
+            yield path
+        finally:
+            await storage_io.remove(path)
+
+    async def presigned_url(self, key: str, content_disposition: str) -> Optional[str]:
+        return cast(str, self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.object_key(key),
+                "ResponseContentType": "application/pdf",
+                "ResponseContentDisposition": content_disposition,
+            },
+            ExpiresIn=S3_PRESIGNED_URL_EXPIRY_SECONDS,
+        ))
+
+
+def create_certificate_storage() -> CertificateStorage:
+    if CERTIFICATE_STORAGE == 's3':
+        return S3CertificateStorage(
+            bucket=cast(str, S3_BUCKET),
+            prefix=S3_PREFIX,
+            endpoint_url=S3_ENDPOINT_URL,
+            region=S3_REGION,
+            access_key_id=S3_ACCESS_KEY_ID,
+            secret_access_key=S3_SECRET_ACCESS_KEY,
+        )
+    return LocalCertificateStorage(CERTIFICATES_FOLDER_PATH)
+
+
+certificate_storage = create_certificate_storage()
@@ -5,12 +5,12 @@ from datetime import datetime, timezone, timedelta
 import logging
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from sqlalchemy import select
+from sqlalchemy import CursorResult, delete, select
 from sqlalchemy.orm import joinedload
 
-from typing import Sequence
+from typing import Any, Sequence, cast
 
-from app.database.models import Request, RequestStatus, Certificate
+from app.database.models import Request, RequestStatus, Certificate, RefreshToken, VerificationJob, VerificationJobStatus
 
 logger = logging.getLogger(__name__)
 
@@ -37,9 +37,10 @@ class CleanupService:
         while self.running:
             try:
                 await self.execute_cleanup() 
-                await asyncio.sleep(60 * 60)
             except Exception as e:
                 logger.error(f"Error during cleanup: {e}")
+            # outside the try, a failing cleanup must not turn into a busy loop
+            await asyncio.sleep(60 * 60)
                 
     
     async def execute_cleanup(self) -> None:
@@ -47,6 +48,8 @@ class CleanupService:
             stale_certificates = await self.get_stale_processing_certificates(db)
             for certificate in stale_certificates:
                 await self.update_request_and_certificate(certificate, db)
+
+            await self.delete_expired_refresh_tokens(db)
             
     
     async def get_stale_processing_certificates(self, db: AsyncSession) -> Sequence[Certificate]:
@@ -57,7 +60,11 @@ class CleanupService:
             .options(joinedload(Certificate.request))
             .where(
                 Request.status == RequestStatus.processing,
-                Request.updated_at < one_hour_before
+                Request.updated_at < one_hour_before,
+                # requests waiting in the verification queue are not stuck
+                ~Request.verification_jobs.any(
+                    VerificationJob.status.in_([VerificationJobStatus.queued, VerificationJobStatus.running])
+                ),
             )
         )
         result = await db.execute(stmt)
@@ -68,4 +75,12 @@ class CleanupService:
         request = certificate.request
         request.status = RequestStatus.pending
         certificate.remark = "Previously stuck at processing"
-        await db.commit()
\ No newline at end of file
+        await db.commit()
+
+    async def delete_expired_refresh_tokens(self, db: AsyncSession) -> None:
+        result = cast(CursorResult[Any], await db.execute(
+            delete(RefreshToken).where(RefreshToken.expires_at < datetime.now(timezone.utc))
+        ))
+        await db.commit()
+        if result.rowcount:
+            logger.info(f"Deleted {result.rowcount} expired refresh tokens")
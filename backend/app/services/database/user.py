@@ -0,0 +1,85 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.database.models import Role, User, UserRoleMapping
+from app.services.metrics import metrics
+from app.services.utils.ttl_cache import TTLCache
+
+ServiceRoleDict = Dict[str, List[str]]
+# what the cache holds, callers get their own copy as a ServiceRoleDict
+CachedServiceRoles = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+SERVICE_ROLE_CACHE_MAX_ENTRIES = int(config.get('SERVICE_ROLE_CACHE_MAX_ENTRIES') or 10000)
+# role changes are invalidated in the process that makes them, the TTL bounds how stale the others can be
+SERVICE_ROLE_CACHE_TTL_SECONDS = float(config.get('SERVICE_ROLE_CACHE_TTL_SECONDS') or 300)
+
+# user id -> ((module name, (role names)), ...)
+service_role_cache: TTLCache[str, CachedServiceRoles] = TTLCache(
+    max_entries=SERVICE_ROLE_CACHE_MAX_ENTRIES,
+    ttl_seconds=SERVICE_ROLE_CACHE_TTL_SECONDS,
+)
+
+
+def _build_service_role_dict(pairs: List[Tuple[Optional[str], Optional[str]]]) -> ServiceRoleDict:
+    service_role_dict: ServiceRoleDict = {}
+    for module_name, role_name in pairs:
+        # the outer join gives a single (None, None) row for a user without custom roles
+        if module_name is None or role_name is None:
+            continue
+        service_role_dict.setdefault(module_name, []).append(role_name)
+    return service_role_dict
+
+
+def _cache_service_roles(user_id: str, service_role_dict: ServiceRoleDict) -> None:
+    # immutable, so a caller changing its dict can't change what the next one gets
+    service_role_cache.set(
+        user_id, tuple((module_name, tuple(role_names)) for module_name, role_names in service_role_dict.items())
+    )
+
+
+def get_user_with_roles(db: Session, email: str) -> Tuple[Optional[User], ServiceRoleDict]:
+    """The user with this email and their custom roles by module, in a single query."""
+    rows = (
+        db.query(User, Role.module_name, Role.name)
+        .outerjoin(UserRoleMapping, UserRoleMapping.user_id == User.id)
+        .outerjoin(Role, Role.id == UserRoleMapping.role_id)
+        .filter(User.email == email)
+        .all()
+    )
+    if not rows:
+        return None, {}
+
+    user = rows[0][0]
+    service_role_dict = _build_service_role_dict([(module_name, role_name) for _, module_name, role_name in rows])
+    _cache_service_roles(str(user.id), service_role_dict)
+    return user, service_role_dict
+
+
+def get_service_role_dict(db: Session, user_id: str) -> ServiceRoleDict:
+    cached = service_role_cache.get(user_id)
+    if cached is not None:
+        metrics.increment("service_role_cache.hits")
+        return {module_name: list(role_names) for module_name, role_names in cached}
+
+    metrics.increment("service_role_cache.misses")
+    pairs = (
+        db.query(Role.module_name, Role.name)
+        .join(UserRoleMapping, UserRoleMapping.role_id == Role.id)
+        .filter(UserRoleMapping.user_id == user_id)
+        .all()
+    )
+    service_role_dict = _build_service_role_dict([(module_name, role_name) for module_name, role_name in pairs])
+    _cache_service_roles(user_id, service_role_dict)
+    return service_role_dict
+
+
+def invalidate_service_roles(user_id: str) -> None:
+    """Call after changing a user's roles."""
+    service_role_cache.delete(user_id)
+
+
+def update_password_hash(db: Session, user_id: str, password_hash: str) -> None:
+    db.query(User).filter(User.id == user_id).update({User.password_hash: password_hash}, synchronize_session=False)
+    db.commit()
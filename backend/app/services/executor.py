@@ -0,0 +1,70 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Tuple, TypeVar
+
+from app.config import config
+from app.services.log_service import setup_logger
+from app.services.metrics import MetricsDelta, metrics
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+VERIFICATION_WORKERS = int(config.get('VERIFICATION_WORKERS') or 2)
+# gunicorn workers on this node (see gunicorn.conf.py), each one owns its pools
+WEB_CONCURRENCY = int(config.get('WEB_CONCURRENCY') or 4)
+# the node's cores shared by the hashing pools of all gunicorn workers
+HASHING_WORKERS = int(config.get('HASHING_WORKERS') or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))
+
+
+def _run_collecting_metrics(fn: Callable[..., T], *args: Any, **kwargs: Any) -> Tuple[T, MetricsDelta]:
+    """Runs in a pool process, the metrics recorded by `fn` are returned to the parent with its result."""
+    result = fn(*args, **kwargs)
+    return result, metrics.drain()
+
+
+class ProcessPool:
+    """
+    A lazily created `ProcessPoolExecutor` owned by the application lifespan.
+
+    CPU bound work (PDF rendering, QR decoding, text extraction) is submitted
+    here so that it never blocks the event loop of the uvicorn worker.
+    Worker processes are spawned rather than forked so that they do not inherit
+    the event loop, database connections or sockets of the parent.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"Started {self.name} process pool with {self.max_workers} workers")
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+            logger.info(f"Stopped {self.name} process pool")
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        self.start()
+        loop = asyncio.get_running_loop()
+        result, delta = await loop.run_in_executor(
+            self.executor, partial(_run_collecting_metrics, fn, *args, **kwargs)
+        )
+        metrics.merge(delta)
+        return result
+
+
+verification_executor = ProcessPool("verification", VERIFICATION_WORKERS)
+# bcrypt for bulk user provisioning, login verification has its own threads (see password_executor)
+hashing_executor = ProcessPool("hashing", HASHING_WORKERS)
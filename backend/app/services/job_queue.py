@@ -0,0 +1,191 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, cast
+
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.database.models import VerificationJob, VerificationJobStatus, Request, RequestStatus, Certificate
+from app.services.log_service import setup_logger
+
+logger = setup_logger(__name__)
+
+VERIFICATION_JOB_MAX_ATTEMPTS = int(config.get('VERIFICATION_JOB_MAX_ATTEMPTS') or 3)
+VERIFICATION_JOB_LEASE_SECONDS = int(config.get('VERIFICATION_JOB_LEASE_SECONDS') or 120)
+VERIFICATION_JOB_RETRY_DELAY_SECONDS = int(config.get('VERIFICATION_JOB_RETRY_DELAY_SECONDS') or 30)
+# a running job's lease is extended this often, well within the lease so a slow renewal doesn't lose it
+VERIFICATION_JOB_HEARTBEAT_SECONDS = float(
+    config.get('VERIFICATION_JOB_HEARTBEAT_SECONDS') or VERIFICATION_JOB_LEASE_SECONDS / 4
+)
+
+# A job's lifecycle maps onto the request status as follows:
+#   queued / running -> RequestStatus.processing
+#   succeeded        -> whatever the verifier decided (completed, rejected or under_review)
+#   dead             -> RequestStatus.error (retries exhausted)
+
+
+def enqueue_verification_job(
+    db: Session,
+    request_id: str,
+    batch_id: Optional[str] = None,
+    priority: int = 0,
+    delay_seconds: float = 0,
+) -> VerificationJob:
+    """Add a verification job to the session, the caller is responsible for committing."""
+    job = VerificationJob(
+        request_id=request_id,
+        batch_id=batch_id,
+        priority=priority,
+        status=VerificationJobStatus.queued,
+        attempts=0,
+        max_attempts=VERIFICATION_JOB_MAX_ATTEMPTS,
+        run_after=datetime.now(timezone.utc) + timedelta(seconds=delay_seconds),
+    )
+    db.add(job)
+    return job
+
+
+def release_verification_job(db: Session, job: VerificationJob) -> None:
+    """Make a job enqueued with a delay runnable right away."""
+    job.run_after = datetime.now(timezone.utc)
+    db.commit()
+
+
+def claim_verification_job(db: Session, worker_id: str, batch_id: Optional[str] = None) -> VerificationJob | None:
+    """
+    Claim the next runnable job, or a running job whose lease has expired.
+
+    `FOR UPDATE SKIP LOCKED` lets any number of workers, on any number of nodes,
+    poll the same table without handing out the same job twice.
+    """
+    now = datetime.now(timezone.utc)
+
+    query = db.query(VerificationJob)
+    if batch_id is not None:
+        query = query.filter(VerificationJob.batch_id == batch_id)
+
+    job = query.filter(
+        or_(
+            and_(
+                VerificationJob.status == VerificationJobStatus.queued,
+                VerificationJob.run_after <= now,
+            ),
+            and_(
+                VerificationJob.status == VerificationJobStatus.running,
+                VerificationJob.lease_expires_at < now,
+            ),
+        )
+    ).order_by(
+        VerificationJob.priority.desc(),
+        VerificationJob.run_after,
+    ).with_for_update(
+        skip_locked=True
+    ).first()
+
+    if not job:
+        db.rollback()
+        return None
+
+    if job.status == VerificationJobStatus.running:
+        logger.warning(f"Lease of verification job {job.id} held by {job.locked_by} expired, reclaiming")
+
+    attempts = cast(int, job.attempts)
+
+    if attempts >= cast(int, job.max_attempts):
+        mark_job_dead(db, job, job.last_error or "Verification worker did not finish the job")
+        return claim_verification_job(db, worker_id, batch_id)
+
+    job.status = VerificationJobStatus.running
+    job.attempts = attempts + 1
+    job.locked_by = worker_id
+    job.lease_expires_at = now + timedelta(seconds=VERIFICATION_JOB_LEASE_SECONDS)
+    db.commit()
+    db.refresh(job)
+
+    return job
+
+
+def renew_verification_job_lease(db: Session, job_id: str, worker_id: str) -> bool:
+    """Extend the lease of a job this worker is running, False when the job is no longer its own."""
+    renewed = db.query(VerificationJob).filter(
+        VerificationJob.id == job_id,
+        VerificationJob.status == VerificationJobStatus.running,
+        VerificationJob.locked_by == worker_id,
+    ).update(
+        {VerificationJob.lease_expires_at: datetime.now(timezone.utc) + timedelta(seconds=VERIFICATION_JOB_LEASE_SECONDS)},
+        synchronize_session=False,
+    )
+    db.commit()
+    return bool(renewed)
+
+
+def complete_verification_job(db: Session, job: VerificationJob) -> None:
+    job.status = VerificationJobStatus.succeeded
+    job.lease_expires_at = None
+    job.locked_by = None
+    db.commit()
+
+
+def fail_verification_job(db: Session, job: VerificationJob, error: str) -> None:
+    """Schedule a retry with exponential backoff, or dead-letter the job once attempts run out."""
+    attempts = cast(int, job.attempts)
+
+    if attempts >= cast(int, job.max_attempts):
+        mark_job_dead(db, job, error)
+        return
+
+    delay = VERIFICATION_JOB_RETRY_DELAY_SECONDS * (2 ** (attempts - 1))
+
+    job.status = VerificationJobStatus.queued
+    job.last_error = error
+    job.lease_expires_at = None
+    job.locked_by = None
+    job.run_after = datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+    _update_request_status(
+        db,
+        job,
+        RequestStatus.processing,
+        f"{error}. Retrying verification (attempt {job.attempts} of {job.max_attempts})"
+    )
+    db.commit()
+
+    logger.info(f"Verification job {job.id} failed, retrying in {delay} seconds")
+
+
+def defer_verification_job(db: Session, job: VerificationJob, delay_seconds: float, reason: str) -> None:
+    """Put a job back in the queue without counting the attempt, e.g. while NPTEL is unavailable."""
+    job.status = VerificationJobStatus.queued
+    job.attempts = max(cast(int, job.attempts) - 1, 0)
+    job.last_error = reason
+    job.lease_expires_at = None
+    job.locked_by = None
+    job.run_after = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+
+    _update_request_status(db, job, RequestStatus.processing, f"{reason}. Verification will resume shortly")
+    db.commit()
+
+    logger.info(f"Verification job {job.id} deferred by {delay_seconds:.0f} seconds: {reason}")
+
+
+def mark_job_dead(db: Session, job: VerificationJob, error: str) -> None:
+    job.status = VerificationJobStatus.dead
+    job.last_error = error
+    job.lease_expires_at = None
+    job.locked_by = None
+
+    _update_request_status(db, job, RequestStatus.error, error)
+    db.commit()
+
+    logger.error(f"Verification job {job.id} moved to dead letter after {job.attempts} attempts: {error}")
+
+
+def _update_request_status(db: Session, job: VerificationJob, request_status: RequestStatus, remark: str) -> None:
+    db_request = db.query(Request).filter(Request.id == job.request_id).first()
+    if db_request:
+        db_request.status = request_status
+
+    db_certificate = db.query(Certificate).filter(Certificate.request_id == job.request_id).first()
+    if db_certificate:
+        db_certificate.verified = False
+        db_certificate.remark = remark
@@ -0,0 +1,71 @@
+import time
+from typing import Optional, Tuple
+
+from app.config import config
+from app.services.metrics import metrics
+from app.services.utils.ttl_cache import TTLCache
+
+LOGIN_THROTTLE_WINDOW_SECONDS = float(config.get('LOGIN_THROTTLE_WINDOW_SECONDS') or 15 * 60)
+LOGIN_MAX_FAILURES_PER_EMAIL = int(config.get('LOGIN_MAX_FAILURES_PER_EMAIL') or 10)
+# generous, a whole campus can be behind one NAT address
+LOGIN_MAX_FAILURES_PER_IP = int(config.get('LOGIN_MAX_FAILURES_PER_IP') or 200)
+LOGIN_THROTTLE_MAX_ENTRIES = int(config.get('LOGIN_THROTTLE_MAX_ENTRIES') or 100000)
+
+
+class LoginThrottle:
+    """
+    Counts failed logins per client address and per email over a fixed window.
+
+    Once either count reaches its limit, further attempts are refused until the
+    window ends, before any password is hashed. Successful logins are not
+    counted, so a login storm from one network is left to `PasswordExecutor`.
+    Counts are kept per process, like `TTLCache`.
+    """
+
+    def __init__(self, window_seconds: float, max_failures_per_ip: int, max_failures_per_email: int, max_entries: int):
+        self.window_seconds = window_seconds
+        self.max_failures_per_ip = max_failures_per_ip
+        self.max_failures_per_email = max_failures_per_email
+        # key -> (failures, end of the window)
+        self.failures: TTLCache[str, Tuple[int, float]] = TTLCache(max_entries=max_entries, ttl_seconds=window_seconds)
+
+    @staticmethod
+    def _keys(ip: Optional[str], email: str) -> Tuple[str, str]:
+        return f"ip:{ip or 'unknown'}", f"email:{email.strip().lower()}"
+
+    def _blocked_for(self, key: str, limit: int) -> float:
+        entry = self.failures.get(key)
+        if entry is None or entry[0] < limit:
+            return 0.0
+        return max(0.0, entry[1] - time.monotonic())
+
+    def retry_after(self, ip: Optional[str], email: str) -> Optional[float]:
+        """Seconds until this client may try again, None when it is not throttled."""
+        ip_key, email_key = self._keys(ip, email)
+        blocked_for = max(
+            self._blocked_for(ip_key, self.max_failures_per_ip),
+            self._blocked_for(email_key, self.max_failures_per_email),
+        )
+        if blocked_for <= 0:
+            return None
+        metrics.increment("auth.login.throttled")
+        return blocked_for
+
+    def record_failure(self, ip: Optional[str], email: str) -> None:
+        now = time.monotonic()
+        for key in self._keys(ip, email):
+            failures, window_ends_at = self.failures.get(key) or (0, now + self.window_seconds)
+            self.failures.set(key, (failures + 1, window_ends_at), ttl_seconds=window_ends_at - now)
+        metrics.increment("auth.login.failed")
+
+    def record_success(self, email: str) -> None:
+        _, email_key = self._keys(None, email)
+        self.failures.delete(email_key)
+
+
+login_throttle = LoginThrottle(
+    LOGIN_THROTTLE_WINDOW_SECONDS,
+    max_failures_per_ip=LOGIN_MAX_FAILURES_PER_IP,
+    max_failures_per_email=LOGIN_MAX_FAILURES_PER_EMAIL,
+    max_entries=LOGIN_THROTTLE_MAX_ENTRIES,
+)
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+# counters and (count, total seconds, max seconds) per timing, as carried between processes
+MetricsDelta = Tuple[Dict[str, int], Dict[str, Tuple[int, float, float]]]
+
+
+class TimingStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def merge(self, count: int, total_seconds: float, max_seconds: float) -> None:
+        self.count += count
+        self.total_seconds += total_seconds
+        self.max_seconds = max(self.max_seconds, max_seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_seconds * 1000, 3),
+            'avg_ms': round(self.total_seconds * 1000 / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_seconds * 1000, 3),
+        }
+
+
+class Metrics:
+    """
+    In-process counters and timings.
+
+    Every gunicorn worker (and every verification worker) keeps its own copy,
+    the snapshot carries the pid so that scrapes can be told apart.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.timings: Dict[str, TimingStats] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = TimingStats()
+            self.timings[name].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at)
+
+    def drain(self) -> MetricsDelta:
+        """Take everything recorded so far, e.g. to send it from a pool process to its parent."""
+        with self.lock:
+            delta: MetricsDelta = (
+                self.counters,
+                {name: (stats.count, stats.total_seconds, stats.max_seconds) for name, stats in self.timings.items()},
+            )
+            self.counters = {}
+            self.timings = {}
+        return delta
+
+    def merge(self, delta: MetricsDelta) -> None:
+        counters, timings = delta
+        with self.lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, (count, total_seconds, max_seconds) in timings.items():
+                if name not in self.timings:
+                    self.timings[name] = TimingStats()
+                self.timings[name].merge(count, total_seconds, max_seconds)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'counters': dict(self.counters),
+                'timings': {name: stats.as_dict() for name, stats in self.timings.items()},
+            }
+
+
+metrics = Metrics()
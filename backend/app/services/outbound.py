@@ -0,0 +1,279 @@
+"""
+Cluster-wide protection for calls to external services (nptel.ac.in).
+
+Every gunicorn worker and verification worker shares one token bucket and one
+circuit breaker per service through Postgres, so the limits hold no matter how
+many processes or nodes are running. When the database cannot be reached in
+time each process falls back to its own, local, state.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.utils.throttle import TokenBucket
+
+logger = setup_logger(__name__)
+
+# log the fallback to local state at most this often
+FALLBACK_LOG_INTERVAL_SECONDS = 60
+
+
+class OutboundUnavailableError(Exception):
+    """The external service should not be called right now, try again after `retry_after` seconds."""
+
+    def __init__(self, service: str, reason: str, retry_after: float):
+        super().__init__(f"{service}: {reason}")
+        self.service = service
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _FallbackLogger:
+    def __init__(self) -> None:
+        self.last_logged_at = 0.0
+
+    def warning(self, message: str) -> None:
+        now = time.monotonic()
+        if now - self.last_logged_at >= FALLBACK_LOG_INTERVAL_SECONDS:
+            self.last_logged_at = now
+            logger.warning(message)
+
+
+_TAKE_TOKEN = text("""
+    INSERT INTO rate_limit_buckets (name, tokens, updated_at)
+    VALUES (:name, CAST(:capacity AS double precision) - 1, clock_timestamp())
+    ON CONFLICT (name) DO UPDATE SET
+        tokens = LEAST(
+            CAST(:capacity AS double precision),
+            rate_limit_buckets.tokens
+                + CAST(EXTRACT(EPOCH FROM clock_timestamp() - rate_limit_buckets.updated_at) AS double precision)
+                * CAST(:rate AS double precision)
+        ) - 1,
+        updated_at = clock_timestamp()
+    RETURNING tokens
+""")
+
+_RETURN_TOKEN = text("UPDATE rate_limit_buckets SET tokens = tokens + 1 WHERE name = :name")
+
+
+class SharedRateLimiter:
+    """
+    A token bucket stored in the `rate_limit_buckets` table.
+
+    Each `acquire` reserves a token with a single upsert. The bucket may go
+    negative, the caller then sleeps until its reservation is covered, which
+    keeps waiters in arrival order without polling the database.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session_factory: async_sessionmaker[AsyncSession],
+        rate: float,
+        burst: int,
+        fallback: TokenBucket,
+        max_wait_seconds: float,
+        db_timeout_seconds: float,
+    ):
+        self.name = name
+        self.session_factory = session_factory
+        self.rate = rate
+        self.burst = burst
+        self.fallback = fallback
+        self.max_wait_seconds = max_wait_seconds
+        self.db_timeout_seconds = db_timeout_seconds
+        self.fallback_logger = _FallbackLogger()
+
+    async def _reserve(self) -> float:
+        async with self.session_factory() as db:
+            result = await db.execute(_TAKE_TOKEN, {"name": self.name, "capacity": self.burst, "rate": self.rate})
+            tokens = float(result.scalar_one())
+            await db.commit()
+            return tokens
+
+    async def _refund(self) -> None:
+        async with self.session_factory() as db:
+            await db.execute(_RETURN_TOKEN, {"name": self.name})
+            await db.commit()
+
+    async def acquire(self) -> float:
+        """Wait for a token, returns the number of seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+
+        try:
+            tokens = await asyncio.wait_for(self._reserve(), self.db_timeout_seconds)
+        except Exception as e:
+            metrics.increment(f"{self.name}.rate_limit.fallback")
+            self.fallback_logger.warning(f"Shared rate limiter {self.name} unavailable, using the local one: {e!r}")
+            return await self.fallback.acquire()
+
+        if tokens >= 0:
+            return 0.0
+
+        wait = -tokens / self.rate
+        if wait > self.max_wait_seconds:
+            try:
+                await asyncio.wait_for(self._refund(), self.db_timeout_seconds)
+            except Exception as e:
+                logger.warning(f"Could not return a token to {self.name}: {e!r}")
+            metrics.increment(f"{self.name}.rate_limit.rejected")
+            raise OutboundUnavailableError(self.name, "Rate limit exceeded", retry_after=wait)
+
+        await asyncio.sleep(wait)
+        return wait
+
+
+_READ_BREAKER = text("SELECT failures, open_until FROM circuit_breakers WHERE name = :name")
+
+_CLAIM_PROBE = text("""
+    UPDATE circuit_breakers
+    SET open_until = clock_timestamp() + make_interval(secs => CAST(:probe_seconds AS double precision)),
+        updated_at = clock_timestamp()
+    WHERE name = :name AND open_until <= clock_timestamp()
+    RETURNING open_until
+""")
+
+_RECORD_FAILURE = text("""
+    INSERT INTO circuit_breakers (name, failures, open_until, updated_at)
+    VALUES (
+        :name,
+        1,
+        CASE WHEN 1 >= :threshold
+            THEN clock_timestamp() + make_interval(secs => CAST(:open_seconds AS double precision))
+        END,
+        clock_timestamp()
+    )
+    ON CONFLICT (name) DO UPDATE SET
+        failures = circuit_breakers.failures + 1,
+        open_until = CASE WHEN circuit_breakers.failures + 1 >= :threshold
+            THEN clock_timestamp() + make_interval(secs => CAST(:open_seconds AS double precision))
+            ELSE circuit_breakers.open_until
+        END,
+        updated_at = clock_timestamp()
+    RETURNING failures, open_until
+""")
+
+_RECORD_SUCCESS = text("""
+    UPDATE circuit_breakers
+    SET failures = 0, open_until = NULL, updated_at = clock_timestamp()
+    WHERE name = :name AND (failures > 0 OR open_until IS NOT NULL)
+""")
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker whose state lives in the `circuit_breakers` table.
+
+    After `failure_threshold` consecutive failures, counted across all processes,
+    the breaker opens for `open_seconds` and `before_call` fails fast. Once that
+    has passed a single caller is let through as a probe, its outcome closes or
+    re-opens the breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session_factory: async_sessionmaker[AsyncSession],
+        failure_threshold: int,
+        open_seconds: float,
+        db_timeout_seconds: float,
+    ):
+        self.name = name
+        self.session_factory = session_factory
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.db_timeout_seconds = db_timeout_seconds
+        self.fallback_logger = _FallbackLogger()
+
+        # used when the database is unreachable
+        self.local_failures = 0
+        self.local_open_until: Optional[datetime] = None
+
+    def _open_error(self, open_until: datetime, now: datetime) -> OutboundUnavailableError:
+        metrics.increment(f"{self.name}.circuit_breaker.rejected")
+        return OutboundUnavailableError(
+            self.name,
+            "Service is not responding, calls are paused",
+            retry_after=max((open_until - now).total_seconds(), 1.0),
+        )
+
+    async def _before_call_shared(self) -> None:
+        async with self.session_factory() as db:
+            row = (await db.execute(_READ_BREAKER, {"name": self.name})).first()
+            if row is None or row.open_until is None:
+                return
+
+            now = datetime.now(timezone.utc)
+            if row.open_until > now:
+                raise self._open_error(row.open_until, now)
+
+            # half open, only one caller gets to probe the service
+            probe = (await db.execute(_CLAIM_PROBE, {"name": self.name, "probe_seconds": self.open_seconds})).first()
+            await db.commit()
+            if probe is None:
+                raise self._open_error(now + timedelta(seconds=self.open_seconds), now)
+
+            logger.info(f"Circuit breaker {self.name} is half open, probing")
+
+    def _before_call_local(self) -> None:
+        now = datetime.now(timezone.utc)
+        if self.local_open_until is None:
+            return
+        if self.local_open_until > now:
+            raise self._open_error(self.local_open_until, now)
+        # half open, re-opened by the next failure
+        self.local_open_until = now + timedelta(seconds=self.open_seconds)
+
+    async def before_call(self) -> None:
+        """Raise `OutboundUnavailableError` while the breaker is open."""
+        try:
+            await asyncio.wait_for(self._before_call_shared(), self.db_timeout_seconds)
+            return
+        except OutboundUnavailableError:
+            raise
+        except Exception as e:
+            metrics.increment(f"{self.name}.circuit_breaker.fallback")
+            self.fallback_logger.warning(f"Shared circuit breaker {self.name} unavailable, using local state: {e!r}")
+
+        self._before_call_local()
+
+    async def _record_success_shared(self) -> None:
+        async with self.session_factory() as db:
+            await db.execute(_RECORD_SUCCESS, {"name": self.name})
+            await db.commit()
+
+    async def _record_failure_shared(self) -> None:
+        parameters = {"name": self.name, "threshold": self.failure_threshold, "open_seconds": self.open_seconds}
+        async with self.session_factory() as db:
+            row = (await db.execute(_RECORD_FAILURE, parameters)).one()
+            await db.commit()
+
+        if row.open_until is not None and row.failures == self.failure_threshold:
+            logger.warning(f"Circuit breaker {self.name} opened after {row.failures} consecutive failures")
+
+    async def record_success(self) -> None:
+        self.local_failures = 0
+        self.local_open_until = None
+        try:
+            await asyncio.wait_for(self._record_success_shared(), self.db_timeout_seconds)
+        except Exception as e:
+            self.fallback_logger.warning(f"Could not record success on circuit breaker {self.name}: {e!r}")
+
+    async def record_failure(self) -> None:
+        metrics.increment(f"{self.name}.circuit_breaker.failures")
+
+        self.local_failures += 1
+        if self.local_failures >= self.failure_threshold:
+            self.local_open_until = datetime.now(timezone.utc) + timedelta(seconds=self.open_seconds)
+
+        try:
+            await asyncio.wait_for(self._record_failure_shared(), self.db_timeout_seconds)
+        except Exception as e:
+            self.fallback_logger.warning(f"Could not record failure on circuit breaker {self.name}: {e!r}")
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+from app.config import config
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.utils.hashing import generate_password_hash, verify_and_update_password_hash, verify_password_hash
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+PASSWORD_HASH_THREADS = int(config.get('PASSWORD_HASH_THREADS') or min(4, os.cpu_count() or 1))
+# verifications allowed to wait for a thread, beyond that logins are refused with a 503
+PASSWORD_HASH_MAX_QUEUE = int(config.get('PASSWORD_HASH_MAX_QUEUE') or 64)
+
+# until the first hash is timed, roughly bcrypt's default cost on a server core
+INITIAL_HASH_SECONDS = 0.25
+# weight of the latest hash in the moving average used for Retry-After
+HASH_SECONDS_SMOOTHING = 0.2
+
+
+@functools.cache
+def _dummy_password_hash() -> str:
+    return generate_password_hash(secrets.token_urlsafe(16))
+
+
+def _verify_without_hash(plain_password: str) -> bool:
+    verify_password_hash(plain_password, _dummy_password_hash())
+    return False
+
+
+class PasswordExecutorOverloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Password verification is overloaded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class PasswordExecutor:
+    """
+    A bounded thread pool for bcrypt, separate from the AnyIO threadpool.
+
+    bcrypt releases the GIL, so threads hash in parallel, but each hash takes a
+    core for a few hundred milliseconds. On the shared threadpool a login storm
+    would starve every sync route, here it can only queue up to `max_queue`
+    verifications, further ones are refused right away with a retry estimate.
+    Time spent waiting for a thread and hashing is recorded under `auth.password.*`.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor: ThreadPoolExecutor | None = None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.average_hash_seconds = INITIAL_HASH_SECONDS
+
+    def start(self) -> None:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+            logger.info(f"Started password hashing pool with {self.max_workers} threads")
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def retry_after(self) -> float:
+        """Roughly how long until the queue has drained."""
+        return max(1.0, self.pending / self.max_workers * self.average_hash_seconds)
+
+    def _release(self, _: Future) -> None:
+        with self.lock:
+            self.pending -= 1
+
+    async def run(self, operation: str, fn: Callable[..., T], *args: Any) -> T:
+        self.start()
+        assert self.executor is not None
+
+        with self.lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                metrics.increment("auth.password.rejected")
+                raise PasswordExecutorOverloaded(self.retry_after())
+            self.pending += 1
+
+        submitted_at = time.perf_counter()
+
+        def timed() -> T:
+            started_at = time.perf_counter()
+            metrics.observe("auth.password.queue_wait", started_at - submitted_at)
+            try:
+                return fn(*args)
+            finally:
+                seconds = time.perf_counter() - started_at
+                metrics.observe(f"auth.password.{operation}", seconds)
+                self.average_hash_seconds += HASH_SECONDS_SMOOTHING * (seconds - self.average_hash_seconds)
+
+        try:
+            future = self.executor.submit(timed)
+        except BaseException:
+            with self.lock:
+                self.pending -= 1
+            raise
+        # released when the hash is done, or right away when it is cancelled before it started
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run("verify", verify_password_hash, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Like `verify`, also returns a new hash when the stored one is below the current cost."""
+        return await self.run("verify", verify_and_update_password_hash, plain_password, hashed_password)
+
+    async def verify_without_hash(self, plain_password: str) -> bool:
+        """Always False, but takes as long as `verify` so a failed login doesn't tell why it failed."""
+        return await self.run("verify", _verify_without_hash, plain_password)
+
+
+password_executor = PasswordExecutor(PASSWORD_HASH_THREADS, PASSWORD_HASH_MAX_QUEUE)
@@ -0,0 +1,152 @@
+"""
+Rotating refresh tokens.
+
+A login hands out a short lived access token (a JWT, checked without the
+database) and a refresh token. `/user/refresh` trades the refresh token for a new
+access token and a new refresh token with one indexed lookup instead of a bcrypt
+verification. Revocation (logout, reuse of a replaced token) is therefore only
+seen by the database on refresh, an access token stays valid until it expires.
+
+Refresh tokens are random, so a plain SHA-256 is enough to store them safely.
+The token that replaces one is derived from it (an HMAC with the JWT secret), so
+that concurrent refreshes of the same token (e.g. two tabs whose access token
+expired at once) can all be handed the same successor within a short grace
+window instead of being taken for a reuse.
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, cast
+
+from cuid import cuid
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.database.models import RefreshToken, User
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+
+logger = setup_logger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(config.get('REFRESH_TOKEN_EXPIRE_DAYS') or 30)
+REFRESH_TOKEN_BYTES = 32
+# how long a replaced token still gets its successor back, rather than ending the session
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = float(config.get('REFRESH_TOKEN_REUSE_GRACE_SECONDS') or 30)
+REFRESH_TOKEN_SECRET = cast(str, config['JWT_SECRET_KEY']).encode("utf-8")
+
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def invalid_refresh_token() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+
+def successor_token(token: str) -> str:
+    """The token that replaces `token` when it is used."""
+    digest = hmac.new(REFRESH_TOKEN_SECRET, token.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def issue_refresh_token(
+    db: Session, user_id: str, family_id: Optional[str] = None, token: Optional[str] = None
+) -> str:
+    """Add a new refresh token (random unless given, of a new family unless `family_id` is given), the caller commits."""
+    token = token or secrets.token_urlsafe(REFRESH_TOKEN_BYTES)
+    db.add(RefreshToken(
+        user_id=user_id,
+        family_id=family_id or cuid(),
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+def start_session(db: Session, user_id: str) -> str:
+    """The refresh token of a new login."""
+    token = issue_refresh_token(db, user_id)
+    db.commit()
+    return token
+
+
+def _revoke_family(db: Session, family_id: str) -> None:
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None),
+    ).update({RefreshToken.revoked_at: datetime.now(timezone.utc)}, synchronize_session=False)
+    db.commit()
+
+
+def rotate_refresh_token(db: Session, token: Optional[str]) -> Tuple[User, str]:
+    """Replace a refresh token with a new one, returns its user and the new token."""
+    if not token:
+        raise invalid_refresh_token()
+
+    now = datetime.now(timezone.utc)
+    row = (
+        db.query(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .filter(
+            RefreshToken.token_hash == hash_refresh_token(token),
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .first()
+    )
+    if row is None:
+        raise invalid_refresh_token()
+    refresh_token, user = row
+    # keep the user loaded after the commits below, the caller builds the new access token from it
+    db.expunge(user)
+
+    # marking it used only if nobody else did lets a single refresh issue the successor
+    used = db.query(RefreshToken).filter(
+        RefreshToken.id == refresh_token.id,
+        RefreshToken.used_at.is_(None),
+    ).update({RefreshToken.used_at: now}, synchronize_session=False)
+
+    if used:
+        new_token = issue_refresh_token(db, str(user.id), str(refresh_token.family_id), successor_token(token))
+        db.commit()
+        metrics.increment("auth.refresh.rotated")
+        return user, new_token
+
+    db.rollback()
+    used_at = db.query(RefreshToken.used_at).filter(RefreshToken.id == refresh_token.id).scalar()
+    if used_at is not None and used_at.tzinfo is None:
+        used_at = used_at.replace(tzinfo=timezone.utc)
+
+    if used_at is not None and now - used_at <= timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE_SECONDS):
+        # a concurrent refresh of the same token, e.g. another tab, hand out the successor it issued
+        new_token = successor_token(token)
+        # only while the successor is still the session's current token
+        current = db.query(RefreshToken.id).filter(
+            RefreshToken.token_hash == hash_refresh_token(new_token),
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked_at.is_(None),
+        ).first()
+        if current is not None:
+            metrics.increment("auth.refresh.concurrent")
+            return user, new_token
+
+    # a replaced token was presented again, it may have been stolen: end the session
+    _revoke_family(db, str(refresh_token.family_id))
+    metrics.increment("auth.refresh.reused")
+    logger.warning(f"Refresh token reuse for user {user.id}, revoked its session")
+    raise invalid_refresh_token()
+
+
+def revoke_refresh_token(db: Session, token: str) -> None:
+    """Revoke the session (the token's whole family) with a single statement."""
+    family_ids = db.query(RefreshToken.family_id).filter(
+        RefreshToken.token_hash == hash_refresh_token(token)
+    ).scalar_subquery()
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_ids,
+        RefreshToken.revoked_at.is_(None),
+    ).update({RefreshToken.revoked_at: datetime.now(timezone.utc)}, synchronize_session=False)
+    db.commit()
@@ -0,0 +1,127 @@
+from typing import Dict, List, Optional, cast
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database.models import (
+    Certificate,
+    Request,
+    RequestStatus,
+    StudentSubjectEnrollment,
+    TeacherSubjectAllotment,
+    VerificationBatch,
+    VerificationJob,
+    VerificationJobStatus,
+)
+from app.services.job_queue import enqueue_verification_job
+from app.services.log_service import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_REVERIFICATION_STATUSES = [RequestStatus.error, RequestStatus.under_review]
+# uploads from students keep priority 0 and are claimed first
+REVERIFICATION_JOB_PRIORITY = -10
+
+
+def find_requests_to_reverify(
+    db: Session,
+    year: int,
+    is_sem_odd: bool,
+    statuses: List[RequestStatus],
+    teacher_subject_allotment_id: Optional[str] = None,
+) -> List[Request]:
+    """Requests with an uploaded certificate in the given statuses that are not already queued for verification."""
+    allotment_conditions = [
+        TeacherSubjectAllotment.year == year,
+        TeacherSubjectAllotment.is_sem_odd == is_sem_odd,
+    ]
+    if teacher_subject_allotment_id is not None:
+        allotment_conditions.append(TeacherSubjectAllotment.id == teacher_subject_allotment_id)
+
+    active_job = db.query(VerificationJob.id).filter(
+        VerificationJob.request_id == Request.id,
+        VerificationJob.status.in_([VerificationJobStatus.queued, VerificationJobStatus.running]),
+    ).exists()
+
+    return db.query(Request).join(
+        StudentSubjectEnrollment, Request.student_subject_enrollment_id == StudentSubjectEnrollment.id
+    ).join(
+        TeacherSubjectAllotment, StudentSubjectEnrollment.teacher_subject_allotment_id == TeacherSubjectAllotment.id
+    ).join(
+        Certificate, Certificate.request_id == Request.id
+    ).filter(
+        *allotment_conditions,
+        Request.status.in_(statuses),
+        ~active_job,
+    ).all()
+
+
+def create_reverification_batch(
+    db: Session,
+    requested_by: Optional[str],
+    year: int,
+    is_sem_odd: bool,
+    statuses: List[RequestStatus],
+    teacher_subject_allotment_id: Optional[str] = None,
+) -> VerificationBatch:
+    """Queue a verification job for every matching request, the verification workers pick them up."""
+    requests = find_requests_to_reverify(db, year, is_sem_odd, statuses, teacher_subject_allotment_id)
+
+    batch = VerificationBatch(
+        requested_by=requested_by,
+        teacher_subject_allotment_id=teacher_subject_allotment_id,
+        year=year,
+        is_sem_odd=is_sem_odd,
+        statuses=",".join(request_status.value for request_status in statuses),
+        total=len(requests),
+    )
+    db.add(batch)
+    db.flush()
+
+    for db_request in requests:
+        db_request.status = RequestStatus.processing
+        if db_request.certificate:
+            db_request.certificate.remark = "Queued for re-verification"
+
+        enqueue_verification_job(
+            db,
+            cast(str, db_request.id),
+            batch_id=cast(str, batch.id),
+            priority=REVERIFICATION_JOB_PRIORITY,
+        )
+
+    db.commit()
+    db.refresh(batch)
+
+    logger.info(f"Re-verification batch {batch.id} queued {batch.total} requests")
+    return batch
+
+
+def get_batch_progress(db: Session, batch: VerificationBatch) -> Dict:
+    job_counts: Dict[VerificationJobStatus, int] = {
+        job_status: count
+        for job_status, count in db.query(VerificationJob.status, func.count(VerificationJob.id)).filter(
+            VerificationJob.batch_id == batch.id
+        ).group_by(VerificationJob.status).all()
+    }
+    request_counts: Dict[RequestStatus, int] = {
+        request_status: count
+        for request_status, count in db.query(Request.status, func.count(Request.id)).join(
+            VerificationJob, VerificationJob.request_id == Request.id
+        ).filter(
+            VerificationJob.batch_id == batch.id
+        ).group_by(Request.status).all()
+    }
+
+    jobs = {job_status.value: job_counts.get(job_status, 0) for job_status in VerificationJobStatus}
+    finished = jobs[VerificationJobStatus.succeeded.value] + jobs[VerificationJobStatus.dead.value]
+
+    return {
+        "batch_id": batch.id,
+        "total": batch.total,
+        "finished": finished,
+        "done": finished >= cast(int, batch.total),
+        "jobs": jobs,
+        "requests": {request_status.value: count for request_status, count in request_counts.items()},
+        "created_at": batch.created_at,
+    }
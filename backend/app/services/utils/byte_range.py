@@ -0,0 +1,37 @@
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The (start, end) byte positions, both inclusive, requested by a `Range` header.
+
+    Only a single range is supported, which is what PDF viewers ask for. None means
+    the whole file should be sent (no header, or one we do not understand).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            # suffix range, the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    return start, min(end, size - 1)
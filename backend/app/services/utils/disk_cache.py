@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.services.log_service import setup_logger
+
+logger = setup_logger(__name__)
+
+ABANDONED_TEMP_FILE_SECONDS = 60 * 60
+
+
+class CacheEntry(NamedTuple):
+    path: str
+    metadata: Dict[str, str]
+
+
+class DiskCache:
+    """
+    A size bounded LRU + TTL file cache that is safe to share between processes.
+
+    Entries are written to a temporary file in the cache directory and renamed
+    into place, so readers never observe a partially written file. The entry's
+    mtime is its creation time (used for the TTL) and its atime is bumped on
+    every hit (used for LRU eviction), so no shared index has to be kept.
+
+    Another process may evict an entry at any time, a reader that needs the file
+    for a while pins it (a private hard link) and discards the pin when done.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int, suffix: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.suffix = suffix
+
+    @staticmethod
+    def key_for(value: str) -> str:
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def metadata_path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.meta.json")
+
+    def get(self, key: str) -> CacheEntry | None:
+        path = self.path_for(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        now = time.time()
+        if now - stat.st_mtime > self.ttl_seconds:
+            self.remove(key)
+            return None
+
+        metadata: Dict[str, str] = {}
+        try:
+            with open(self.metadata_path_for(key), "r") as f:
+                metadata = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        # mark as recently used, keep the mtime (creation time) for the TTL
+        os.utime(path, (now, stat.st_mtime))
+        return CacheEntry(path, metadata)
+
+    def reserve(self) -> str:
+        """Create an empty temporary file in the cache directory for a new entry."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_", suffix=self.suffix)
+        os.close(fd)
+        return temp_path
+
+    def pin(self, path: str) -> str:
+        """
+        A private link to a cache file that stays readable when the entry is evicted, discard it when done.
+
+        Raises FileNotFoundError when the file is already gone.
+        """
+        pinned = os.path.join(self.directory, f".pin_{secrets.token_hex(8)}{self.suffix}")
+        try:
+            os.link(path, pinned)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # no hard links on this filesystem
+            shutil.copyfile(path, pinned)
+        return pinned
+
+    def commit(self, key: str, temp_path: str, metadata: Optional[Dict[str, str]] = None) -> str:
+        """Atomically move a reserved file into the cache and enforce the size bound."""
+        if metadata is not None:
+            metadata_temp_path = self.reserve()
+            with open(metadata_temp_path, "w") as f:
+                json.dump(metadata, f)
+            os.replace(metadata_temp_path, self.metadata_path_for(key))
+
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+
+        self.evict()
+        return path
+
+    def discard(self, temp_path: str) -> None:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, key: str) -> None:
+        for path in (self.path_for(key), self.metadata_path_for(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remove_abandoned_temp_file(self, path: str, now: float) -> None:
+        # left behind by a writer or a reader that crashed before committing or discarding it,
+        # the ctime of a pin is when it was linked, its mtime is the entry's
+        try:
+            stat = os.stat(path)
+            if now - max(stat.st_mtime, stat.st_ctime) > ABANDONED_TEMP_FILE_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> None:
+        now = time.time()
+        entries: List[Tuple[float, int, str]] = []
+        total_bytes = 0
+
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+
+        for name in names:
+            if name.startswith((".tmp_", ".pin_")):
+                self._remove_abandoned_temp_file(os.path.join(self.directory, name), now)
+                continue
+
+            if not name.endswith(self.suffix):
+                continue
+
+            key = name[:-len(self.suffix)]
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+
+            if now - stat.st_mtime > self.ttl_seconds:
+                self.remove(key)
+                continue
+
+            entries.append((stat.st_atime, stat.st_size, key))
+            total_bytes += stat.st_size
+
+        if total_bytes <= self.max_bytes:
+            return
+
+        # least recently used first
+        for _, size, key in sorted(entries):
+            self.remove(key)
+            total_bytes -= size
+            logger.info(f"Evicted {key} from {self.directory}")
+            if total_bytes <= self.max_bytes:
+                break
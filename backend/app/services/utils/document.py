@@ -0,0 +1,105 @@
+from types import TracebackType
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+
+import fitz
+
+# (8 bit grayscale pixels, width, height) -> the raw image format understood by pyzbar
+GrayscaleRaster = Tuple[bytes, int, int]
+
+
+class ImagePlacement(NamedTuple):
+    """An image XObject drawn on a page, `bbox` is where on the page (in points)."""
+    xref: int
+    width: int
+    height: int
+    bbox: fitz.Rect
+
+
+class CertificateDocument:
+    """
+    A certificate PDF parsed once and shared by the QR and text extraction stages.
+
+    Use it as a context manager so that the underlying MuPDF document is closed
+    as soon as the caller is done with it.
+    """
+
+    def __init__(self, document: fitz.Document):
+        self.document = document
+        self._page_text: Dict[int, str] = {}
+
+    @classmethod
+    def open(cls, pdf_path: str) -> "CertificateDocument":
+        return cls(fitz.open(pdf_path))
+
+    @classmethod
+    def from_bytes(cls, pdf_bytes: bytes) -> "CertificateDocument":
+        return cls(fitz.open(stream=pdf_bytes, filetype="pdf"))
+
+    @property
+    def page_count(self) -> int:
+        return int(self.document.page_count)
+
+    def page_text(self, page_number: int) -> str:
+        if page_number not in self._page_text:
+            self._page_text[page_number] = self.document[page_number].get_text()
+        return self._page_text[page_number]
+
+    def render_page_grayscale(self, page_number: int, resolution: int) -> GrayscaleRaster:
+        """Render a page straight into an in-memory grayscale pixmap."""
+        page = self.document[page_number]
+        pixmap = page.get_pixmap(dpi=resolution, colorspace=fitz.csGRAY, alpha=False)
+        return bytes(pixmap.samples), pixmap.width, pixmap.height
+
+    def render_clip_grayscale(self, page_number: int, clip: fitz.Rect, resolution: int) -> GrayscaleRaster:
+        """Render only the `clip` rectangle (in points) of a page."""
+        page = self.document[page_number]
+        pixmap = page.get_pixmap(dpi=resolution, colorspace=fitz.csGRAY, alpha=False, clip=clip)
+        return bytes(pixmap.samples), pixmap.width, pixmap.height
+
+    def page_rect(self, page_number: int) -> fitz.Rect:
+        return self.document[page_number].rect
+
+    def image_placements(self, page_number: int) -> List[ImagePlacement]:
+        page = self.document[page_number]
+        return [
+            ImagePlacement(info["xref"], info["width"], info["height"], fitz.Rect(info["bbox"]))
+            for info in page.get_image_info(xrefs=True)
+            # inline images have no xref, they can't be extracted on their own
+            if info["xref"]
+        ]
+
+    def extract_image_grayscale(self, xref: int, min_size: int = 0) -> GrayscaleRaster:
+        """Decode an image XObject as is, without rendering the page, upscaled to at least `min_size` pixels."""
+        pixmap = fitz.Pixmap(self.document, xref)
+        if pixmap.alpha:
+            pixmap = fitz.Pixmap(pixmap, 0)
+        if pixmap.colorspace is None or pixmap.colorspace.n != 1:
+            pixmap = fitz.Pixmap(fitz.csGRAY, pixmap)
+
+        smallest_side = min(pixmap.width, pixmap.height)
+        if 0 < smallest_side < min_size:
+            scale = -(-min_size // smallest_side)
+            pixmap = fitz.Pixmap(pixmap, pixmap.width * scale, pixmap.height * scale, None)
+
+        return bytes(pixmap.samples), pixmap.width, pixmap.height
+
+    def render_page_png(self, page_number: int, width: int) -> bytes:
+        """Render a page scaled to `width` pixels as a PNG, e.g. for a thumbnail."""
+        page = self.document[page_number]
+        scale = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        return bytes(pixmap.tobytes("png"))
+
+    def close(self) -> None:
+        self.document.close()
+
+    def __enter__(self) -> "CertificateDocument":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
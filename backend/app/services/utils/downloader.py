@@ -1,45 +1,256 @@
-import httpx
+import os
+import tempfile
 from typing import Tuple, Optional
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+import httpx
+
+from app.config import config
+from app.database.core import AsyncSessionLocal
 from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.outbound import CircuitBreaker, OutboundUnavailableError
+
+from .disk_cache import DiskCache
+from .http_client import nptel_http_client, OUTBOUND_GUARD_DB_TIMEOUT_SECONDS
+from .link_extractor import CertificateLinkParser
+from .storage_io import storage_io
+from .ttl_cache import TTLCache
 
 logger = setup_logger(__name__)
 
-async def download_verification_pdf(qr_code_link: str, temp_file_name: str) -> Tuple[bool, Optional[str], str]:
-    logger.info(f"Temp file name: {temp_file_name}")
+
+class NptelServerError(Exception):
+    pass
+
+
+VERIFICATION_PDF_CACHE_PATH = (
+    config.get('VERIFICATION_PDF_CACHE_PATH') 
+    or os.path.join(tempfile.gettempdir(), "avlokan_verification_pdfs")
+)
+VERIFICATION_PDF_CACHE_MAX_BYTES = int(config.get('VERIFICATION_PDF_CACHE_MAX_BYTES') or 256 * 1024 * 1024)
+VERIFICATION_PDF_CACHE_TTL_SECONDS = int(config.get('VERIFICATION_PDF_CACHE_TTL_SECONDS') or 7 * 24 * 60 * 60)
+MAX_VERIFICATION_PDF_SIZE = int(config.get('MAX_VERIFICATION_PDF_SIZE') or 10 * 1024 * 1024)
+
+MAX_LANDING_PAGE_SIZE = int(config.get('MAX_LANDING_PAGE_SIZE') or 2 * 1024 * 1024)
+CERTIFICATE_LINK_CACHE_MAX_ENTRIES = int(config.get('CERTIFICATE_LINK_CACHE_MAX_ENTRIES') or 10000)
+CERTIFICATE_LINK_CACHE_TTL_SECONDS = int(config.get('CERTIFICATE_LINK_CACHE_TTL_SECONDS') or 24 * 60 * 60)
+
+NPTEL_BREAKER_FAILURE_THRESHOLD = int(config.get('NPTEL_BREAKER_FAILURE_THRESHOLD') or 5)
+NPTEL_BREAKER_OPEN_SECONDS = float(config.get('NPTEL_BREAKER_OPEN_SECONDS') or 60)
+
+PDF_MAGIC = b"%PDF-"
+# the PDF header may be preceded by junk, readers look for it in the first 1024 bytes
+PDF_MAGIC_SEARCH_BYTES = 1024
+PDF_CONTENT_TYPES = ("application/pdf", "application/x-pdf", "application/octet-stream", "binary/octet-stream")
+
+# opened by timeouts, connection errors and 5xx responses from NPTEL
+nptel_circuit_breaker = CircuitBreaker(
+    "nptel",
+    AsyncSessionLocal,
+    failure_threshold=NPTEL_BREAKER_FAILURE_THRESHOLD,
+    open_seconds=NPTEL_BREAKER_OPEN_SECONDS,
+    db_timeout_seconds=OUTBOUND_GUARD_DB_TIMEOUT_SECONDS,
+)
+
+# official NPTEL certificates keyed by the QR url that points to them
+verification_pdf_cache = DiskCache(
+    VERIFICATION_PDF_CACHE_PATH,
+    max_bytes=VERIFICATION_PDF_CACHE_MAX_BYTES,
+    ttl_seconds=VERIFICATION_PDF_CACHE_TTL_SECONDS,
+    suffix=".pdf",
+)
+
+# landing page (QR) url -> official PDF url, so a re-download can skip the landing page
+certificate_link_cache: TTLCache[str, str] = TTLCache(
+    max_entries=CERTIFICATE_LINK_CACHE_MAX_ENTRIES,
+    ttl_seconds=CERTIFICATE_LINK_CACHE_TTL_SECONDS,
+)
+
+
+async def get_verification_pdf(qr_code_link: str) -> Tuple[bool, Optional[str], Optional[str], str]:
+    """
+    Return (success, pdf_url, local path, message) for the official certificate behind a QR link,
+    downloading it from NPTEL only when it is not already cached.
+
+    The path is a pin of the cache entry, so eviction by another process can't remove the file
+    while it is being read. Pass it to `release_verification_pdf` when done.
+
+    Raises `OutboundUnavailableError` without calling NPTEL while the circuit breaker is open
+    or the shared rate limit is exhausted, callers should defer the verification.
+    """
+    key = verification_pdf_cache.key_for(qr_code_link)
+
+    entry = await storage_io.run("cache_get", verification_pdf_cache.get, key)
+    if entry and entry.metadata.get('pdf_url'):
+        try:
+            pinned = await storage_io.run("cache_pin", verification_pdf_cache.pin, entry.path)
+        except FileNotFoundError:
+            # evicted since the lookup, download it again
+            logger.info(f"Verification PDF of {qr_code_link} was evicted before it could be pinned")
+        else:
+            metrics.increment("verification_pdf_cache.hits")
+            logger.info(f"Verification PDF cache hit for {qr_code_link}")
+            return True, entry.metadata['pdf_url'], pinned, "Cache hit"
+
+    metrics.increment("verification_pdf_cache.misses")
+
+    await nptel_circuit_breaker.before_call()
+
+    temp_file_name = await storage_io.run("cache_reserve", verification_pdf_cache.reserve)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(qr_code_link, follow_redirects=True, timeout=10)
+        success, pdf_url, output = await download_verification_pdf(qr_code_link, temp_file_name)
+    except OutboundUnavailableError:
+        await storage_io.run("cache_discard", verification_pdf_cache.discard, temp_file_name)
+        raise
+
+    if not success or not pdf_url:
+        await storage_io.run("cache_discard", verification_pdf_cache.discard, temp_file_name)
+        return False, pdf_url, None, output
 
-            if not response or response.status_code != 200:
-                logger.error(f"Failed to fetch the QR code link. Status code: {response.status_code if response else 'No response'}")
-                return False, None, "Failed to fetch the QR code link"
+    # pinned before it is committed, the commit may evict it right away when it is larger than the cache
+    pinned = await storage_io.run("cache_pin", verification_pdf_cache.pin, temp_file_name)
+    await storage_io.run(
+        "cache_commit",
+        verification_pdf_cache.commit,
+        key,
+        temp_file_name,
+        {'qr_url': qr_code_link, 'pdf_url': pdf_url},
+    )
+    return True, pdf_url, pinned, output
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            a_tag = soup.find('a', string="Course Certificate")
 
-            pdf_url = urljoin(str(response.url), a_tag['href'])
+async def release_verification_pdf(path: str) -> None:
+    """Discard a path returned by `get_verification_pdf`, the cache entry itself stays."""
+    await storage_io.run("cache_discard", verification_pdf_cache.discard, path)
 
-            logger.info(f"PDF URL: {pdf_url}")
 
+async def download_verification_pdf(qr_code_link: str, temp_file_name: str) -> Tuple[bool, Optional[str], str]:
+    logger.info(f"Temp file name: {temp_file_name}")
+    try:
+        pdf_url = certificate_link_cache.get(qr_code_link)
+        if pdf_url:
+            metrics.increment("certificate_link_cache.hits")
+        else:
+            metrics.increment("certificate_link_cache.misses")
+            pdf_url, output = await resolve_certificate_link(qr_code_link)
             if not pdf_url:
-                return False, None, "Error finding the 'Course Certificate' button"
+                await nptel_circuit_breaker.record_success()
+                return False, None, output
+            certificate_link_cache.set(qr_code_link, pdf_url)
 
-            pdf_response = await client.get(pdf_url)
+        logger.info(f"PDF URL: {pdf_url}")
 
-            if pdf_response.status_code == 200:
-                with open(temp_file_name, 'wb') as file:
-                    file.write(pdf_response.content)
+        success, output = await stream_pdf_to_file(pdf_url, temp_file_name)
+        if not success:
+            # the link may have gone stale, look it up again next time
+            certificate_link_cache.delete(qr_code_link)
 
-                pdf_filename = temp_file_name
-                logger.info(f"PDF successfully downloaded and saved to {pdf_filename}")
+        # NPTEL answered, even if it was not with the certificate
+        await nptel_circuit_breaker.record_success()
+        return success, pdf_url, output
 
-                return True, pdf_url, "Download successful!"
-            else:
-                logger.error(f"Failed to download PDF. Status code: {pdf_response.status_code}")
-                return False, pdf_url, "Failed to download PDF"
+    except OutboundUnavailableError:
+        raise
+
+    except (httpx.TransportError, NptelServerError) as e:
+        logger.error(f"NPTEL did not respond properly while downloading the verification PDF: {e!r}")
+        await nptel_circuit_breaker.record_failure()
+        return False, None, "NPTEL is not responding, could not download the verification PDF"
 
     except Exception as e:
         logger.error(f"An error occurred while downloading the verification PDF: {e}")
         return False, None, "An error occurred while downloading the verification PDF."
+
+
+async def resolve_certificate_link(qr_code_link: str) -> Tuple[Optional[str], str]:
+    """Find the 'Course Certificate' link on the NPTEL landing page, parsing only as much of it as needed."""
+    client = nptel_http_client.client
+    parser = CertificateLinkParser()
+
+    with metrics.timer("certificate_link.resolve"):
+        async with client.stream("GET", qr_code_link) as response:
+            if response.status_code >= 500:
+                raise NptelServerError(f"{response.status_code} from {qr_code_link}")
+            if response.status_code != 200:
+                logger.error(f"Failed to fetch the QR code link. Status code: {response.status_code}")
+                return None, "Failed to fetch the QR code link"
+
+            size = 0
+            async for text in response.aiter_text():
+                size += len(text)
+                if size > MAX_LANDING_PAGE_SIZE:
+                    logger.error(f"Landing page exceeded {MAX_LANDING_PAGE_SIZE} characters ({qr_code_link})")
+                    break
+
+                # a no-op once the link is found, the rest of the (small) page is still read so that
+                # the connection goes back to the pool instead of being closed mid-body
+                parser.feed(text)
+
+            landing_url = str(response.url)
+
+    if not parser.href:
+        return None, "Error finding the 'Course Certificate' button"
+
+    return urljoin(landing_url, parser.href), "Certificate link found"
+
+
+async def stream_pdf_to_file(pdf_url: str, file_name: str) -> Tuple[bool, str]:
+    """
+    Stream a PDF to disk without holding it in memory.
+
+    The download is abandoned as soon as the response is not a PDF (judged by the
+    content type and the magic bytes of the first chunk) or grows past MAX_VERIFICATION_PDF_SIZE.
+    """
+    client = nptel_http_client.client
+
+    async with client.stream("GET", pdf_url) as pdf_response:
+        if pdf_response.status_code >= 500:
+            raise NptelServerError(f"{pdf_response.status_code} from {pdf_url}")
+        if pdf_response.status_code != 200:
+            logger.error(f"Failed to download PDF. Status code: {pdf_response.status_code}")
+            return False, "Failed to download PDF"
+
+        content_type = pdf_response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in PDF_CONTENT_TYPES:
+            logger.error(f"Verification PDF has unexpected content type {content_type} ({pdf_url})")
+            metrics.increment("verification_pdf_download.rejected_content_type")
+            return False, "Verification link did not return a PDF"
+
+        content_length = pdf_response.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_VERIFICATION_PDF_SIZE:
+            logger.error(f"Verification PDF is {content_length} bytes, over the {MAX_VERIFICATION_PDF_SIZE} byte limit ({pdf_url})")
+            metrics.increment("verification_pdf_download.rejected_size")
+            return False, "Verification PDF is too large"
+
+        size = 0
+        head = b""
+        # the cache is disposable, no need to fsync it
+        file = await storage_io.open(file_name, 'wb')
+        try:
+            async for chunk in pdf_response.aiter_bytes():
+                size += len(chunk)
+                if size > MAX_VERIFICATION_PDF_SIZE:
+                    logger.error(f"Verification PDF exceeded the {MAX_VERIFICATION_PDF_SIZE} byte limit ({pdf_url})")
+                    metrics.increment("verification_pdf_download.rejected_size")
+                    return False, "Verification PDF is too large"
+
+                if len(head) < PDF_MAGIC_SEARCH_BYTES:
+                    head += chunk[:PDF_MAGIC_SEARCH_BYTES - len(head)]
+                    if PDF_MAGIC not in head and len(head) >= PDF_MAGIC_SEARCH_BYTES:
+                        logger.error(f"Verification PDF does not start with a PDF header ({pdf_url})")
+                        metrics.increment("verification_pdf_download.rejected_magic")
+                        return False, "Verification link did not return a PDF"
+
+                await file.write(chunk)
+        finally:
+            await file.close(durable=False)
+
+        if PDF_MAGIC not in head:
+            logger.error(f"Verification PDF does not start with a PDF header ({pdf_url})")
+            metrics.increment("verification_pdf_download.rejected_magic")
+            return False, "Verification link did not return a PDF"
+
+    metrics.increment("verification_pdf_download.bytes", size)
+    logger.info(f"PDF successfully downloaded and saved to {file_name} ({size} bytes)")
+
+    return True, "Download successful!"
@@ -1,23 +1,27 @@
 from typing import Tuple
 
-import fitz
 from app.services.log_service import setup_logger
 
+from .document import CertificateDocument
+
 logger = setup_logger(__name__)
 
+# Bump whenever the parsing below changes, persisted extractions of older versions are then recomputed
+EXTRACTOR_VERSION = 1
+
+# (course_name, student_name, total_marks, roll_no, course_period)
+CertificateInfo = Tuple[str, str, str, str, str] | Tuple[None, None, None, None, None]
+
 
-def extract_text_from_first_page(pdf_path: str) -> str:
-    document = fitz.open(pdf_path)
-    page = document[0]
-    text = page.get_text()
-    return text
+def extract_text_from_first_page(document: CertificateDocument) -> str:
+    return document.page_text(0)
 
 
 def extract_student_info_from_pdf(
-    pdf_path: str,
+    document: CertificateDocument,
     is_subject_name_long: bool = False
-) -> Tuple[str, str, str, str, str] | Tuple[None, None, None, None, None]:
-    text = extract_text_from_first_page(pdf_path)
+) -> CertificateInfo:
+    text = extract_text_from_first_page(document)
     lines = text.splitlines()
 
     offset = 1 if is_subject_name_long else 0
@@ -1,8 +1,111 @@
-from fastapi import UploadFile
+"""
+Content-addressed layout of uploaded certificates.
 
+Every upload is stored once per distinct content, under its SHA-256:
 
-async def save_file_to_local_storage(file: UploadFile, file_path: str) -> None:
-    chunk_size = 1024 * 1024  # 1MB chunks
-    with open(file_path, 'wb') as f:
-        while chunk := await file.read(chunk_size):
-            f.write(chunk)
\ No newline at end of file
+    blobs/ab/cd/abcd...ef.pdf
+
+relative to `CERTIFICATES_FOLDER_PATH`, or to the bucket prefix when certificates
+are kept in S3 (see `app.services.certificate_storage`).
+
+The two levels of shard directories keep each directory small no matter how many
+certificates accumulate. `Certificate.file_url` stays the public name of the file
+(`{request_id}.pdf`, used in the download URLs) and `Certificate.file_hash` maps
+it to its blob. Certificates uploaded before the store existed are still found
+at `{CERTIFICATES_FOLDER_PATH}/{file_url}` until `python -m app.migrate_storage`
+has moved them.
+"""
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import cast
+
+from app.config import config
+
+from .storage_io import fsync_directory, storage_io
+
+CERTIFICATES_FOLDER_PATH = cast(str, config['CERTIFICATES_FOLDER_PATH'])
+BLOBS_FOLDER_NAME = "blobs"
+BLOBS_FOLDER_PATH = os.path.join(CERTIFICATES_FOLDER_PATH, BLOBS_FOLDER_NAME)
+
+HASH_CHUNK_SIZE = 64 * 1024
+STAGING_FILE_PREFIX = ".upload_"
+
+
+@dataclass
+class StagedUpload:
+    """An upload that has been fully received into a temporary file next to its final location."""
+    filename: str
+    temp_path: str
+    size: int
+    sha256: str
+    committed: bool = False
+
+
+def certificate_file_name(request_id: str) -> str:
+    """The public name of a request's certificate, stored in `Certificate.file_url`."""
+    return f"{request_id}.pdf"
+
+
+def blob_key(file_hash: str) -> str:
+    """Location of a blob relative to the root of the store, the same for every storage backend."""
+    return f"{BLOBS_FOLDER_NAME}/{file_hash[:2]}/{file_hash[2:4]}/{file_hash}.pdf"
+
+
+def blob_path(file_hash: str) -> str:
+    return os.path.join(CERTIFICATES_FOLDER_PATH, blob_key(file_hash))
+
+
+def legacy_file_path(file_url: str) -> str:
+    return os.path.join(CERTIFICATES_FOLDER_PATH, file_url)
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def commit_blob(source_path: str, file_hash: str) -> bool:
+    """
+    Move `source_path` into the blob for `file_hash`, returns False when an identical
+    blob was already stored (the source is removed then).
+
+    The source must be on the same filesystem as the store, e.g. a staging file.
+    """
+    destination = blob_path(file_hash)
+    shard = os.path.dirname(destination)
+    os.makedirs(shard, exist_ok=True)
+
+    if os.path.exists(destination):
+        os.remove(source_path)
+        # the blob may be unreferenced, keep `migrate_storage --prune` from removing it before it is recorded
+        os.utime(destination)
+        return False
+
+    # two identical uploads racing here both rename the same content into place
+    os.replace(source_path, destination)
+    if storage_io.fsync_policy == 'full':
+        fsync_directory(shard)
+    return True
+
+
+def _create_staging_file(directory: str) -> str:
+    # same directory (and so the same filesystem) as the final file, which makes the rename atomic
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=STAGING_FILE_PREFIX, suffix=".pdf")
+    os.close(fd)
+    return temp_path
+
+
+async def create_staging_file(directory: str) -> str:
+    return await storage_io.run("create_staging_file", _create_staging_file, directory)
+
+
+async def discard_staged_upload(upload: StagedUpload) -> None:
+    if upload.committed:
+        return
+    await storage_io.remove(upload.temp_path)
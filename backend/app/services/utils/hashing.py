@@ -1,11 +1,35 @@
+from typing import List, Optional, Tuple
+
 from passlib.context import CryptContext
+from passlib.hash import bcrypt
+
+# interactive cost, hashes below it (e.g. set by bulk provisioning) are re-hashed on the next login
+PASSWORD_BCRYPT_ROUNDS = 12
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_rounds=PASSWORD_BCRYPT_ROUNDS,
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+def generate_password_hash(password: str, rounds: Optional[int] = None) -> str:
+    if rounds is None:
+        return pwd_context.hash(password)
+    # the handler itself, the context would raise the cost to its minimum
+    return bcrypt.using(rounds=rounds).hash(password)
 
-def generate_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+
+def generate_password_hashes(passwords: List[str], rounds: Optional[int] = None) -> List[str]:
+    """Hash a chunk of passwords, submitted to the hashing process pool as a single task."""
+    return [generate_password_hash(password, rounds) for password in passwords]
 
 
 def verify_password_hash(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password_hash(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify, and return a new hash at the current cost when the stored one is below it."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
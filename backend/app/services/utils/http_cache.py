@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional
+
+from starlette.datastructures import Headers
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _entity_tags(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _opaque_tag(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(headers: Headers, etag: str, last_modified: datetime) -> bool:
+    """Whether a GET with these headers can be answered with 304 (RFC 9110, section 13.2.2)."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # weak comparison, If-Modified-Since is ignored when If-None-Match is sent
+        if if_none_match.strip() == "*":
+            return True
+        return any(_opaque_tag(tag) == _opaque_tag(etag) for tag in _entity_tags(if_none_match))
+
+    if_modified_since = _parse_http_date(headers.get("if-modified-since"))
+    if if_modified_since is None:
+        return False
+    return last_modified.replace(microsecond=0) <= if_modified_since
+
+
+def is_range_fresh(headers: Headers, etag: str, last_modified: datetime) -> bool:
+    """Whether a `Range` header applies, i.e. its `If-Range` (if any) still matches the file."""
+    if_range = headers.get("if-range")
+    if not if_range:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # strong comparison, a weak tag never matches
+        return not etag.startswith("W/") and if_range == etag
+
+    since = _parse_http_date(if_range)
+    return since is not None and since == last_modified.replace(microsecond=0)
@@ -0,0 +1,112 @@
+import importlib.util
+from typing import Any, Dict
+
+import httpx
+
+from app.config import config
+from app.database.core import AsyncSessionLocal
+from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.outbound import SharedRateLimiter
+
+from .throttle import TokenBucket
+
+logger = setup_logger(__name__)
+
+NPTEL_HTTP_MAX_CONNECTIONS = int(config.get('NPTEL_HTTP_MAX_CONNECTIONS') or 20)
+NPTEL_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(config.get('NPTEL_HTTP_MAX_KEEPALIVE_CONNECTIONS') or 10)
+NPTEL_HTTP_KEEPALIVE_EXPIRY_SECONDS = float(config.get('NPTEL_HTTP_KEEPALIVE_EXPIRY_SECONDS') or 30)
+NPTEL_HTTP_CONNECT_TIMEOUT_SECONDS = float(config.get('NPTEL_HTTP_CONNECT_TIMEOUT_SECONDS') or 5)
+NPTEL_HTTP_READ_TIMEOUT_SECONDS = float(config.get('NPTEL_HTTP_READ_TIMEOUT_SECONDS') or 10)
+NPTEL_HTTP_WRITE_TIMEOUT_SECONDS = float(config.get('NPTEL_HTTP_WRITE_TIMEOUT_SECONDS') or 10)
+NPTEL_HTTP_POOL_TIMEOUT_SECONDS = float(config.get('NPTEL_HTTP_POOL_TIMEOUT_SECONDS') or 5)
+NPTEL_HTTP2 = (config.get('NPTEL_HTTP2') or '').lower() in ('1', 'true', 'yes')
+# politeness limit towards nptel.ac.in shared by every process, 0 disables it
+NPTEL_REQUESTS_PER_SECOND = float(config.get('NPTEL_REQUESTS_PER_SECOND') or 5)
+NPTEL_REQUEST_BURST = int(config.get('NPTEL_REQUEST_BURST') or 5)
+# per process limit used while the shared one (Postgres) cannot be reached
+NPTEL_FALLBACK_REQUESTS_PER_SECOND = float(config.get('NPTEL_FALLBACK_REQUESTS_PER_SECOND') or 1)
+NPTEL_RATE_LIMIT_MAX_WAIT_SECONDS = float(config.get('NPTEL_RATE_LIMIT_MAX_WAIT_SECONDS') or 30)
+OUTBOUND_GUARD_DB_TIMEOUT_SECONDS = float(config.get('OUTBOUND_GUARD_DB_TIMEOUT_SECONDS') or 1)
+
+nptel_rate_limiter = SharedRateLimiter(
+    "nptel",
+    AsyncSessionLocal,
+    rate=NPTEL_REQUESTS_PER_SECOND,
+    burst=NPTEL_REQUEST_BURST,
+    fallback=TokenBucket(NPTEL_FALLBACK_REQUESTS_PER_SECOND, NPTEL_REQUEST_BURST),
+    max_wait_seconds=NPTEL_RATE_LIMIT_MAX_WAIT_SECONDS,
+    db_timeout_seconds=OUTBOUND_GUARD_DB_TIMEOUT_SECONDS,
+)
+
+
+async def _trace(event_name: str, info: Dict[str, Any]) -> None:
+    # httpcore only connects (and handshakes) when no idle keep-alive connection is available
+    if event_name == "connection.connect_tcp.complete":
+        metrics.increment("nptel_http.connections_opened")
+    elif event_name == "connection.start_tls.complete":
+        metrics.increment("nptel_http.tls_handshakes")
+
+
+async def _on_request(request: httpx.Request) -> None:
+    waited = await nptel_rate_limiter.acquire()
+    if waited:
+        metrics.observe("nptel_http.rate_limit_wait", waited)
+    metrics.increment("nptel_http.requests")
+    request.extensions["trace"] = _trace
+
+
+class NptelHttpClient:
+    """
+    A process wide `httpx.AsyncClient` for calls to nptel.ac.in.
+
+    Sharing one client keeps connections alive between verifications, so DNS,
+    TCP and TLS setup are paid once per connection instead of once per request.
+    The app lifespan (and the verification worker) own its lifecycle.
+    """
+
+    def __init__(self) -> None:
+        self._client: httpx.AsyncClient | None = None
+
+    def start(self) -> None:
+        if self._client is not None:
+            return
+
+        http2 = NPTEL_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("NPTEL_HTTP2 is enabled but the `h2` package is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=NPTEL_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=NPTEL_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=NPTEL_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(
+                connect=NPTEL_HTTP_CONNECT_TIMEOUT_SECONDS,
+                read=NPTEL_HTTP_READ_TIMEOUT_SECONDS,
+                write=NPTEL_HTTP_WRITE_TIMEOUT_SECONDS,
+                pool=NPTEL_HTTP_POOL_TIMEOUT_SECONDS,
+            ),
+            event_hooks={'request': [_on_request]},
+        )
+        logger.info(f"NPTEL HTTP client started (http2={http2})")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("NPTEL HTTP client closed")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self.start()
+        assert self._client is not None
+        return self._client
+
+
+nptel_http_client = NptelHttpClient()
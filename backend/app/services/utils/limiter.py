@@ -1,9 +1,30 @@
+import hashlib
+from typing import AsyncIterator, cast
+
 from fastapi import UploadFile, HTTPException
 import magic  # python-magic library for file type detection
 
+from app.config import config
+
+from .file_storage import StagedUpload, create_staging_file, discard_staged_upload
+from .storage_io import storage_io
+
 MAX_FILE_SIZE = 2 * 1024 * 1024  # 2MB
+MAGIC_SNIFF_BYTES = 8192  # libmagic only needs the start of the file
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+CERTIFICATES_FOLDER_PATH = config['CERTIFICATES_FOLDER_PATH']
+
 
-async def process_upload(file: UploadFile) -> UploadFile:
+async def process_upload(file: UploadFile) -> AsyncIterator[StagedUpload]:
+    """
+    Validate the upload and stage it in the certificates volume in a single pass.
+
+    The content type is sniffed from the first bytes, the size is enforced and the
+    SHA-256 computed while the file is copied into a temporary file. The route stores
+    it with `certificate_storage.store`, a staged file that was not moved into the
+    store is removed once the request is done.
+    """
     # 1. Check file extension first
     filename = file.filename
     if not filename or not filename.lower().endswith('.pdf'):
@@ -11,33 +32,53 @@ async def process_upload(file: UploadFile) -> UploadFile:
             status_code=400,
             detail="Only PDF files are allowed. Please upload a file with .pdf extension."
         )
-    
-    # 2. Read the first chunk to check the actual file content
-    first_chunk = await file.read(8192)  # Read first 8KB for content type detection
-    
-    # 3. Use python-magic to check file signature/magic bytes
-    mime_type = magic.from_buffer(first_chunk, mime=True)
+
+    temp_path = await create_staging_file(cast(str, CERTIFICATES_FOLDER_PATH))
+    upload = StagedUpload(filename=filename, temp_path=temp_path, size=0, sha256="")
+
+    try:
+        sha256 = hashlib.sha256()
+        head = b""
+
+        f = await storage_io.open(temp_path, 'wb')
+        received = False
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                upload.size += len(chunk)
+                if upload.size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size is {MAX_FILE_SIZE / 1024 / 1024:.2f} MB."
+                    )
+
+                # 2. Use python-magic to check file signature/magic bytes
+                if len(head) < MAGIC_SNIFF_BYTES:
+                    head += chunk[:MAGIC_SNIFF_BYTES - len(head)]
+                    if len(head) >= MAGIC_SNIFF_BYTES:
+                        check_pdf_signature(head)
+
+                sha256.update(chunk)
+                await f.write(chunk)
+            received = True
+        finally:
+            # fsync (per STORAGE_FSYNC) before the route renames it into place, a rejected upload is thrown away
+            await f.close(durable=received)
+
+        if len(head) < MAGIC_SNIFF_BYTES:
+            check_pdf_signature(head)
+
+        upload.sha256 = sha256.hexdigest()
+        yield upload
+
+    finally:
+        await discard_staged_upload(upload)
+
+
+def check_pdf_signature(head: bytes) -> None:
+    mime_type = magic.from_buffer(head, mime=True)
     if mime_type != 'application/pdf':
         raise HTTPException(
             status_code=400,
             detail=f"Invalid file content. The file doesn't appear to be a PDF (detected: {mime_type})."
         )
-    
-    # 4. Reset file position for complete processing
-    await file.seek(0)
-    
-    # 5. Process the entire file from the beginning
-    file_size = 0  # Start fresh with the size count
-    chunk_size = 1024 * 1024  # 1MB chunks
-    
-    # Process all chunks from the beginning
-    while chunk := await file.read(chunk_size):
-        file_size += len(chunk)
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"File too large. Maximum size is {MAX_FILE_SIZE / 1024 / 1024:.2f} MB."
-            )
-    
-    await file.seek(0)  # Reset file position for further processing if needed
-    return file
+
@@ -0,0 +1,63 @@
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+CERTIFICATE_LINK_TEXT = "Course Certificate"
+
+
+class _LinkFound(Exception):
+    pass
+
+
+class CertificateLinkParser(HTMLParser):
+    """
+    Incrementally scans HTML for the first `<a>` whose text is `link_text`.
+
+    Unlike a full BeautifulSoup parse no tree is built, and feeding stops at the
+    first match, so the rest of the page is never parsed.
+    """
+
+    def __init__(self, link_text: str = CERTIFICATE_LINK_TEXT):
+        super().__init__(convert_charrefs=True)
+        self.link_text = link_text
+        self.href: Optional[str] = None
+        self._anchor_href: Optional[str] = None
+        self._anchor_text: List[str] = []
+        self._in_anchor = False
+
+    @property
+    def found(self) -> bool:
+        return self.href is not None
+
+    def feed(self, data: str) -> None:
+        if self.found:
+            return
+        try:
+            super().feed(data)
+        except _LinkFound:
+            pass
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag != "a":
+            return
+        self._in_anchor = True
+        self._anchor_href = dict(attrs).get("href")
+        self._anchor_text = []
+
+    def handle_data(self, data: str) -> None:
+        if self._in_anchor:
+            self._anchor_text.append(data)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag != "a" or not self._in_anchor:
+            return
+        self._in_anchor = False
+        if self._anchor_href and "".join(self._anchor_text).strip() == self.link_text:
+            self.href = self._anchor_href
+            raise _LinkFound()
+
+
+def find_certificate_link(html: str, link_text: str = CERTIFICATE_LINK_TEXT) -> Optional[str]:
+    parser = CertificateLinkParser(link_text)
+    parser.feed(html)
+    return parser.href
+
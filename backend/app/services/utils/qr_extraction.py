@@ -1,36 +1,153 @@
-import pdfplumber
-from PIL import Image
+import time
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+import fitz
 from pyzbar.pyzbar import decode
-import tempfile
+
+from app.config import config
 from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+
+from .document import CertificateDocument, GrayscaleRaster, ImagePlacement
 
 logger = setup_logger(__name__)
 
-def extract_qr_code(pdf_path: str, page_number: int, output_image_path: str) -> None:
-    with pdfplumber.open(pdf_path) as pdf:
-        page = pdf.pages[page_number]
-        im = page.to_image(resolution=150)
-        im.save(output_image_path)
+VERIFICATION_LINK_PREFIX = "https://nptel.ac.in/"
+
+# area of the page (fractions of its width and height: x0,y0,x1,y1) searched when no embedded image holds the QR
+QR_SEARCH_REGION = tuple(float(v) for v in (config.get('QR_SEARCH_REGION') or '0,0.5,1,1').split(','))
+QR_REGION_RESOLUTION = int(config.get('QR_REGION_RESOLUTION') or 200)
+# the last resort, the whole page is rendered at each of these in turn
+QR_RENDER_RESOLUTIONS = [int(v) for v in (config.get('QR_RENDER_RESOLUTIONS') or '150,300').split(',')]
+
+# embedded images outside these bounds (in pixels) are not tried, e.g. logos, signatures and backgrounds
+QR_MIN_IMAGE_SIZE = 21
+QR_MAX_IMAGE_SIZE = 2048
+QR_MAX_ASPECT_RATIO_DEVIATION = 0.15
+# small images are upscaled before decoding, zbar needs a few pixels per module
+QR_MIN_DECODE_SIZE = 200
+# white margin added around embedded images, zbar needs a quiet zone around the code
+QR_QUIET_ZONE = 16
+# margin added around an image's placement when its area of the page is rendered
+QR_CLIP_MARGIN = 0.1
+
+QRStrategy = Callable[[CertificateDocument, int], Iterator[GrayscaleRaster]]
+
+
+def _looks_like_qr(image: ImagePlacement) -> bool:
+    if not QR_MIN_IMAGE_SIZE <= min(image.width, image.height) <= max(image.width, image.height) <= QR_MAX_IMAGE_SIZE:
+        return False
+    return abs(image.width - image.height) <= QR_MAX_ASPECT_RATIO_DEVIATION * max(image.width, image.height)
+
+
+def _qr_images(document: CertificateDocument, page_number: int) -> List[ImagePlacement]:
+    images = []
+    seen: Set[int] = set()
+    for image in document.image_placements(page_number):
+        if image.xref not in seen and _looks_like_qr(image):
+            seen.add(image.xref)
+            images.append(image)
+    return images
+
+
+def _with_quiet_zone(raster: GrayscaleRaster, border: int) -> GrayscaleRaster:
+    pixels, width, height = raster
+    padded_width = width + 2 * border
+    blank_rows = b"\xff" * (padded_width * border)
+    side = b"\xff" * border
+
+    rows = [blank_rows]
+    for y in range(height):
+        rows.append(side + pixels[y * width:(y + 1) * width] + side)
+    rows.append(blank_rows)
+    return b"".join(rows), padded_width, height + 2 * border
+
+
+def embedded_images(document: CertificateDocument, page_number: int) -> Iterator[GrayscaleRaster]:
+    """Decode the page's image XObjects directly, NPTEL certificates embed the QR as one."""
+    for image in _qr_images(document, page_number):
+        try:
+            raster = document.extract_image_grayscale(image.xref, QR_MIN_DECODE_SIZE)
+        except (RuntimeError, ValueError) as e:
+            # e.g. an image filter MuPDF can't decode on its own, the page render still can
+            logger.debug(f"Could not extract image {image.xref}: {e}")
+            continue
+        yield _with_quiet_zone(raster, QR_QUIET_ZONE)
+
+
+def region_renders(document: CertificateDocument, page_number: int) -> Iterator[GrayscaleRaster]:
+    """Render only where the QR is likely to be: around QR-like images, then the configured search region."""
+    page = document.page_rect(page_number)
+    clips = []
+
+    for image in _qr_images(document, page_number):
+        bbox = image.bbox
+        margin = QR_CLIP_MARGIN * max(bbox.width, bbox.height)
+        clips.append((bbox + (-margin, -margin, margin, margin)) & page)
+
+    x0, y0, x1, y1 = QR_SEARCH_REGION
+    clips.append(fitz.Rect(
+        page.x0 + x0 * page.width,
+        page.y0 + y0 * page.height,
+        page.x0 + x1 * page.width,
+        page.y0 + y1 * page.height,
+    ))
+
+    for clip in clips:
+        if not clip.is_empty:
+            yield document.render_clip_grayscale(page_number, clip, QR_REGION_RESOLUTION)
+
+
+def full_page_renders(document: CertificateDocument, page_number: int) -> Iterator[GrayscaleRaster]:
+    for resolution in QR_RENDER_RESOLUTIONS:
+        yield document.render_page_grayscale(page_number, resolution)
+
+
+# cheapest first, each is only tried when the previous ones found no verification link
+QR_STRATEGIES: List[Tuple[str, QRStrategy]] = [
+    ("embedded_image", embedded_images),
+    ("region_render", region_renders),
+    ("full_page_render", full_page_renders),
+]
+
+
+def decode_qr_codes(raster: GrayscaleRaster) -> List[str]:
+    return [decoded.data.decode("utf-8") for decoded in decode(raster)]
+
+
+def decode_qr_code(raster: GrayscaleRaster) -> str | None:
+    decoded = decode_qr_codes(raster)
+    return decoded[0] if decoded else None
+
+
+def _find_link(
+    document: CertificateDocument, page_number: int, strategy: QRStrategy, invalid: List[str]
+) -> Optional[str]:
+    for raster in strategy(document, page_number):
+        for data in decode_qr_codes(raster):
+            if data.startswith(VERIFICATION_LINK_PREFIX):
+                return data
+            invalid.append(data)
+    return None
 
 
-def decode_qr_code(image_path: str) -> str | None:
-    with open(image_path, "rb") as image_file:
-        image = Image.open(image_file)
-        decoded_objects = decode(image)
-        if decoded_objects:
-            return decoded_objects[0].data.decode("utf-8")
-        else:
-            return None
+def extract_link(document: CertificateDocument, page_number: int) -> str | None:
+    # these metrics are recorded in the process pool and carried back with the result
+    invalid: List[str] = []
 
+    for name, strategy in QR_STRATEGIES:
+        started_at = time.perf_counter()
+        link = _find_link(document, page_number, strategy, invalid)
+        metrics.observe(f"qr_extraction.{name}", time.perf_counter() - started_at)
 
-def extract_link(pdf_path: str, page_number: int) -> str | None:
-    with tempfile.NamedTemporaryFile(mode='w+', delete=True, suffix=".png", prefix="qr_code_") as temp_f:
-        output_image_path = temp_f.name
-        extract_qr_code(pdf_path, page_number, output_image_path)
-        qr_code_data = decode_qr_code(output_image_path)
+        if link:
+            metrics.increment(f"qr_extraction.found.{name}")
+            logger.info("Decoded QR Code Data (%s): %s", name, link)
+            return link
 
-        if qr_code_data and qr_code_data.startswith("https://nptel.ac.in/"):
-            logger.info("Decoded QR Code Data: %s", qr_code_data)
-            return qr_code_data
+    metrics.increment("qr_extraction.not_found")
+    if invalid:
         logger.warning("| Not Valid QR CODE DATA |")
-        return None
+    else:
+        logger.warning("| QR CODE NOT FOUND |")
+    return None
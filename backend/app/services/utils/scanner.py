@@ -0,0 +1,26 @@
+from typing import Optional, Tuple
+
+from .document import CertificateDocument
+from .extractor import CertificateInfo, extract_student_info_from_pdf
+from .qr_extraction import extract_link
+
+# These functions are submitted to the verification process pool, so they
+# only take picklable arguments and open the PDF inside the worker process.
+
+
+def scan_certificate(pdf_path: str, is_subject_name_long: bool = False) -> Tuple[Optional[str], CertificateInfo]:
+    """Decode the verification link and extract the student details with a single open of the PDF."""
+    with CertificateDocument.open(pdf_path) as document:
+        verification_link = extract_link(document, 0)
+        certificate_info = extract_student_info_from_pdf(document, is_subject_name_long)
+    return verification_link, certificate_info
+
+
+def read_certificate_info(pdf_path: str, is_subject_name_long: bool = False) -> CertificateInfo:
+    with CertificateDocument.open(pdf_path) as document:
+        return extract_student_info_from_pdf(document, is_subject_name_long)
+
+
+def read_verification_link(pdf_path: str) -> Optional[str]:
+    with CertificateDocument.open(pdf_path) as document:
+        return extract_link(document, 0)
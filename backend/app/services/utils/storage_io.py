@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Callable, TypeVar
+
+from app.config import config
+from app.services.metrics import metrics
+
+T = TypeVar("T")
+
+STORAGE_IO_THREADS = int(config.get('STORAGE_IO_THREADS') or 8)
+# none: leave flushing to the OS
+# file: fsync file contents before they are renamed into place
+# full: also fsync the directory, so the rename itself survives a crash
+STORAGE_FSYNC = (config.get('STORAGE_FSYNC') or 'file').lower()
+
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+
+class StorageIO:
+    """
+    Runs blocking filesystem calls on a bounded thread pool.
+
+    The certificates folder is a bind mount that can be slow, a blocking `open` or
+    `write` on the event loop would stall every request served by the worker. The
+    pool bounds how many threads can be stuck on the volume at once. Each
+    operation's latency (and the time spent waiting for a thread) is recorded
+    under `storage.<operation>` in the metrics.
+    """
+
+    def __init__(self, max_workers: int, fsync_policy: str):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"STORAGE_FSYNC must be one of {', '.join(FSYNC_POLICIES)}, got {fsync_policy!r}")
+
+        self.max_workers = max_workers
+        self.fsync_policy = fsync_policy
+        self.executor: ThreadPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="storage-io")
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run(self, operation: str, fn: Callable[..., T], *args: Any) -> T:
+        if self.executor is None:
+            self.start()
+
+        submitted_at = time.perf_counter()
+
+        def timed() -> T:
+            started_at = time.perf_counter()
+            metrics.observe("storage.queue_wait", started_at - submitted_at)
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe(f"storage.{operation}", time.perf_counter() - started_at)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, timed)
+
+    async def exists(self, path: str) -> bool:
+        return await self.run("exists", os.path.exists, path)
+
+    async def remove(self, path: str) -> None:
+        await self.run("remove", _remove_if_exists, path)
+
+    async def open(self, path: str, mode: str) -> "AsyncFile":
+        return AsyncFile(self, await self.run("open", open, path, mode))
+
+    async def replace(self, source: str, destination: str, durable: bool = True) -> None:
+        """Atomically rename `source` to `destination`, honouring the fsync policy when `durable`."""
+        await self.run("replace", self._replace, source, destination, durable)
+
+    def _replace(self, source: str, destination: str, durable: bool) -> None:
+        os.replace(source, destination)
+        if durable and self.fsync_policy == 'full':
+            fsync_directory(os.path.dirname(destination) or ".")
+
+    def fsync_file(self, file: IO[Any]) -> None:
+        file.flush()
+        os.fsync(file.fileno())
+
+
+class AsyncFile:
+    """A file opened through `StorageIO`, every call runs on the storage threads."""
+
+    def __init__(self, storage: StorageIO, file: IO[Any]):
+        self.storage = storage
+        self.file = file
+
+    async def write(self, data: bytes) -> None:
+        await self.storage.run("write", self.file.write, data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return await self.storage.run("read", self.file.read, size)
+
+    async def seek(self, offset: int) -> None:
+        await self.storage.run("seek", self.file.seek, offset)
+
+    async def close(self, durable: bool = True) -> None:
+        """Close the file, fsyncing it first when `durable` and the policy asks for it."""
+        await self.storage.run("close", self._close, durable)
+
+    def _close(self, durable: bool) -> None:
+        try:
+            if durable and self.storage.fsync_policy != 'none':
+                self.storage.fsync_file(self.file)
+        finally:
+            self.file.close()
+
+
+def _remove_if_exists(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+storage_io = StorageIO(STORAGE_IO_THREADS, STORAGE_FSYNC)
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    An asyncio token bucket: `rate` tokens are added per second, up to `burst`.
+
+    `acquire` waits until a token is available, callers are served in the order
+    they arrive because the bucket is guarded by a single lock.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # created lazily, the bucket may be instantiated before an event loop exists
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """Take one token, returns the number of seconds spent waiting for it."""
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= 1
+        return waited
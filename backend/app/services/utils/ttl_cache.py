@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    A small in-process LRU cache whose entries expire after `ttl_seconds`.
+
+    Each process (gunicorn worker, verification worker) has its own copy, so it
+    is only suitable for values that are cheap to recompute and safe to serve
+    slightly stale.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl_seconds: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
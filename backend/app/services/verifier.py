@@ -1,33 +1,70 @@
+import asyncio
+import math
 from fastapi import HTTPException, status
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import Tuple, Optional, cast, Dict
 
 from app.config import config
-from app.database.models import Request, RequestStatus, Certificate, StudentSubjectEnrollment
+from app.database.models import Request, RequestStatus, Certificate, CertificateExtraction, StudentSubjectEnrollment
 from app.services.log_service import setup_logger
+from app.services.metrics import metrics
+from app.services.outbound import OutboundUnavailableError
 
-from .utils.qr_extraction import extract_link
-from .utils.downloader import download_verification_pdf
-from .utils.extractor import extract_student_info_from_pdf
-
-import tempfile
+from .executor import verification_executor
+from .utils.downloader import get_verification_pdf, release_verification_pdf
+from .utils.extractor import CertificateInfo, EXTRACTOR_VERSION
+from .utils.scanner import read_certificate_info, scan_certificate
 
 logger = setup_logger(__name__)
 
 COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT = 57
 COURSE_PERIOD_YEAR = config['COURSE_PERIOD_YEAR']
 
+
+def build_certificate_data(extraction: CertificateExtraction, uploaded_file_url: str) -> Dict:
+    """Shape a stored extraction the way the review screens expect it."""
+    return {
+        "uploaded_certificate": {
+            "student_name": extraction.uploaded_student_name,
+            "roll_no": extraction.uploaded_roll_no,
+            "marks": extraction.uploaded_total_marks,
+            "course_name": extraction.uploaded_course_name,
+            "course_period": extraction.uploaded_course_period,
+            "file_url": uploaded_file_url,
+        },
+        "verification_certificate": {
+            "student_name": extraction.verification_student_name,
+            "roll_no": extraction.verification_roll_no,
+            "marks": extraction.verification_total_marks,
+            "course_name": extraction.verification_course_name,
+            "course_period": extraction.verification_course_period,
+            "file_url": extraction.verification_file_url,
+        },
+    }
+
+
 class Verifier:
-    def __init__(self, uploaded_file_path_relative: str, uploaded_file_path: str, request_id: str, student_id: str, db: Session):
+    def __init__(
+        self,
+        uploaded_file_path_relative: str,
+        uploaded_file_path: str,
+        request_id: str,
+        student_id: str,
+        db: Session,
+        file_hash: Optional[str] = None,
+    ):
         self.uploaded_file_path_relative = uploaded_file_path_relative
         self.uploaded_file_path = uploaded_file_path
         self.request_id = request_id
         self.student_id = student_id
         self.db = db
+        self.file_hash = file_hash
         self.verification_filename = None
     
-    async def start_verification(self) -> None:
+    def prepare_verification(self) -> Tuple[Request, Certificate]:
+        """Validate the request, move it to processing and record the uploaded certificate."""
         # update db request status to processing
         db_request = self.db.query(Request).filter(
             Request.id == self.request_id,
@@ -64,9 +101,17 @@ class Verifier:
                 request_id=self.request_id,
                 student_id=self.student_id,
                 file_url=self.uploaded_file_path_relative,
+                file_hash=self.file_hash,
                 verified=False,
             )
             self.db.add(db_certificate)
+        else:
+            if db_certificate.extraction is not None and (
+                self.file_hash is None or db_certificate.file_hash != self.file_hash
+            ):
+                # fields parsed from the previous upload no longer describe this one
+                self.db.delete(db_certificate.extraction)
+            db_certificate.file_hash = self.file_hash
 
         try:
             self.db.commit()
@@ -77,64 +122,178 @@ class Verifier:
             self.update_status_to_error(db_request, db_certificate, "An internal server error occurred")
             raise e
 
-        verification_link = extract_link(self.uploaded_file_path, 0)
+        return db_request, db_certificate
+
+    async def run_verification(self, db_request: Request, db_certificate: Certificate) -> None:
+        """
+        Decode the QR, fetch the official certificate from NPTEL and compare both documents.
+
+        The session is used from the threadpool, so several verifications can run on one event loop.
+        """
+        subject_name = db_request.student_subject_enrollment.teacher_subject_allotment.subject.name
+        is_subject_name_long = isinstance(subject_name, str) and (
+            len(subject_name.strip()) > COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT
+        )
+
+        # QR rendering, decoding and text extraction are CPU bound, run them off the event loop
+        verification_link, uploaded_info = await verification_executor.run(
+            scan_certificate, self.uploaded_file_path, is_subject_name_long
+        )
         if not verification_link:
-            self.update_status_to_rejected(db_request, db_certificate, "Verification link / QR not found")
+            await run_in_threadpool(
+                self.update_status_to_rejected, db_request, db_certificate, "Verification link / QR not found"
+            )
             return
 
-        with tempfile.NamedTemporaryFile(mode='w+', delete=True, suffix=".pdf", prefix="certificate_") as temp_f:
-            logger.info(f"Temporary file created at: {temp_f.name}")
-            success, pdf_url, output = await download_verification_pdf(verification_link, temp_f.name)
+        success, pdf_url, verification_file_path, output = await get_verification_pdf(verification_link)
 
-            if not success:
-                remark =  "Could not download the verification pdf"
-                self.update_status_to_error(db_request, db_certificate, remark)
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=remark)
+        if not success or not verification_file_path:
+            remark =  "Could not download the verification pdf"
+            await run_in_threadpool(self.update_status_to_error, db_request, db_certificate, remark)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=remark)
 
-            db_certificate.verification_file_url = pdf_url
+        # the official PDF is parsed in the pool while its url is recorded
+        verification_info, _ = await asyncio.gather(
+            self.read_verification_info(verification_file_path, is_subject_name_long),
+            run_in_threadpool(self.record_verification_file_url, db_request, db_certificate, pdf_url),
+        )
 
-            self.db.commit()
-            self.db.refresh(db_request)
-            self.db.refresh(db_certificate)
-            
-
-            success, output, verified_roll_no, verified_total_marks = self.verify_file(
-                verification_file_path=temp_f.name,
-                subject_name=cast(
-                    str, db_request.student_subject_enrollment.teacher_subject_allotment.subject.name
-                ),
-                student_name=cast(str, db_request.student_subject_enrollment.student.name),
-                course_period_year=COURSE_PERIOD_YEAR,
-                is_subject_name_long=isinstance(
-                    db_request.student_subject_enrollment.teacher_subject_allotment.subject.name, str
-                ) and (
-                    len(db_request.student_subject_enrollment.teacher_subject_allotment.subject.name.strip()) 
-                    > COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT
-                )
+        await run_in_threadpool(
+            self.save_extraction,
+            db_certificate,
+            qr_url=verification_link,
+            verification_file_url=pdf_url,
+            is_subject_name_long=is_subject_name_long,
+            uploaded_info=uploaded_info,
+            verification_info=verification_info,
+        )
+
+        await run_in_threadpool(self.decide, db_request, db_certificate, uploaded_info, verification_info)
+
+    def record_verification_file_url(
+        self, db_request: Request, db_certificate: Certificate, pdf_url: Optional[str]
+    ) -> None:
+        db_certificate.verification_file_url = pdf_url
+
+        self.db.commit()
+        self.db.refresh(db_request)
+        self.db.refresh(db_certificate)
+
+    async def read_verification_info(self, verification_file_path: str, is_subject_name_long: bool) -> CertificateInfo:
+        try:
+            return await verification_executor.run(read_certificate_info, verification_file_path, is_subject_name_long)
+        finally:
+            await release_verification_pdf(verification_file_path)
+
+    def get_certificate(self) -> Optional[Certificate]:
+        return self.db.query(Certificate).filter(Certificate.request_id == self.request_id).first()
+
+    def find_memoized_extraction(self, is_subject_name_long: bool) -> Optional[CertificateExtraction]:
+        """A complete extraction of a byte-identical upload made with the current extractor, if any."""
+        if not self.file_hash:
+            return None
+
+        return self.db.query(CertificateExtraction).join(
+            Certificate, CertificateExtraction.certificate_id == Certificate.id
+        ).filter(
+            Certificate.file_hash == self.file_hash,
+            CertificateExtraction.extractor_version == EXTRACTOR_VERSION,
+            CertificateExtraction.is_subject_name_long == is_subject_name_long,
+            CertificateExtraction.qr_url.isnot(None),
+            CertificateExtraction.verification_file_url.isnot(None),
+        ).order_by(
+            CertificateExtraction.updated_at.desc()
+        ).first()
+
+    def run_memoized_verification(self, db_request: Request, db_certificate: Certificate) -> bool:
+        """
+        Decide from the stored extraction of an identical upload, without rendering the PDF or calling NPTEL.
+
+        Returns False when there is nothing to reuse. The comparison itself is re-run, the
+        decision depends on the request (student and subject) and not only on the file.
+        """
+        subject_name = db_request.student_subject_enrollment.teacher_subject_allotment.subject.name
+        is_subject_name_long = isinstance(subject_name, str) and (
+            len(subject_name.strip()) > COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT
+        )
+
+        memo = self.find_memoized_extraction(is_subject_name_long)
+        if memo is None:
+            metrics.increment("verification.memo_misses")
+            return False
+
+        metrics.increment("verification.memo_hits")
+        logger.info(f"Reusing extraction {memo.id} for request {self.request_id}, the upload is identical")
+
+        uploaded_info = cast(CertificateInfo, (
+            memo.uploaded_course_name,
+            memo.uploaded_student_name,
+            memo.uploaded_total_marks,
+            memo.uploaded_roll_no,
+            memo.uploaded_course_period,
+        ))
+        verification_info = cast(CertificateInfo, (
+            memo.verification_course_name,
+            memo.verification_student_name,
+            memo.verification_total_marks,
+            memo.verification_roll_no,
+            memo.verification_course_period,
+        ))
+
+        db_certificate.verification_file_url = memo.verification_file_url
+        if memo.certificate_id != db_certificate.id:
+            self.save_extraction(
+                db_certificate,
+                qr_url=cast(str, memo.qr_url),
+                verification_file_url=cast(str, memo.verification_file_url),
+                is_subject_name_long=is_subject_name_long,
+                uploaded_info=uploaded_info,
+                verification_info=verification_info,
             )
 
-            if not success:
-                # Check if it's a name mismatch issue   
-                if "Student name mismatch - under review" in output:
-                    self.update_status_to_under_review(db_request, db_certificate, output)
-                else:
-                    self.update_status_to_rejected(db_request, db_certificate, output)
-                return
-            
-            # Now, since verification has been done, update the final status to all good
-            db_request.status = RequestStatus.completed
-            db_certificate.verified_total_marks = int(verified_total_marks)         # type: ignore
-            db_certificate.verified = True
-            db_certificate.remark = "Verification successful"
-            self.db.commit()
+        self.decide(db_request, db_certificate, uploaded_info, verification_info)
+        return True
+
+    def decide(
+        self,
+        db_request: Request,
+        db_certificate: Certificate,
+        uploaded_info: CertificateInfo,
+        verification_info: CertificateInfo,
+    ) -> None:
+        """Compare both certificates and record the outcome on the request."""
+        subject_name = db_request.student_subject_enrollment.teacher_subject_allotment.subject.name
+
+        success, output, verified_roll_no, verified_total_marks = self.verify_file(
+            uploaded_info=uploaded_info,
+            verification_info=verification_info,
+            subject_name=cast(str, subject_name),
+            student_name=cast(str, db_request.student_subject_enrollment.student.name),
+            course_period_year=COURSE_PERIOD_YEAR,
+        )
+
+        if not success:
+            # Check if it's a name mismatch issue   
+            if "Student name mismatch - under review" in output:
+                self.update_status_to_under_review(db_request, db_certificate, output)
+            else:
+                self.update_status_to_rejected(db_request, db_certificate, output)
+            return
+        
+        # Now, since verification has been done, update the final status to all good
+        db_request.status = RequestStatus.completed
+        db_certificate.verified_total_marks = int(verified_total_marks)         # type: ignore
+        db_certificate.verified = True
+        db_certificate.remark = "Verification successful"
+        self.db.commit()
     
     def verify_file(
         self, 
-        verification_file_path: str, 
+        uploaded_info: CertificateInfo,
+        verification_info: CertificateInfo,
         subject_name: str, 
         student_name: str,
         course_period_year: int,
-        is_subject_name_long: bool = False
     )-> Tuple[bool, str, Optional[str], Optional[str]]:
         (
             uploaded_course_name,
@@ -142,7 +301,7 @@ class Verifier:
             uploaded_total_marks,
             uploaded_roll_number,
             uploaded_course_period,
-        ) = extract_student_info_from_pdf(self.uploaded_file_path, is_subject_name_long)
+        ) = uploaded_info
 
         (
             valid_course_name, 
@@ -150,7 +309,7 @@ class Verifier:
             valid_total_marks, 
             valid_roll_number ,
             valid_course_period
-        ) = extract_student_info_from_pdf(verification_file_path, is_subject_name_long)
+        ) = verification_info
 
 
         if (
@@ -253,53 +412,84 @@ class Verifier:
             len(course_name.strip()) > COURSE_NAME_SINGLE_LINE_CHARACTER_LIMIT
         )
 
-        verification_link = extract_link(self.uploaded_file_path, 0)
+        verification_link, uploaded_info = await verification_executor.run(
+            scan_certificate, self.uploaded_file_path, is_subject_name_long
+        )
         if not verification_link:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Verification link / QR not found"
             )
 
-        with tempfile.NamedTemporaryFile(mode='w+', delete=True, suffix=".pdf", prefix="certificate_") as temp_f:
-            logger.info(f"Temporary file created at: {temp_f.name}")
-            success, pdf_url, output = await download_verification_pdf(verification_link, temp_f.name)
-
-            if not success:
-                remark =  "Could not download the verification pdf"
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=remark)
-
-            (
-                uploaded_course_name,
-                uploaded_student_name,
-                uploaded_total_marks,
-                uploaded_roll_number,
-                uploaded_course_period,
-            ) = extract_student_info_from_pdf(self.uploaded_file_path, is_subject_name_long)
-
-            (
-                valid_course_name, 
-                valid_student_name, 
-                valid_total_marks, 
-                valid_roll_number ,
-                valid_course_period
-            ) = extract_student_info_from_pdf(temp_f.name, is_subject_name_long)
-        
-        certificate_data = {
-            "uploaded_certificate": {
-                "student_name": uploaded_student_name,
-                "roll_no": uploaded_roll_number,
-                "marks": uploaded_total_marks,
-                "course_name": uploaded_course_name,
-                "course_period": uploaded_course_period,
-                "file_url": self.uploaded_file_path_relative,
-            },
-            "verification_certificate": {
-                "student_name": valid_student_name,
-                "roll_no": valid_roll_number,
-                "marks": valid_total_marks,
-                "course_name": valid_course_name,
-                "course_period": valid_course_period,
-                "file_url": pdf_url
-            },
-        }
-        return certificate_data
\ No newline at end of file
+        try:
+            success, pdf_url, verification_file_path, output = await get_verification_pdf(verification_link)
+        except OutboundUnavailableError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="NPTEL is temporarily unavailable, please try again later",
+                headers={"Retry-After": str(math.ceil(e.retry_after))},
+            )
+
+        if not success or not verification_file_path:
+            remark =  "Could not download the verification pdf"
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=remark)
+
+        verification_info, db_certificate = await asyncio.gather(
+            self.read_verification_info(verification_file_path, is_subject_name_long),
+            run_in_threadpool(self.get_certificate),
+        )
+        if db_certificate is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Certificate not found")
+
+        extraction = self.save_extraction(
+            db_certificate,
+            qr_url=verification_link,
+            verification_file_url=pdf_url,
+            is_subject_name_long=is_subject_name_long,
+            uploaded_info=uploaded_info,
+            verification_info=verification_info,
+        )
+
+        return build_certificate_data(extraction, self.uploaded_file_path_relative)
+
+    def save_extraction(
+        self,
+        db_certificate: Certificate,
+        qr_url: str,
+        verification_file_url: Optional[str],
+        is_subject_name_long: bool,
+        uploaded_info: CertificateInfo,
+        verification_info: CertificateInfo,
+    ) -> CertificateExtraction:
+        """Store (or overwrite) the parsed fields of both certificates so they never have to be re-parsed."""
+        extraction = self.db.query(CertificateExtraction).filter(
+            CertificateExtraction.certificate_id == db_certificate.id
+        ).first()
+        if extraction is None:
+            extraction = CertificateExtraction(certificate_id=db_certificate.id)
+            self.db.add(extraction)
+
+        extraction.extractor_version = EXTRACTOR_VERSION
+        extraction.is_subject_name_long = is_subject_name_long
+        extraction.qr_url = qr_url
+        extraction.verification_file_url = verification_file_url
+
+        (
+            extraction.uploaded_course_name,
+            extraction.uploaded_student_name,
+            extraction.uploaded_total_marks,
+            extraction.uploaded_roll_no,
+            extraction.uploaded_course_period,
+        ) = uploaded_info
+
+        (
+            extraction.verification_course_name,
+            extraction.verification_student_name,
+            extraction.verification_total_marks,
+            extraction.verification_roll_no,
+            extraction.verification_course_period,
+        ) = verification_info
+
+        self.db.commit()
+        self.db.refresh(extraction)
+        return extraction
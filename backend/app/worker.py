@@ -0,0 +1,241 @@
+"""
+Verification worker.
+
+Run with `python -m app.worker`. Any number of workers can run next to the API,
+on the same node or on others, they coordinate through the `verification_jobs`
+table only.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+from typing import Optional, Set, Tuple, cast
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.config import check_config, config
+from app.database.core import SessionLocal
+from app.database.models import Certificate, Request, RequestStatus, VerificationJob, VerificationJobStatus
+from app.services.executor import verification_executor
+from app.services.job_queue import (
+    VERIFICATION_JOB_HEARTBEAT_SECONDS,
+    claim_verification_job,
+    complete_verification_job,
+    defer_verification_job,
+    fail_verification_job,
+    renew_verification_job_lease,
+)
+from app.services.certificate_preview import get_certificate_preview
+from app.services.certificate_storage import StoredObject, certificate_storage
+from app.services.outbound import OutboundUnavailableError
+from app.services.log_service import setup_logger
+from app.services.utils.http_client import nptel_http_client
+from app.services.utils.storage_io import storage_io
+from app.services.verifier import Verifier
+
+logger = setup_logger(__name__)
+
+VERIFICATION_WORKER_CONCURRENCY = int(config.get('VERIFICATION_WORKER_CONCURRENCY') or 4)
+VERIFICATION_WORKER_POLL_SECONDS = float(config.get('VERIFICATION_WORKER_POLL_SECONDS') or 2)
+
+
+class VerificationWorker:
+    def __init__(
+        self,
+        session_factory: sessionmaker[Session],
+        concurrency: int,
+        poll_interval: float,
+        batch_id: Optional[str] = None,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        # when set, only jobs of this batch are claimed and the worker stops once the batch is drained
+        self.batch_id = batch_id
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = False
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        self.running = True
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Verification worker {self.worker_id} started with concurrency {self.concurrency}")
+
+        while self.running:
+            await slots.acquire()
+            if not self.running:
+                slots.release()
+                break
+
+            try:
+                job_id = await run_in_threadpool(self.claim_job)
+            except Exception as e:
+                logger.error(f"Error claiming verification job: {e}")
+                job_id = None
+
+            if job_id is None:
+                slots.release()
+                if self.batch_id is not None and not self.tasks and await run_in_threadpool(self.batch_drained):
+                    break
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            task = asyncio.create_task(self.process_job(job_id))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        if self.tasks:
+            logger.info(f"Waiting for {len(self.tasks)} running verification jobs to finish")
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        logger.info(f"Verification worker {self.worker_id} stopped")
+
+    def stop(self) -> None:
+        self.running = False
+
+    def claim_job(self) -> str | None:
+        with self.session_factory() as db:
+            job = claim_verification_job(db, self.worker_id, self.batch_id)
+            return cast(str, job.id) if job else None
+
+    def batch_drained(self) -> bool:
+        with self.session_factory() as db:
+            return not db.query(VerificationJob.id).filter(
+                VerificationJob.batch_id == self.batch_id,
+                VerificationJob.status.in_([VerificationJobStatus.queued, VerificationJobStatus.running]),
+            ).first()
+
+    def renew_lease(self, job_id: str) -> bool:
+        with self.session_factory() as db:
+            return renew_verification_job_lease(db, job_id, self.worker_id)
+
+    async def keep_lease(self, job_id: str) -> None:
+        """Extend the job's lease until cancelled, waiting on the rate limiter or a slow download can outlast it."""
+        while True:
+            await asyncio.sleep(VERIFICATION_JOB_HEARTBEAT_SECONDS)
+            try:
+                renewed = await run_in_threadpool(self.renew_lease, job_id)
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of verification job {job_id}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Verification job {job_id} is no longer leased by {self.worker_id}")
+                return
+
+    async def process_job(self, job_id: str) -> None:
+        heartbeat = asyncio.create_task(self.keep_lease(job_id))
+        try:
+            await self.run_job(job_id)
+        finally:
+            heartbeat.cancel()
+
+    @staticmethod
+    def load_job(db: Session, job_id: str) -> Tuple[VerificationJob, Optional[Request], Optional[Certificate]]:
+        job = db.query(VerificationJob).filter(VerificationJob.id == job_id).one()
+
+        db_request = db.query(Request).filter(Request.id == job.request_id).first()
+        db_certificate = db.query(Certificate).filter(Certificate.request_id == job.request_id).first()
+        if db_request:
+            # loaded here rather than lazily on the event loop by the verifier
+            db_request.student_subject_enrollment.teacher_subject_allotment.subject
+        return job, db_request, db_certificate
+
+    async def run_job(self, job_id: str) -> None:
+        with self.session_factory() as db:
+            job, db_request, db_certificate = await run_in_threadpool(self.load_job, db, job_id)
+
+            if not db_request or not db_certificate:
+                await run_in_threadpool(fail_verification_job, db, job, "Request or uploaded certificate not found")
+                return
+
+            stored = await certificate_storage.resolve(
+                cast(str, db_certificate.file_url), cast(Optional[str], db_certificate.file_hash)
+            )
+            if stored is None:
+                await run_in_threadpool(fail_verification_job, db, job, "Uploaded certificate file not found")
+                return
+
+            async with certificate_storage.local_copy(stored.key) as uploaded_file_path:
+                verifier = Verifier(
+                    uploaded_file_path_relative=cast(str, db_certificate.file_url),
+                    uploaded_file_path=uploaded_file_path,
+                    request_id=cast(str, db_request.id),
+                    student_id=cast(str, db_request.student_subject_enrollment.student_id),
+                    db=db,
+                )
+
+                logger.info(f"Running verification job {job.id} (attempt {job.attempts} of {job.max_attempts})")
+
+                try:
+                    await verifier.run_verification(db_request, db_certificate)
+                except HTTPException as e:
+                    # The verifier reports its decisions through HTTP exceptions. A rejection or
+                    # an under review decision is final, an error (e.g. NPTEL unreachable) is retried.
+                    await run_in_threadpool(db.refresh, db_request)
+                    if db_request.status == RequestStatus.error:
+                        await run_in_threadpool(fail_verification_job, db, job, str(e.detail))
+                        return
+                except OutboundUnavailableError as e:
+                    # NPTEL is rate limited or its circuit breaker is open, come back later
+                    await run_in_threadpool(db.rollback)
+                    await run_in_threadpool(
+                        defer_verification_job, db, job, e.retry_after, "NPTEL is temporarily unavailable"
+                    )
+                    return
+                except Exception as e:
+                    await run_in_threadpool(db.rollback)
+                    logger.error(f"Verification job {job_id} failed: {e}")
+                    await run_in_threadpool(fail_verification_job, db, job, "An internal server error occurred")
+                    return
+                else:
+                    # the decision was committed, reload the status off the event loop
+                    await run_in_threadpool(db.refresh, db_request)
+
+                if db_request.status == RequestStatus.under_review:
+                    # a teacher is going to look at it, render its preview while the file is at hand
+                    await self.render_preview(stored, uploaded_file_path)
+
+            await run_in_threadpool(complete_verification_job, db, job)
+
+    async def render_preview(self, stored: StoredObject, pdf_path: str) -> None:
+        try:
+            await get_certificate_preview(stored, pdf_path)
+        except Exception as e:
+            # rendered on request instead
+            logger.warning(f"Could not render the preview of {stored.key}: {e}")
+
+
+async def run_worker() -> None:
+    worker = VerificationWorker(
+        SessionLocal,
+        concurrency=VERIFICATION_WORKER_CONCURRENCY,
+        poll_interval=VERIFICATION_WORKER_POLL_SECONDS,
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    verification_executor.start()
+    storage_io.start()
+    nptel_http_client.start()
+    try:
+        await worker.run()
+    finally:
+        await nptel_http_client.aclose()
+        verification_executor.shutdown()
+        storage_io.shutdown()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    check_config()
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
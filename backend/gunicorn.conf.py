@@ -1,8 +1,14 @@
+import os
+
 bind = "0.0.0.0:8000"
-workers = 4
+# also read by the app to size its per-worker process pools
+workers = int(os.environ.get("WEB_CONCURRENCY") or 4)
 worker_class = "uvicorn.workers.UvicornWorker"
 accesslog = "./logs/access.log"
 errorlog = "./logs/error.log"
 loglevel = "info"
 max_requests = 1000
-max_requests_jitter = 100
\ No newline at end of file
+max_requests_jitter = 100
+# X-Forwarded-For / X-Forwarded-Proto are only trusted from these addresses (comma separated, CIDRs allowed),
+# set it to the reverse proxy's address or the client address of every request is the proxy's
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS") or "127.0.0.1,::1"
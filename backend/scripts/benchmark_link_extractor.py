@@ -0,0 +1,51 @@
+"""
+Compare the incremental certificate link parser with a BeautifulSoup parse.
+
+Run from the backend directory: `python scripts/benchmark_link_extractor.py [landing_page.html]`
+"""
+import os
+import sys
+import timeit
+from typing import Optional
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.utils.link_extractor import CERTIFICATE_LINK_TEXT, find_certificate_link  # noqa: E402
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            page = f.read()
+    else:
+        rows = "".join(
+            f"<tr><td class='cell'>Week {i}</td><td><a href='/assignments/{i}'>Assignment {i}</a></td></tr>"
+            for i in range(200)
+        )
+        page = (
+            "<html><head><title>NPTEL</title><script>var x = 1;</script></head><body>"
+            "<div class='header'><a href='/'>Home</a><a href='/courses'>Courses</a></div>"
+            "<div class='content'><p>Candidate details</p>"
+            "<a class='btn' href='/noc/Ecertificate/?q=EXAMPLE'>Course Certificate</a>"
+            f"<table>{rows}</table></div></body></html>"
+        )
+
+    def with_bs4() -> Optional[str]:
+        a_tag = BeautifulSoup(page, "html.parser").find("a", string=CERTIFICATE_LINK_TEXT)
+        return a_tag["href"] if a_tag else None  # type: ignore[index]
+
+    def with_parser() -> Optional[str]:
+        return find_certificate_link(page)
+
+    assert with_bs4() == with_parser(), (with_bs4(), with_parser())
+
+    iterations = 200
+    for name, fn in (("beautifulsoup", with_bs4), ("link_extractor", with_parser)):
+        seconds = timeit.timeit(fn, number=iterations)
+        print(f"{name:>15}: {seconds * 1000 / iterations:.3f} ms per page ({len(page)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from typing import Optional, Tuple
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.utils.byte_range import parse_range_header
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize(
+    ('header', 'expected'),
+    [
+        ('bytes=0-99', (0, 99)),
+        ('bytes=100-', (100, 999)),
+        ('bytes=-100', (900, 999)),
+        ('bytes= 10-20', (10, 20)),
+        # an end past the file is clamped to its last byte
+        ('bytes=900-5000', (900, 999)),
+        # a suffix longer than the file is the whole file
+        ('bytes=-5000', (0, 999)),
+        ('bytes=999-999', (999, 999)),
+    ],
+)
+def test_single_range(header: str, expected: Tuple[int, int]) -> None:
+    assert parse_range_header(header, SIZE) == expected
+
+
+@pytest.mark.parametrize(
+    'header',
+    [
+        None,
+        '',
+        'items=0-10',
+        'bytes=0-10,20-30',
+        'bytes=-',
+        'bytes=a-b',
+        'bytes=10-x',
+    ],
+)
+def test_whole_file(header: Optional[str]) -> None:
+    assert parse_range_header(header, SIZE) is None
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=2000-3000', 'bytes=50-10'])
+def test_unsatisfiable(header: str) -> None:
+    with pytest.raises(HTTPException) as e:
+        parse_range_header(header, SIZE)
+
+    assert e.value.status_code == 416
+    assert e.value.headers == {'Content-Range': f'bytes */{SIZE}'}
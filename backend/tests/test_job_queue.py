@@ -0,0 +1,198 @@
+from datetime import datetime, timedelta, timezone
+from typing import cast
+
+from sqlalchemy.orm import Session
+
+from app.database.models import Certificate, Request, RequestStatus, VerificationJob, VerificationJobStatus
+from app.services.job_queue import (
+    VERIFICATION_JOB_MAX_ATTEMPTS,
+    VERIFICATION_JOB_RETRY_DELAY_SECONDS,
+    claim_verification_job,
+    complete_verification_job,
+    defer_verification_job,
+    enqueue_verification_job,
+    fail_verification_job,
+    release_verification_job,
+    renew_verification_job_lease,
+)
+
+
+def utcnow() -> datetime:
+    # SQLite hands timestamps back without their time zone
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enqueue(db: Session, request: Request, priority: int = 0, delay_seconds: float = 0) -> VerificationJob:
+    job = enqueue_verification_job(db, cast(str, request.id), priority=priority, delay_seconds=delay_seconds)
+    db.commit()
+    return job
+
+
+def make_runnable(db: Session, job: VerificationJob) -> None:
+    """Skip the retry backoff."""
+    job.run_after = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+
+def expire_lease(db: Session, job: VerificationJob) -> None:
+    job.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+
+def request_state(db: Session, request: Request) -> tuple[RequestStatus, str | None]:
+    db.expire_all()
+    certificate = db.query(Certificate).filter(Certificate.request_id == request.id).one()
+    return cast(RequestStatus, request.status), cast(str | None, certificate.remark)
+
+
+def test_claim_leases_the_job(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+
+    claimed = claim_verification_job(db, 'worker-1')
+
+    assert claimed is not None and claimed.id == job.id
+    assert claimed.status == VerificationJobStatus.running
+    assert claimed.attempts == 1
+    assert claimed.locked_by == 'worker-1'
+    assert claimed.lease_expires_at is not None and claimed.lease_expires_at > utcnow()
+
+
+def test_claim_with_nothing_runnable(db: Session, certificate_request: Request) -> None:
+    assert claim_verification_job(db, 'worker-1') is None
+
+    job = enqueue(db, certificate_request, delay_seconds=60)
+    assert claim_verification_job(db, 'worker-1') is None
+
+    release_verification_job(db, job)
+    claimed = claim_verification_job(db, 'worker-1')
+    assert claimed is not None and claimed.id == job.id
+
+
+def test_claim_by_priority(db: Session, certificate_request: Request) -> None:
+    low = enqueue(db, certificate_request, priority=-10)
+    high = enqueue(db, certificate_request)
+
+    first = claim_verification_job(db, 'worker-1')
+    second = claim_verification_job(db, 'worker-1')
+
+    assert first is not None and first.id == high.id
+    assert second is not None and second.id == low.id
+
+
+def test_leased_job_is_not_claimed_twice(db: Session, certificate_request: Request) -> None:
+    enqueue(db, certificate_request)
+    assert claim_verification_job(db, 'worker-1') is not None
+
+    assert claim_verification_job(db, 'worker-2') is None
+
+
+def test_expired_lease_is_reclaimed(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+    claim_verification_job(db, 'worker-1')
+    expire_lease(db, job)
+
+    reclaimed = claim_verification_job(db, 'worker-2')
+
+    assert reclaimed is not None and reclaimed.id == job.id
+    assert reclaimed.locked_by == 'worker-2'
+    assert reclaimed.attempts == 2
+
+
+def test_lease_renewed_only_by_its_worker(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+    claim_verification_job(db, 'worker-1')
+    expire_lease(db, job)
+
+    assert not renew_verification_job_lease(db, cast(str, job.id), 'worker-2')
+    assert renew_verification_job_lease(db, cast(str, job.id), 'worker-1')
+
+    db.refresh(job)
+    assert job.lease_expires_at is not None and job.lease_expires_at > utcnow()
+    assert claim_verification_job(db, 'worker-2') is None
+
+
+def test_complete(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+    claim_verification_job(db, 'worker-1')
+
+    complete_verification_job(db, job)
+
+    assert job.status == VerificationJobStatus.succeeded
+    assert job.locked_by is None and job.lease_expires_at is None
+    assert not renew_verification_job_lease(db, cast(str, job.id), 'worker-1')
+    assert claim_verification_job(db, 'worker-1') is None
+
+
+def test_failure_is_retried_with_backoff(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+
+    for attempt in range(1, VERIFICATION_JOB_MAX_ATTEMPTS):
+        claimed = claim_verification_job(db, 'worker-1')
+        assert claimed is not None and claimed.attempts == attempt
+
+        before = utcnow()
+        fail_verification_job(db, job, 'NPTEL returned 500')
+
+        db.refresh(job)
+        assert job.status == VerificationJobStatus.queued
+        assert job.locked_by is None and job.lease_expires_at is None
+        delay = VERIFICATION_JOB_RETRY_DELAY_SECONDS * 2 ** (attempt - 1)
+        run_after = cast(datetime, job.run_after)
+        assert before + timedelta(seconds=delay) <= run_after <= utcnow() + timedelta(seconds=delay)
+
+        status, remark = request_state(db, certificate_request)
+        assert status == RequestStatus.processing
+        assert remark == f'NPTEL returned 500. Retrying verification (attempt {attempt} of {VERIFICATION_JOB_MAX_ATTEMPTS})'
+
+        # not before its backoff has passed
+        assert claim_verification_job(db, 'worker-1') is None
+        make_runnable(db, job)
+
+
+def test_last_failure_is_dead(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+    for _ in range(VERIFICATION_JOB_MAX_ATTEMPTS - 1):
+        claim_verification_job(db, 'worker-1')
+        fail_verification_job(db, job, 'NPTEL returned 500')
+        make_runnable(db, job)
+
+    claimed = claim_verification_job(db, 'worker-1')
+    assert claimed is not None and claimed.attempts == VERIFICATION_JOB_MAX_ATTEMPTS
+    fail_verification_job(db, job, 'NPTEL returned 500')
+
+    assert job.status == VerificationJobStatus.dead
+    assert job.last_error == 'NPTEL returned 500'
+    assert request_state(db, certificate_request) == (RequestStatus.error, 'NPTEL returned 500')
+    assert claim_verification_job(db, 'worker-1') is None
+
+
+def test_lost_lease_on_the_last_attempt_is_dead(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+    for _ in range(VERIFICATION_JOB_MAX_ATTEMPTS):
+        claim_verification_job(db, 'worker-1')
+        expire_lease(db, job)
+
+    # the worker died on every attempt, the job is dead-lettered instead of claimed again
+    assert claim_verification_job(db, 'worker-2') is None
+
+    db.refresh(job)
+    assert job.status == VerificationJobStatus.dead
+    assert request_state(db, certificate_request) == (
+        RequestStatus.error, 'Verification worker did not finish the job'
+    )
+
+
+def test_defer_does_not_count_the_attempt(db: Session, certificate_request: Request) -> None:
+    job = enqueue(db, certificate_request)
+    claim_verification_job(db, 'worker-1')
+
+    defer_verification_job(db, job, 60, 'NPTEL is not responding')
+
+    db.refresh(job)
+    assert job.status == VerificationJobStatus.queued
+    assert job.attempts == 0
+    assert cast(datetime, job.run_after) > utcnow() + timedelta(seconds=50)
+    assert request_state(db, certificate_request) == (
+        RequestStatus.processing, 'NPTEL is not responding. Verification will resume shortly'
+    )
+    assert claim_verification_job(db, 'worker-1') is None
@@ -0,0 +1,274 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, cast
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.services import outbound
+from app.services.outbound import CircuitBreaker, OutboundUnavailableError, SharedRateLimiter
+from app.services.utils import throttle
+from app.services.utils.throttle import TokenBucket
+
+
+class FakeClock:
+    """Stands in for time.monotonic and asyncio.sleep, sleeping just moves the clock."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(throttle.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(asyncio, 'sleep', clock.sleep)
+    return clock
+
+
+class FakeResult:
+    def __init__(self, value: Any):
+        self.value = value
+
+    def scalar_one(self) -> Any:
+        return self.value
+
+    def first(self) -> Any:
+        return self.value
+
+    def one(self) -> Any:
+        return self.value
+
+
+class FakeDatabase:
+    """
+    Answers the shared limiter's and breaker's statements with canned results.
+
+    The statements are Postgres specific, so the tests script what the database
+    returns and check what the limiter and the breaker make of it.
+    """
+
+    def __init__(self) -> None:
+        self.results: Dict[Any, List[Any]] = {}
+        self.executed: List[Any] = []
+        self.error: Optional[Exception] = None
+
+    def returns(self, statement: Any, *values: Any) -> None:
+        self.results.setdefault(statement, []).extend(values)
+
+    def session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return cast(async_sessionmaker[AsyncSession], lambda: FakeSession(self))
+
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+
+    async def __aenter__(self) -> 'FakeSession':
+        if self.database.error is not None:
+            raise self.database.error
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        return None
+
+    async def execute(self, statement: Any, parameters: Dict[str, Any]) -> FakeResult:
+        self.database.executed.append(statement)
+        values = self.database.results.get(statement)
+        return FakeResult(values.pop(0) if values else None)
+
+    async def commit(self) -> None:
+        return None
+
+
+def run(coroutine: Any) -> Any:
+    return asyncio.run(coroutine)
+
+
+# TokenBucket, also the fallback of the shared limiter
+
+
+def test_token_bucket_burst_then_rate(clock: FakeClock) -> None:
+    bucket = TokenBucket(rate=2, burst=3)
+
+    async def take(n: int) -> List[float]:
+        return [await bucket.acquire() for _ in range(n)]
+
+    assert run(take(3)) == [0.0, 0.0, 0.0]
+    assert run(take(2)) == [0.5, 0.5]
+
+    # refills up to the burst, not beyond
+    clock.now += 60
+    assert run(take(4)) == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_token_bucket_without_rate_never_waits(clock: FakeClock) -> None:
+    bucket = TokenBucket(rate=0, burst=1)
+
+    async def take() -> List[float]:
+        return [await bucket.acquire() for _ in range(10)]
+
+    assert run(take()) == [0.0] * 10
+    assert clock.sleeps == []
+
+
+# SharedRateLimiter
+
+
+def make_limiter(database: FakeDatabase, fallback: Optional[TokenBucket] = None) -> SharedRateLimiter:
+    return SharedRateLimiter(
+        'nptel',
+        database.session_factory(),
+        rate=2,
+        burst=5,
+        fallback=fallback or TokenBucket(rate=2, burst=5),
+        max_wait_seconds=10,
+        db_timeout_seconds=1,
+    )
+
+
+def test_shared_limiter_token_available(clock: FakeClock) -> None:
+    database = FakeDatabase()
+    database.returns(outbound._TAKE_TOKEN, 4.0)
+
+    assert run(make_limiter(database).acquire()) == 0.0
+    assert clock.sleeps == []
+
+
+def test_shared_limiter_waits_for_its_reservation(clock: FakeClock) -> None:
+    database = FakeDatabase()
+    # three callers ahead of this one
+    database.returns(outbound._TAKE_TOKEN, -3.0)
+
+    assert run(make_limiter(database).acquire()) == 1.5
+    assert clock.sleeps == [1.5]
+
+
+def test_shared_limiter_rejects_a_long_wait_and_returns_the_token(clock: FakeClock) -> None:
+    database = FakeDatabase()
+    database.returns(outbound._TAKE_TOKEN, -30.0)
+
+    with pytest.raises(OutboundUnavailableError) as e:
+        run(make_limiter(database).acquire())
+
+    assert e.value.retry_after == 15
+    assert database.executed == [outbound._TAKE_TOKEN, outbound._RETURN_TOKEN]
+    assert clock.sleeps == []
+
+
+def test_shared_limiter_falls_back_to_the_local_bucket(clock: FakeClock) -> None:
+    database = FakeDatabase()
+    database.error = ConnectionError('database is down')
+    fallback = TokenBucket(rate=2, burst=1)
+    limiter = make_limiter(database, fallback)
+
+    async def take() -> List[float]:
+        return [await limiter.acquire(), await limiter.acquire()]
+
+    assert run(take()) == [0.0, 0.5]
+
+
+# CircuitBreaker
+
+
+def make_breaker(database: FakeDatabase) -> CircuitBreaker:
+    return CircuitBreaker('nptel', database.session_factory(), failure_threshold=3, open_seconds=30, db_timeout_seconds=1)
+
+
+def test_shared_breaker_closed() -> None:
+    database = FakeDatabase()
+    database.returns(outbound._READ_BREAKER, None, SimpleNamespace(failures=2, open_until=None))
+    breaker = make_breaker(database)
+
+    run(breaker.before_call())
+    run(breaker.before_call())
+    assert outbound._CLAIM_PROBE not in database.executed
+
+
+def test_shared_breaker_open() -> None:
+    database = FakeDatabase()
+    open_until = datetime.now(timezone.utc) + timedelta(seconds=20)
+    database.returns(outbound._READ_BREAKER, SimpleNamespace(failures=3, open_until=open_until))
+
+    with pytest.raises(OutboundUnavailableError) as e:
+        run(make_breaker(database).before_call())
+
+    assert 19 <= e.value.retry_after <= 20
+
+
+def test_shared_breaker_half_open_lets_a_single_probe_through() -> None:
+    database = FakeDatabase()
+    open_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    database.returns(outbound._READ_BREAKER, *[SimpleNamespace(failures=3, open_until=open_until)] * 2)
+    # the first caller claims the probe, the second finds it taken
+    database.returns(outbound._CLAIM_PROBE, SimpleNamespace(open_until=open_until), None)
+    breaker = make_breaker(database)
+
+    run(breaker.before_call())
+    with pytest.raises(OutboundUnavailableError) as e:
+        run(breaker.before_call())
+
+    assert e.value.retry_after == 30
+
+
+def test_local_breaker_opens_after_the_threshold() -> None:
+    database = FakeDatabase()
+    database.error = ConnectionError('database is down')
+    breaker = make_breaker(database)
+
+    for _ in range(2):
+        run(breaker.record_failure())
+        run(breaker.before_call())
+
+    run(breaker.record_failure())
+    with pytest.raises(OutboundUnavailableError) as e:
+        run(breaker.before_call())
+
+    assert 29 <= e.value.retry_after <= 30
+
+
+def test_local_breaker_success_resets_the_count() -> None:
+    database = FakeDatabase()
+    database.error = ConnectionError('database is down')
+    breaker = make_breaker(database)
+
+    run(breaker.record_failure())
+    run(breaker.record_failure())
+    run(breaker.record_success())
+    run(breaker.record_failure())
+
+    run(breaker.before_call())
+
+
+def test_local_breaker_half_open() -> None:
+    database = FakeDatabase()
+    database.error = ConnectionError('database is down')
+    breaker = make_breaker(database)
+    for _ in range(3):
+        run(breaker.record_failure())
+
+    # once open_seconds have passed a single probe goes through
+    breaker.local_open_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    run(breaker.before_call())
+    with pytest.raises(OutboundUnavailableError):
+        run(breaker.before_call())
+
+    # a failed probe keeps it open, a successful one closes it
+    run(breaker.record_failure())
+    with pytest.raises(OutboundUnavailableError):
+        run(breaker.before_call())
+
+    breaker.local_open_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    run(breaker.before_call())
+    run(breaker.record_success())
+    run(breaker.before_call())
+    run(breaker.before_call())
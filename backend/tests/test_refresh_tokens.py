@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+from typing import cast
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.database.models import RefreshToken, User
+from app.services.refresh_tokens import (
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS,
+    hash_refresh_token,
+    revoke_refresh_token,
+    rotate_refresh_token,
+    start_session,
+    successor_token,
+)
+
+
+def stored(db: Session, token: str) -> RefreshToken:
+    db.expire_all()
+    return db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(token)).one()
+
+
+def assert_invalid(db: Session, token: str | None) -> None:
+    with pytest.raises(HTTPException) as e:
+        rotate_refresh_token(db, token)
+    assert e.value.status_code == 401
+
+
+def used_ago(db: Session, token: str, seconds: float) -> None:
+    stored(db, token).used_at = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    db.commit()
+
+
+def test_rotation(db: Session, student: User) -> None:
+    token = start_session(db, cast(str, student.id))
+
+    user, new_token = rotate_refresh_token(db, token)
+
+    assert user.id == student.id
+    assert new_token == successor_token(token) != token
+    assert stored(db, token).used_at is not None
+    assert stored(db, new_token).family_id == stored(db, token).family_id
+
+    _, newer_token = rotate_refresh_token(db, new_token)
+    assert newer_token == successor_token(new_token)
+
+
+@pytest.mark.parametrize('token', [None, '', 'not-a-refresh-token'])
+def test_unknown_token(db: Session, token: str | None) -> None:
+    assert_invalid(db, token)
+
+
+def test_expired_token(db: Session, student: User) -> None:
+    token = start_session(db, cast(str, student.id))
+    stored(db, token).expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+    assert_invalid(db, token)
+
+
+def test_concurrent_refresh_gets_the_same_successor(db: Session, student: User) -> None:
+    token = start_session(db, cast(str, student.id))
+
+    _, first = rotate_refresh_token(db, token)
+    _, second = rotate_refresh_token(db, token)
+
+    assert first == second
+    assert stored(db, first).revoked_at is None
+
+
+def test_reuse_after_the_grace_window_revokes_the_session(db: Session, student: User) -> None:
+    token = start_session(db, cast(str, student.id))
+    other_session = start_session(db, cast(str, student.id))
+    _, new_token = rotate_refresh_token(db, token)
+    used_ago(db, token, REFRESH_TOKEN_REUSE_GRACE_SECONDS + 1)
+
+    assert_invalid(db, token)
+
+    # the successor the thief or the user holds is gone too, other logins are not
+    assert stored(db, new_token).revoked_at is not None
+    assert_invalid(db, new_token)
+    assert stored(db, other_session).revoked_at is None
+    rotate_refresh_token(db, other_session)
+
+
+def test_reuse_once_the_successor_was_rotated_revokes_the_session(db: Session, student: User) -> None:
+    token = start_session(db, cast(str, student.id))
+    _, new_token = rotate_refresh_token(db, token)
+    _, newer_token = rotate_refresh_token(db, new_token)
+
+    # within the grace window, but the successor is no longer the session's current token
+    assert_invalid(db, token)
+
+    assert_invalid(db, newer_token)
+
+
+def test_revoke(db: Session, student: User) -> None:
+    token = start_session(db, cast(str, student.id))
+    _, new_token = rotate_refresh_token(db, token)
+
+    revoke_refresh_token(db, token)
+
+    assert_invalid(db, new_token)
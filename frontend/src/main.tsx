@@ -26,6 +26,9 @@ import ReportSection from "./components/faculty/ReportSection";
 import MannualVerification from "./components/faculty/MannualVerification";
 import BulkDueDateUpdate from "./components/faculty/BulkDueDateUpdate";
 import BulkSendRequest from "./components/faculty/BulkSendRequest";
+import { installAuthInterceptor } from "./store/authInterceptor";
+
+installAuthInterceptor();
 
 const queryClient = new QueryClient();
 
@@ -0,0 +1,35 @@
+import axios, { AxiosError, InternalAxiosRequestConfig } from 'axios';
+import { useAuthStore } from './useAuthStore';
+
+// these answer 401 for a wrong password or a dead session, refreshing can't help
+const AUTH_ENDPOINTS = ['/user/login', '/user/refresh', '/user/logout'];
+
+interface RetriableRequestConfig extends InternalAxiosRequestConfig {
+  _retriedAfterRefresh?: boolean;
+}
+
+// On a 401 the access token has most likely expired: refresh the session once and
+// replay the request, the user only has to log in again when the refresh fails too.
+export const installAuthInterceptor = () => {
+  axios.interceptors.response.use(
+    (response) => response,
+    async (error: AxiosError) => {
+      const config = error.config as RetriableRequestConfig | undefined;
+      if (
+        error.response?.status !== 401 ||
+        !config ||
+        config._retriedAfterRefresh ||
+        AUTH_ENDPOINTS.some((endpoint) => config.url?.includes(endpoint))
+      ) {
+        return Promise.reject(error);
+      }
+
+      config._retriedAfterRefresh = true;
+      const refreshed = await useAuthStore.getState().refreshSession();
+      if (!refreshed) {
+        return Promise.reject(error);
+      }
+      return axios(config);
+    }
+  );
+};
@@ -27,6 +27,7 @@ interface AuthState {
   tenure : Tenure | null;
   login: (credentials: Credentials) => Promise<void>;
   checkSession: () => Promise<void>; 
+  refreshSession: () => Promise<boolean>;
   logout: () => void;
   updateTenure: (newTenure: Tenure) => void;
 }
@@ -42,9 +43,12 @@ const getCurrentTenure = (): Tenure => {
   return { year, is_odd };
 };
 
+// one refresh at a time, requests that fail together all wait for it (the refresh token is single use)
+let refreshInFlight: Promise<boolean> | null = null;
+
 export const useAuthStore = create<AuthState>()(
   persist(
-    (set) => ({
+    (set, get) => ({
       user: null,
       loading: false,
       error: null,
@@ -102,16 +106,46 @@ export const useAuthStore = create<AuthState>()(
         }
       },
 
+      refreshSession: () => {
+        if (!refreshInFlight) {
+          refreshInFlight = (async () => {
+            try {
+              const response = await fetch(`${apiUrl}/user/refresh`, {
+                method: "POST",
+                credentials: "include",
+              });
+              if (!response.ok) {
+                throw new Error("Session expired");
+              }
+              const data = await response.json();
+              set({ user: { user_id: data.user_id, name: data.name, role: data.role, service_role_dict: data.service_role_dict || {}, } });
+              return true;
+            } catch {
+              set({ user: null, tenure: null });
+              return false;
+            } finally {
+              refreshInFlight = null;
+            }
+          })();
+        }
+        return refreshInFlight;
+      },
+
       checkSession: async () => {
         set({ loading: true, error: null });
         try {
-          const response = await fetch(`${apiUrl}/user/me`, {
+          const fetchMe = () => fetch(`${apiUrl}/user/me`, {
             method: "GET",
             credentials: "include",
             headers: {
               "Content-Type": "application/json",
             },
           });
+          let response = await fetchMe();
+          // the access token expired, trade the refresh token for a new one instead of logging in again
+          if (response.status === 401 && await get().refreshSession()) {
+            response = await fetchMe();
+          }
           if (!response.ok) {
             throw new Error("Session invalid");
           }